@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import chat, sessions, analytics, files, messages
+from app.api.v1 import chat, sessions, analytics, files, messages, search
 
 api_router = APIRouter()
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
@@ -7,3 +7,4 @@ api_router.include_router(sessions.router, prefix="/sessions", tags=["sessions"]
 api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 api_router.include_router(files.router, prefix="/files", tags=["files"])
 api_router.include_router(messages.router, prefix="/messages", tags=["messages"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
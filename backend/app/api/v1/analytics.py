@@ -1,72 +1,160 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select, text
+from sqlalchemy import text
 from app.core.database import get_db
-from app.models.session import Session
-from app.models.message import Message
-from app.schemas.analytics import AnalyticsOverview, ToolAnalytics, ToolUsage, DecisionAnalytics, DecisionUsage
+from app.schemas.analytics import (
+    AnalyticsOverview, ToolAnalytics, ToolUsage, DecisionAnalytics, DecisionUsage, ModelAnalytics, ModelUsage,
+    LatencySummary, LatencyAnalytics, LatencyPoint, LatencySeries
+)
+from app.services.sketches import METRICS, LogHistogram
 
 router = APIRouter()
 
+# Totals = rollups (rows created before the watermark) + a live aggregate over
+# the rows after it. Each query is one statement, so both halves see the same snapshot.
+WATERMARK_CTE = """
+    wm AS (
+        SELECT COALESCE(
+            (SELECT watermark FROM rollup_state WHERE name = 'analytics'),
+            '-infinity'::timestamptz
+        ) AS ts
+    )
+"""
+
+TOOL_COUNTS_QUERY = f"""
+    WITH {WATERMARK_CTE}
+    SELECT 
+        tool_name,
+        SUM(calls)::bigint AS count,
+        SUM(errors)::bigint,
+        SUM(duration_sum) / NULLIF(SUM(duration_count), 0),
+        SUM(request_bytes)::bigint,
+        SUM(response_bytes)::bigint,
+        SUM(cache_hits)::bigint,
+        SUM(retries)::bigint
+    FROM (
+        SELECT tool_name, calls, errors, duration_sum, duration_count,
+               request_bytes, response_bytes, cache_hits, retries
+        FROM tool_rollup_hourly
+        UNION ALL
+        SELECT 
+            tool_name,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE status <> 'success'),
+            COALESCE(SUM(duration), 0),
+            COUNT(duration),
+            COALESCE(SUM(request_bytes), 0),
+            COALESCE(SUM(response_bytes), 0),
+            COUNT(*) FILTER (WHERE cache_hit),
+            COALESCE(SUM(retry_count), 0)
+        FROM wm, tool_invocations
+        WHERE tool_invocations.created_at >= wm.ts
+        GROUP BY tool_name
+    ) counts
+    GROUP BY tool_name
+    HAVING SUM(calls) > 0
+"""
+
 @router.get("/usage", response_model=AnalyticsOverview)
 async def get_usage_analytics(db: AsyncSession = Depends(get_db)):
-    # Total Sessions
-    result = await db.execute(select(func.count(Session.id)))
-    total_sessions = result.scalar() or 0
-    
-    # Total Messages
-    result = await db.execute(select(func.count(Message.id)))
-    total_messages = result.scalar() or 0
-    
-    # Total Tokens
-    result = await db.execute(select(func.sum(Message.token_count)))
-    total_tokens = result.scalar() or 0
-    
-    # Avg Execution Time
-    result = await db.execute(select(func.avg(Message.execution_time)).where(Message.execution_time != None))
-    avg_exec = result.scalar() or 0.0
+    query = text(f"""
+        WITH {WATERMARK_CTE},
+        rolled AS (
+            SELECT 
+                COALESCE(SUM(sessions), 0) AS sessions,
+                COALESCE(SUM(messages), 0) AS messages,
+                COALESCE(SUM(tokens), 0) AS tokens,
+                COALESCE(SUM(execution_time_sum), 0) AS execution_time_sum,
+                COALESCE(SUM(execution_time_count), 0) AS execution_time_count
+            FROM usage_rollup_hourly
+        ),
+        live_sessions AS (
+            SELECT COUNT(*) AS sessions FROM wm, sessions WHERE sessions.created_at >= wm.ts
+        ),
+        live_messages AS (
+            SELECT 
+                COUNT(*) AS messages,
+                COALESCE(SUM(token_count), 0) AS tokens,
+                COALESCE(SUM(execution_time), 0) AS execution_time_sum,
+                COUNT(execution_time) AS execution_time_count
+            FROM wm, messages WHERE messages.created_at >= wm.ts
+        )
+        SELECT 
+            r.sessions + ls.sessions,
+            r.messages + lm.messages,
+            r.tokens + lm.tokens,
+            (r.execution_time_sum + lm.execution_time_sum) / NULLIF(r.execution_time_count + lm.execution_time_count, 0)
+        FROM rolled r, live_sessions ls, live_messages lm
+    """)
+    result = await db.execute(query)
+    total_sessions, total_messages, total_tokens, avg_exec = result.one()
     
     return AnalyticsOverview(
-        total_sessions=total_sessions,
-        total_messages=total_messages,
-        total_tokens=total_tokens,
-        avg_execution_time=round(float(avg_exec), 2)
+        total_sessions=total_sessions or 0,
+        total_messages=total_messages or 0,
+        total_tokens=total_tokens or 0,
+        avg_execution_time=round(float(avg_exec or 0.0), 2)
     )
 
-@router.get("/tools", response_model=ToolAnalytics)
-async def get_tool_analytics(db: AsyncSession = Depends(get_db)):
-    query = text("""
+@router.get("/models", response_model=ModelAnalytics)
+async def get_model_analytics(db: AsyncSession = Depends(get_db)):
+    query = text(f"""
+        WITH {WATERMARK_CTE}
         SELECT 
-            COALESCE(elem->'function'->>'name', 'Unknown') as tool_name, 
-            COUNT(*) as count
-        FROM messages, 
-             jsonb_array_elements(CAST(tool_calls AS jsonb)) as elem
-        WHERE tool_calls IS NOT NULL 
-          AND jsonb_typeof(CAST(tool_calls AS jsonb)) = 'array'
-        GROUP BY 1
+            model,
+            SUM(messages)::bigint,
+            SUM(tokens)::bigint,
+            SUM(execution_time_sum) / NULLIF(SUM(execution_time_count), 0)
+        FROM (
+            SELECT model, messages, tokens, execution_time_sum, execution_time_count
+            FROM usage_rollup_hourly WHERE model <> ''
+            UNION ALL
+            SELECT 
+                model, COUNT(*), COALESCE(SUM(token_count), 0),
+                COALESCE(SUM(execution_time), 0), COUNT(execution_time)
+            FROM wm, messages
+            WHERE messages.created_at >= wm.ts AND model IS NOT NULL
+            GROUP BY model
+        ) usage
+        GROUP BY model
+        HAVING SUM(messages) > 0
         ORDER BY 2 DESC
     """)
+    result = await db.execute(query)
+    usage = [
+        ModelUsage(model=row[0], messages=row[1], tokens=row[2], avg_execution_time=round(float(row[3] or 0.0), 2))
+        for row in result.fetchall()
+    ]
+    return ModelAnalytics(usage=usage)
+
+@router.get("/tools", response_model=ToolAnalytics)
+async def get_tool_analytics(db: AsyncSession = Depends(get_db)):
+    query = text(TOOL_COUNTS_QUERY + " ORDER BY 2 DESC")
     
     result = await db.execute(query)
     rows = result.fetchall()
     
-    usage = [ToolUsage(tool_name=row[0], count=row[1]) for row in rows]
+    usage = [
+        ToolUsage(
+            tool_name=row[0],
+            count=row[1],
+            errors=row[2],
+            avg_duration=round(float(row[3]), 3) if row[3] is not None else None,
+            request_bytes=row[4],
+            response_bytes=row[5],
+            cache_hits=row[6],
+            retries=row[7]
+        )
+        for row in rows
+    ]
     return ToolAnalytics(usage=usage)
 
 @router.get("/decisions", response_model=DecisionAnalytics)
 async def get_decision_analytics(db: AsyncSession = Depends(get_db)):
     # Aggregate tool usage first
-    query = text("""
-        SELECT 
-            COALESCE(elem->'function'->>'name', 'Unknown') as tool_name, 
-            COUNT(*) as count
-        FROM messages, 
-             jsonb_array_elements(CAST(tool_calls AS jsonb)) as elem
-        WHERE tool_calls IS NOT NULL 
-          AND jsonb_typeof(CAST(tool_calls AS jsonb)) = 'array'
-        GROUP BY 1
-    """)
-    result = await db.execute(query)
+    result = await db.execute(text(TOOL_COUNTS_QUERY))
     rows = result.fetchall()
     
     # Classification Logic
@@ -86,3 +174,120 @@ async def get_decision_analytics(db: AsyncSession = Depends(get_db)):
             
     usage = [DecisionUsage(category=k, count=v) for k, v in categories.items() if v > 0]
     return DecisionAnalytics(usage=usage)
+
+# Sketch groupings: everything, per model/tool, or per time bucket
+LATENCY_GROUPS = {
+    "all": "''",
+    "dimension": "dimension",
+    "hour": "bucket",
+    "day": "date_trunc('day', bucket, 'UTC')",
+}
+
+async def merge_latency_sketches(
+    db: AsyncSession, metric: str, start: datetime, end: datetime, dimension: Optional[str], group: str
+) -> Dict[object, LogHistogram]:
+    """
+    Merges the hourly sketches of `metric` in [start, end) per group. Bins
+    are summed in Postgres, so only one row per (group, bin) comes back.
+    """
+    key = LATENCY_GROUPS[group]
+    where = "metric = :metric AND bucket >= date_trunc('hour', CAST(:start AS timestamptz), 'UTC') AND bucket < :end"
+    if dimension is not None:
+        where += " AND dimension = :dimension"
+    params = {"metric": metric, "start": start, "end": end, "dimension": dimension}
+
+    totals = await db.execute(text(f"""
+        SELECT {key} AS grp, SUM(count)::bigint, SUM(zero_count)::bigint, SUM(sum), MIN(min), MAX(max)
+        FROM latency_sketches WHERE {where}
+        GROUP BY 1
+    """), params)
+    bins = await db.execute(text(f"""
+        SELECT {key} AS grp, CAST(entry.key AS int), SUM(CAST(entry.value AS bigint))::bigint
+        FROM latency_sketches, jsonb_each_text(bins) AS entry
+        WHERE {where}
+        GROUP BY 1, 2
+    """), params)
+
+    bins_by_group = {}
+    for grp, index, n in bins.fetchall():
+        bins_by_group.setdefault(grp, []).append((index, n))
+    return {
+        grp: LogHistogram.from_bins(bins_by_group.get(grp, []), zero_count, count, total, minimum, maximum)
+        for grp, count, zero_count, total, minimum, maximum in totals.fetchall()
+    }
+
+def summarize_sketch(sketch: LogHistogram, **fields) -> dict:
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+    return dict(
+        count=sketch.count,
+        mean=rounded(sketch.mean),
+        min=rounded(sketch.min),
+        max=rounded(sketch.max),
+        p50=rounded(sketch.quantile(0.5)),
+        p90=rounded(sketch.quantile(0.9)),
+        p95=rounded(sketch.quantile(0.95)),
+        p99=rounded(sketch.quantile(0.99)),
+        **fields
+    )
+
+def latency_range(metric: str, start: Optional[datetime], end: Optional[datetime]):
+    if metric not in METRICS:
+        raise HTTPException(status_code=404, detail=f"Unknown metric. Available: {', '.join(METRICS)}")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+@router.get("/latency/{metric}", response_model=LatencyAnalytics)
+async def get_latency_analytics(
+    metric: str,
+    start: Optional[datetime] = Query(None, description="Defaults to 7 days before end; hour resolution"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    dimension: Optional[str] = Query(None, description="Only this model (or tool name for tool_latency)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    p50/p90/p95/p99 of a latency metric over any time range, overall and per
+    model (or tool), from the hourly sketches. Values are within 1% of the
+    exact percentiles.
+    """
+    start, end = latency_range(metric, start, end)
+    per_dimension = await merge_latency_sketches(db, metric, start, end, dimension, "dimension")
+
+    overall = LogHistogram()
+    for sketch in per_dimension.values():
+        overall.merge(sketch)
+
+    by_dimension = [
+        LatencySummary(**summarize_sketch(sketch, dimension=name or None))
+        for name, sketch in sorted(per_dimension.items(), key=lambda item: -item[1].count)
+    ]
+    return LatencyAnalytics(
+        metric=metric,
+        start=start,
+        end=end,
+        overall=LatencySummary(**summarize_sketch(overall, dimension=dimension)),
+        by_dimension=by_dimension
+    )
+
+@router.get("/latency/{metric}/series", response_model=LatencySeries)
+async def get_latency_series(
+    metric: str,
+    interval: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = Query(None, description="Defaults to 7 days before end; hour resolution"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    dimension: Optional[str] = Query(None, description="Only this model (or tool name for tool_latency)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Percentiles of a latency metric per hour or day.
+    """
+    start, end = latency_range(metric, start, end)
+    per_bucket = await merge_latency_sketches(db, metric, start, end, dimension, interval)
+    points = [
+        LatencyPoint(**summarize_sketch(sketch, bucket=bucket, dimension=dimension))
+        for bucket, sketch in sorted(per_bucket.items(), key=lambda item: item[0])
+    ]
+    return LatencySeries(metric=metric, interval=interval, points=points)
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+import asyncio
+import json
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
 from fastapi.responses import StreamingResponse
+from prometheus_client import Counter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from uuid import UUID
+from sqlalchemy import insert, select
+from typing import List
+from uuid import UUID, uuid4
 
 from app.schemas.chat import ChatRequest
 from app.services.llm.openai import OpenAIProvider
@@ -12,22 +18,129 @@ from app.core.database import get_db, async_session_factory
 from app.models.session import Session
 from app.models.message import Message as MessageModel
 from app.models.message import Message as MessageModel
+from app.models.tool_invocation import ToolInvocation
+from app.core.config import settings
 from app.services.summarizer import summarizer
-import json
+from app.services.history import load_history
+from app.services import archive, sse
+from app.services.turns import turn_registry, TurnNotFound, parse_last_event_id
+from app.services.admission import admission_controller, AdmissionRejected
+from app.services import rate_limit
+from app.services.rate_limit import rate_limiter, client_identity
+from app.services.completion_cache import completion_cache, CompletionRecorder, replay, LOOKUPS
+from app.services.prompt_index import prompt_index, current_solves
+from app.services.sketches import latency_recorder
 import time
 from opentelemetry import trace
 
 router = APIRouter()
 tracer = trace.get_tracer(__name__)
+logger = logging.getLogger(__name__)
+
+CANCELLED_TOKENS = Counter(
+    "coda_chat_cancelled_tokens_total",
+    "Tokens spent on turns cancelled before they finished (the cut-off completion estimated)",
+    ["model"]
+)
+
+INVOCATION_DEFAULTS = {
+    "tool_call_id": None, "duration": None, "request_bytes": None,
+    "response_bytes": None, "cache_hit": False, "retry_count": 0
+}
+
+# Reply stored for tool calls a stopped turn never answered
+CANCELLED_TOOL_RESULT = json.dumps({"error": "cancelled"})
+
+def history_messages(history: List[MessageModel]) -> List[dict]:
+    """
+    Stored messages as chat prompt messages. Every tool call gets a reply
+    and every tool reply follows its call, as the APIs require: a turn
+    stopped mid tool call may have left calls unanswered, and summarizing
+    can cut a call off from its replies. Empty assistant messages (turns
+    stopped before anything was generated) are left out.
+    """
+    messages = []
+    unanswered = []
+    for m in history:
+        if m.role == "tool":
+            if m.tool_call_id not in unanswered:
+                continue
+            unanswered.remove(m.tool_call_id)
+        else:
+            messages.extend({"role": "tool", "tool_call_id": call_id, "content": CANCELLED_TOOL_RESULT} for call_id in unanswered)
+            unanswered = []
+            if m.role == "assistant" and not m.content and not m.tool_calls:
+                continue
+        msg = {"role": m.role}
+        if m.content:
+            msg["content"] = m.content
+        if m.tool_calls:
+            msg["tool_calls"] = m.tool_calls
+            unanswered = [tc["id"] for tc in m.tool_calls]
+        if m.tool_call_id:
+            msg["tool_call_id"] = m.tool_call_id
+        messages.append(msg)
+    messages.extend({"role": "tool", "tool_call_id": call_id, "content": CANCELLED_TOOL_RESULT} for call_id in unanswered)
+    return messages
+
+async def save_tool_invocations(db: AsyncSession, invocations: List[dict]):
+    """
+    Writes a batch of tool invocation rows collected during a turn in one INSERT.
+    """
+    # Failed calls carry no stats; executemany needs the same keys in every row
+    rows = [{**INVOCATION_DEFAULTS, **invocation} for invocation in invocations]
+    await db.execute(insert(ToolInvocation), rows)
+    await db.commit()
+
+async def resume_turn(turn_id: str, after: int, http_request: Request) -> StreamingResponse:
+    try:
+        frames = await turn_registry.attach(turn_id, after, http_request.is_disconnected)
+    except TurnNotFound:
+        raise HTTPException(status_code=404, detail="Turn not found or expired")
+    return StreamingResponse(frames, media_type="text/event-stream", headers={"X-Turn-Id": turn_id})
+
+@router.get("/stream/{turn_id}")
+async def resume_stream(
+    turn_id: str,
+    http_request: Request,
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+    after: int | None = Query(None, ge=0, description="Last seq received, if the Last-Event-ID header cannot be set")
+):
+    """
+    Reattaches to a running (or recently finished) turn: replays the events
+    after Last-Event-ID from the turn's buffer, then follows it live.
+    """
+    _, seq = parse_last_event_id(last_event_id)
+    return await resume_turn(turn_id, after if after is not None else seq, http_request)
+
+@router.post("/stream/{turn_id}/cancel")
+async def cancel_stream(turn_id: str):
+    """
+    Stops a running turn. What was generated so far is kept as an assistant
+    message with status "cancelled"; followers get its message_id and [DONE].
+    """
+    try:
+        cancelled = turn_registry.cancel(turn_id)
+    except TurnNotFound:
+        raise HTTPException(status_code=404, detail="Turn not found on this worker or expired")
+    return {"turn_id": turn_id, "cancelled": cancelled}
 
 @router.post("/stream")
 async def stream_chat(
     request: ChatRequest,
+    http_request: Request,
     x_openai_api_key: str | None = Header(None, alias="X-OpenAI-API-Key"),
     x_anthropic_api_key: str | None = Header(None, alias="X-Anthropic-API-Key"),
     x_google_api_key: str | None = Header(None, alias="X-Google-API-Key"),
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
     db: AsyncSession = Depends(get_db)
 ):
+    # A reconnect of a turn still buffered: replay what was missed instead of running the prompt again
+    resume_id, seq = parse_last_event_id(last_event_id)
+    if resume_id:
+        return await resume_turn(resume_id, seq, http_request)
+
+    ticket = None
     try:
         # Provider Factory Logic
         model_id = request.model.lower()
@@ -36,12 +149,29 @@ async def stream_chat(
         if "claude" in model_id:
             from app.services.llm.anthropic import AnthropicProvider
             provider = AnthropicProvider(api_key=x_anthropic_api_key)
+            provider_name = "anthropic"
+            provider_key = x_anthropic_api_key
         elif "gemini" in model_id:
             from app.services.llm.gemini import GoogleProvider
             provider = GoogleProvider(api_key=x_google_api_key)
+            provider_name = "google"
+            provider_key = x_google_api_key
         else:
             # Default to OpenAI
             provider = OpenAIProvider(api_key=x_openai_api_key)
+            provider_name = "openai"
+            provider_key = x_openai_api_key
+        
+        # Per-caller budgets: one request, and a token budget that must not be overdrawn.
+        # Only the key the provider will use identifies the caller; on the server key it is their address
+        identity = client_identity(http_request, provider_key)
+        requests_budget = await rate_limiter.hit("chat", identity)
+        if not requests_budget.allowed:
+            raise rate_limit.rejection(requests_budget, "chat requests")
+        tokens_budget = await rate_limiter.hit("tokens", identity, cost=0)
+        if not tokens_budget.allowed:
+            raise rate_limit.rejection(tokens_budget, "LLM tokens")
+        rate_headers = {**requests_budget.headers(), **tokens_budget.headers()}
         
         session_id = request.session_id
         session = None
@@ -52,11 +182,12 @@ async def stream_chat(
             try:
                 # Handle string-to-UUID conversion if needed, though Pydantic usually handles it
                 sess_uuid = UUID(session_id) if isinstance(session_id, str) else session_id
-                session = await db.get(Session, sess_uuid)
+                # Rehydrates an archived session; the share lock keeps the archiver away until the new messages are in
+                session = await archive.ensure_hot(db, sess_uuid, lock=True)
             except ValueError:
                 pass # Invalid UUID format
                 
-            if not session:
+            if not session or session.deleted_at is not None:
                 raise HTTPException(status_code=404, detail="Session not found")
             
             # History loading moved to generate() for summarization support
@@ -83,6 +214,13 @@ async def stream_chat(
         # Decision: We will strictly APPEND `request.messages` to the DB and Context.
         # This implies the Frontend should only send the NEW user prompt in `request.messages`.
         
+        # Take a generation slot (or a place in the queue) before anything is saved,
+        # so a rejected request can simply be retried
+        try:
+            ticket = admission_controller.enqueue(provider_name, request.model)
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
         new_db_msgs = []
         for m in request.messages:
             db_msg = MessageModel(
@@ -99,13 +237,21 @@ async def stream_chat(
         async def generate():
             # We need a new DB session for saving the response since the dependency one closes
             accumulated_response = ""
+            unbilled_response = "" # Content of the completion whose usage has not arrived yet
             total_tokens = 0
             start_time = time.time()
+            first_token_at = None
+            generating_since = None # First token of the completion being streamed
+            generation_time = 0.0 # Time spent streaming completions, from first token to usage
+            generated_tokens = 0 # Completion tokens of those completions
             decision_count = 0
             accumulated_thoughts = []
+            invocations = []
+            tool_message_id = None
+            pending_tool_calls = [] # Ids of saved tool calls without a saved reply yet
             
-            # Yield Session ID first
-            yield f"data: {json.dumps({'session_id': str(session.id)})}\n\n"
+            # Yield Session ID first; the turn id lets a dropped client resume
+            yield {'session_id': str(session.id), 'turn_id': turn_id}
             
             async with async_session_factory() as db_inner:
                 # 3a. Load & Summarize Context
@@ -113,13 +259,8 @@ async def stream_chat(
                 current_session = await db_inner.get(Session, session.id)
                 summary = current_session.context_summary
                 
-                # Load Full History
-                result = await db_inner.execute(
-                    select(MessageModel)
-                    .where(MessageModel.session_id == session.id)
-                    .order_by(MessageModel.created_at)
-                )
-                history = result.scalars().all()
+                # Load Full History (including messages inherited from a forked session)
+                history = await load_history(db_inner, session.id)
                 
                 # Summarization Logic
                 HISTORY_LIMIT = 20 # Threshold to trigger summarization
@@ -127,7 +268,7 @@ async def stream_chat(
                 
                 if len(history) > HISTORY_LIMIT:
                     # Report status
-                    yield f"data: {json.dumps({'thought': 'Summarizing conversation history...'})}\n\n"
+                    yield {'thought': 'Summarizing conversation history...'}
                     
                     # Keep recent N messages, summarize the rest
                     KEEP_RECENT = 10
@@ -143,7 +284,7 @@ async def stream_chat(
                     db_inner.add(current_session)
                     await db_inner.commit()
                     
-                    yield f"data: {json.dumps({'thought': 'Context summary updated.'})}\n\n"
+                    yield {'thought': 'Context summary updated.'}
                     
                     # Prepare Context
                     history = recent_history
@@ -156,75 +297,201 @@ async def stream_chat(
                    messages.append({"role": "system", "content": f"PREVIOUS CONVERSATION SUMMARY:\n{summary}"})
                    
                 # Add History
-                for m in history:
-                    msg = {"role": m.role}
-                    if m.content:
-                        msg["content"] = m.content
-                    if m.tool_calls:
-                        msg["tool_calls"] = m.tool_calls
-                    if m.tool_call_id:
-                        msg["tool_call_id"] = m.tool_call_id
-                    messages.append(msg)
+                messages.extend(history_messages(history))
                 
                 # 3b. Get Tools
                 available_tools = tools_bridge.get_openai_tools()
                 
-                # 3c. Stream from Provider
-                stream = provider.chat_completion(
-                    messages=messages,
-                    model=request.model,
-                    stream=True,
-                    tools=available_tools if available_tools else None
-                )
+                # First turn of a session: tool calls identical to those of a near-duplicate
+                # earlier prompt get its solver results instead of running the solver again
+                solves = None
+                if prompt_index.enabled and len(history) == len(new_db_msgs):
+                    solves = prompt_index.solves_for("\n".join(m.content for m in request.messages if m.role == "user"))
+                    current_solves.set(solves)
+                    if solves.offers:
+                        yield {'thought': 'Found similar earlier requests; their solver results are reused where the tool calls match.'}
+
+                # 3c. Exact-match completion cache: a hit replays the recorded turn without calling the provider
+                cache_status = "bypass"
+                recorder = None
+                if completion_cache.applies(request.temperature, request.cache):
+                    cache_key = completion_cache.key(messages, request.model, request.temperature, tools_bridge.catalog_version)
+                    cached = await completion_cache.get(cache_key)
+                    cache_status = "hit" if cached is not None else "miss"
+                if completion_cache.enabled:
+                    LOOKUPS.labels(cache_status).inc()
+                    yield {'cache_status': cache_status}
+
+                requested_at = None
+                if cache_status == "hit":
+                    ticket.release()
+                    stream = replay(cached)
+                else:
+                    # Wait for a generation slot, telling the client where it is in the queue
+                    try:
+                        async for position in ticket.wait():
+                            yield {'queued': position}
+                    except AdmissionRejected as e:
+                        yield {'error': str(e), 'retry_after': e.retry_after}
+                        yield sse.DONE
+                        return
+
+                    # 3d. Stream from Provider
+                    if cache_status == "miss":
+                        recorder = CompletionRecorder(cache_key)
+                    options = {"temperature": request.temperature} if request.temperature is not None else {}
+                    requested_at = time.time()
+                    stream = provider.chat_completion(
+                        messages=messages,
+                        model=request.model,
+                        stream=True,
+                        tools=available_tools if available_tools else None,
+                        **options
+                    )
                 
-                async for event in stream:
-                    if not event:
-                        continue
+                try:
+                    async for event in stream:
+                        if not event:
+                            continue
+                        if recorder is not None:
+                            recorder.add(event)
+                        if requested_at is not None:
+                            # First response from upstream (queueing and tool calls excluded); drives the adaptive limits
+                            ticket.observe_latency(time.time() - requested_at)
+                            requested_at = None
                         
-                    event_type = event.get("type")
-                    content = event.get("content")
+                        event_type = event.get("type")
+                        content = event.get("content")
                     
-                    if event_type == "content":
-                        if content:
-                            accumulated_response += content
-                            yield f"data: {json.dumps({'content': content})}\n\n"
+                        if event_type == "content":
+                            if content:
+                                if first_token_at is None:
+                                    first_token_at = time.time()
+                                    if cache_status != "hit":
+                                        latency_recorder.record("ttft", first_token_at - start_time, request.model)
+                                if generating_since is None:
+                                    generating_since = time.time()
+                                accumulated_response += content
+                                unbilled_response += content
+                                yield {'content': content}
                             
-                    elif event_type in ["thought", "tool_start"]:
-                        if content:
-                            accumulated_thoughts.append(content)
-                            yield f"data: {json.dumps({'thought': content})}\n\n"
+                        elif event_type in ["thought", "tool_start"]:
+                            if content:
+                                accumulated_thoughts.append(content)
+                                yield {'thought': content}
                             
-                    elif event_type == "usage":
-                        usage = event.get("usage", {})
-                        if usage:
-                            count = usage.get("total_tokens", 0)
-                            total_tokens += count
-                            yield f"data: {json.dumps({'token_usage': count})}\n\n"
+                        elif event_type == "usage":
+                            usage = event.get("usage", {})
+                            if usage:
+                                count = usage.get("total_tokens", 0)
+                                total_tokens += count
+                                if generating_since is not None:
+                                    generation_time += time.time() - generating_since
+                                    generated_tokens += usage.get("completion_tokens") or 0
+                                    generating_since = None
+                                unbilled_response = ""
+                                yield {'token_usage': count}
                             
-                    elif event_type == "persist":
-                        # Save intermediate message to DB
-                        msg_data = event.get("msg")
-                        if msg_data:
-                            # Count decisions (tool calls)
-                            if msg_data.get("tool_calls"):
-                                 decision_count += len(msg_data["tool_calls"])
+                        elif event_type == "persist":
+                            # Save intermediate message to DB
+                            msg_data = event.get("msg")
+                            if msg_data:
+                                # Count decisions (tool calls)
+                                if msg_data.get("tool_calls"):
+                                     decision_count += len(msg_data["tool_calls"])
                                  
-                            # Note: We are already in db_inner context
+                                # Note: We are already in db_inner context
+                                db_msg = MessageModel(
+                                    session_id=session.id,
+                                    role=msg_data["role"],
+                                    content=msg_data.get("content"),
+                                    tool_calls=msg_data.get("tool_calls"),
+                                    tool_call_id=msg_data.get("tool_call_id"),
+                                    status=msg_data.get("status"),
+                                    token_count=None,
+                                    model=request.model if msg_data["role"] == "assistant" else None
+                                )
+                                db_inner.add(db_msg)
+                                await db_inner.commit()
+                                if msg_data.get("tool_calls"):
+                                    # Invocations that follow belong to this tool-calling message
+                                    tool_message_id = db_msg.id
+                                    pending_tool_calls = [tc["id"] for tc in msg_data["tool_calls"]]
+                                elif msg_data.get("tool_call_id") in pending_tool_calls:
+                                    pending_tool_calls.remove(msg_data["tool_call_id"])
+
+                        elif event_type == "tool_invocation":
+                            latency_recorder.record("tool_latency", event["invocation"].get("duration"), event["invocation"]["tool_name"])
+                            invocations.append({
+                                **event["invocation"], "session_id": session.id, "message_id": tool_message_id
+                            })
+                            if len(invocations) >= settings.TOOL_INVOCATION_BATCH_SIZE:
+                                await save_tool_invocations(db_inner, invocations)
+                                invocations = []
+
+                except asyncio.CancelledError:
+                    # Stopped, or nobody followed the turn for the disconnect grace period. Closing
+                    # the provider stream ends the upstream request so it stops generating
+                    await stream.aclose()
+                    duration = time.time() - start_time
+                    # Usage comes at the end of each completion; estimate the one that was cut off
+                    if unbilled_response:
+                        total_tokens += await provider.count_tokens_async(unbilled_response)
+                    CANCELLED_TOKENS.labels(model=request.model).inc(total_tokens)
+                    await rate_limiter.charge("tokens", identity, total_tokens)
+                    message_id = None
+                    try:
+                        await db_inner.rollback()
+                        if pending_tool_calls:
+                            # Calls still running get a reply, or the next prompt of the session is rejected
+                            for call_id in pending_tool_calls:
+                                db_inner.add(MessageModel(
+                                    session_id=session.id,
+                                    role="tool",
+                                    tool_call_id=call_id,
+                                    content=CANCELLED_TOOL_RESULT,
+                                    status="cancelled"
+                                ))
+                            # Committed on their own so the partial reply gets a later timestamp
+                            await db_inner.commit()
+                        # Stopped before anything was generated or spent: nothing to keep
+                        if accumulated_response or total_tokens:
                             db_msg = MessageModel(
                                 session_id=session.id,
-                                role=msg_data["role"],
-                                content=msg_data.get("content"),
-                                tool_calls=msg_data.get("tool_calls"),
-                                tool_call_id=msg_data.get("tool_call_id"),
-                                status=msg_data.get("status"),
-                                token_count=None
+                                role="assistant",
+                                content=accumulated_response,
+                                status="cancelled",
+                                token_count=total_tokens,
+                                execution_time=duration,
+                                decision_count=decision_count,
+                                model=request.model,
+                                feedback={"thoughts": "\n".join(accumulated_thoughts)} if accumulated_thoughts else None
                             )
                             db_inner.add(db_msg)
-                            await db_inner.commit()
-                
+                            await db_inner.flush()
+                            message_id = str(db_msg.id)
+                        if invocations:
+                            await save_tool_invocations(db_inner, invocations)
+                        await db_inner.commit()
+                    except Exception as e:
+                        logger.exception(f"Saving the partial reply of turn {turn_id} failed: {e}")
+                    yield {'message_id': message_id, 'status': 'cancelled'}
+                    yield sse.DONE
+                    raise
+
+                # Only complete turns are cached
+                if recorder is not None:
+                    await completion_cache.put(recorder)
+                if solves is not None:
+                    prompt_index.add(solves)
+
                 # Yield metrics BEFORE [DONE]
                 duration = time.time() - start_time
-                yield f"data: {json.dumps({'execution_time': duration, 'decision_count': decision_count})}\n\n"
+                if cache_status != "hit":
+                    latency_recorder.record("turn_duration", duration, request.model)
+                if cache_status != "hit" and generated_tokens and generation_time > 0:
+                    latency_recorder.record("tokens_per_second", generated_tokens / generation_time, request.model)
+                yield {'execution_time': duration, 'decision_count': decision_count}
                 
                 # Save the final assistant message
                 db_msg = MessageModel(
@@ -234,23 +501,42 @@ async def stream_chat(
                     token_count=total_tokens,
                     execution_time=duration,
                     decision_count=decision_count,
+                    model=request.model,
                     feedback={"thoughts": "\n".join(accumulated_thoughts)} if accumulated_thoughts else None
                 )
                 db_inner.add(db_msg)
+                if invocations:
+                    await save_tool_invocations(db_inner, invocations)
                 await db_inner.commit()
                 await db_inner.refresh(db_msg)
+                await rate_limiter.charge("tokens", identity, total_tokens)
                 
                 # Send the ID to the client
-                yield f"data: {json.dumps({'message_id': str(db_msg.id)})}\n\n"
+                yield {'message_id': str(db_msg.id)}
                 
-                yield "data: [DONE]\n\n"
+                yield sse.DONE
 
+        # Generation runs in its own task and outlives this response; events are
+        # numbered and buffered so a reconnect with Last-Event-ID can pick up
+        turn_id = str(uuid4())
+        # The turn's task inherits this, so its tool calls count against the caller
+        rate_limit.current_identity.set(identity)
+        turn = turn_registry.start(turn_id, session.id, generate())
+        # However the turn ends (finished, failed, cancelled while queued), its slot is given back
+        turn.task.add_done_callback(lambda _: ticket.release())
         return StreamingResponse(
-            generate(),
-            media_type="text/event-stream"
+            turn.follow(is_disconnected=http_request.is_disconnected),
+            media_type="text/event-stream",
+            headers={"X-Turn-Id": turn_id, **rate_headers}
         )
         
+    except HTTPException:
+        if ticket is not None:
+            ticket.release()
+        raise
     except Exception as e:
+        if ticket is not None:
+            ticket.release()
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
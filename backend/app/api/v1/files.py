@@ -1,66 +1,115 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import Dict, Any
-import pandas as pd
-from pypdf import PdfReader
-import io
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Literal
+import json
+
+from app.core.config import settings
+
+from app.core.executor import ExecutorSaturated
+from app.services.datasets import describe_for_prompt
+from app.services.ingestion import IngestionError, spool_upload, extract_upload
+from app.services import rate_limit
 
 router = APIRouter()
 
+# How the content of each incremental event type is joined back into one document
+CONTENT_JOINERS = {"page": "\n", "rows": "\n", "text": "", "profile": "\n"}
+
+# mode=summary renders a column profile plus the sample rows that fit token_budget
+# instead of every row; the full table is stored either way.
+ModeQuery = Query("full", description="'full' renders every table row, 'summary' a profile and budgeted sample")
+TokenBudgetQuery = Query(settings.TABLE_PREVIEW_TOKEN_BUDGET, ge=100, le=100000)
+
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)) -> Dict[str, Any]:
-    content = ""
-    file_type = file.content_type
-    filename = file.filename
-    
+async def upload_file(
+    file: UploadFile = File(...),
+    mode: Literal["full", "summary"] = ModeQuery,
+    token_budget: int = TokenBudgetQuery,
+    _: Dict[str, str] = Depends(rate_limit.limit("uploads"))
+) -> Dict[str, Any]:
     try:
-        import os
-        ext = os.path.splitext(filename)[1].lower()
+        upload = await spool_upload(file)
+    except IngestionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
-        if ext == ".pdf":
-            # Read PDF
-            pdf_content = await file.read()
-            pdf_file = io.BytesIO(pdf_content)
-            reader = PdfReader(pdf_file)
-            text = []
-            for page in reader.pages:
-                text.append(page.extract_text())
-            content = "\n".join(text)
-            
-        elif ext == ".csv":
-            # Read CSV
-            # Reset file pointer if needed, but file.read() wasn't called yet
-            await file.seek(0)
-            df = pd.read_csv(file.file)
-            content = df.to_markdown(index=False)
-            
-        elif ext in [".xlsx", ".xls"]:
-            # Read Excel
-            await file.seek(0)
-            df = pd.read_excel(file.file)
-            content = df.to_markdown(index=False)
-            
-        elif ext in [".txt", ".md", ".py", ".js", ".ts", ".json", ".html", ".css", ".xml", ".yaml", ".yml"]:
-            # Read Text
-            content_bytes = await file.read()
-            content = content_bytes.decode("utf-8")
-        else:
-            # Fallback to text if unknown but looks text-ish?
-            # Or assume text if not binary knowns?
-            # Let's try to decode as UTF-8
-            try:
-                content_bytes = await file.read()
-                content = content_bytes.decode("utf-8")
-            except:
-                 raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
+    try:
+        parts = []
+        joiner = ""
+        done = {}
+        profile = None
+        async for event in extract_upload(upload, summary=mode == "summary", token_budget=token_budget):
+            if event["type"] == "done":
+                done = event
+            else:
+                if event["type"] == "profile":
+                    profile = event["profile"]
+                joiner = CONTENT_JOINERS[event["type"]]
+                parts.append(event["content"])
+        content = joiner.join(parts)
 
-        return {
-            "filename": filename,
-            "content_type": file_type,
+        response = {
+            "filename": upload.filename,
+            "content_type": upload.content_type,
             "content": content,
-            "size": len(content)
+            "size": len(content),
+            "cached": done.get("cached", False)
         }
 
+        if profile:
+            response["profile"] = profile
+
+        if "file_id" in done:
+            # Tell the model how to point solvers at the stored table instead of re-typing it
+            response["file_id"] = done["file_id"]
+            response["columns"] = done["columns"]
+            response["rows"] = done["rows"]
+            response["content"] = describe_for_prompt(done) + "\n\n" + content
+            response["size"] = len(response["content"])
+
+        return response
+
+    except IngestionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=422, detail=f"Failed to process file {file.filename}: {str(e)}")
+    finally:
+        upload.cleanup()
+
+@router.post("/upload/stream")
+async def upload_file_stream(
+    file: UploadFile = File(...),
+    mode: Literal["full", "summary"] = ModeQuery,
+    token_budget: int = TokenBudgetQuery,
+    rate_headers: Dict[str, str] = Depends(rate_limit.limit("uploads"))
+):
+    """
+    Streams extraction results as NDJSON: one event per page, row chunk or text
+    chunk, then a 'done' event (or an 'error' event if extraction fails midway).
+    """
+    try:
+        upload = await spool_upload(file)
+    except IngestionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    async def generate():
+        try:
+            async for event in extract_upload(upload, summary=mode == "summary", token_budget=token_budget):
+                if event["type"] == "done" and "file_id" in event:
+                    event["note"] = describe_for_prompt(event)
+                yield json.dumps(event) + "\n"
+        except IngestionError as e:
+            yield json.dumps({"type": "error", "status": e.status_code, "detail": str(e)}) + "\n"
+        except ExecutorSaturated as e:
+            yield json.dumps({"type": "error", "status": 503, "detail": str(e)}) + "\n"
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "status": 422, "detail": f"Failed to process file {upload.filename}: {str(e)}"}) + "\n"
+        finally:
+            upload.cleanup()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=rate_headers)
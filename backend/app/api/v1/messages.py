@@ -7,12 +7,16 @@ from typing import Optional
 
 from app.core.database import get_db
 from app.models.message import Message
+from app.services import history
 
 router = APIRouter()
 
 class FeedbackCreate(BaseModel):
     score: int  # 1 for up, -1 for down
     comment: Optional[str] = None
+    # Session the message is shown in. Forks share the messages they inherit with
+    # their parent, so without it feedback lands on the shared row
+    session_id: Optional[UUID] = None
 
 @router.post("/{message_id}/feedback")
 async def create_feedback(
@@ -20,20 +24,25 @@ async def create_feedback(
     feedback: FeedbackCreate, 
     db: AsyncSession = Depends(get_db)
 ):
-    # Async query using select
-    result = await db.execute(select(Message).where(Message.id == message_id))
-    message = result.scalars().first()
+    if feedback.session_id:
+        # Copy-on-write: an inherited message is copied into the fork before it is changed
+        message = await history.own_message(db, feedback.session_id, message_id)
+    else:
+        # Async query using select
+        result = await db.execute(select(Message).where(Message.id == message_id))
+        message = result.scalars().first()
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
     # Update feedback
-    # Ensure message.feedback is a dict, default to empty
-    current_feedback = message.feedback if message.feedback else {}
+    # Ensure message.feedback is a dict, default to empty. Copied: changed in place,
+    # the reassignment below would compare equal and nothing would be saved
+    current_feedback = dict(message.feedback) if message.feedback else {}
     
     # Update with new data
     # Use model_dump for Pydantic v2
-    current_feedback.update(feedback.model_dump())
+    current_feedback.update(feedback.model_dump(exclude={"session_id"}))
     
     # Reassign to trigger update
     # In SQLAlchemy, specialized types like JSONB might need explicit reassignment
@@ -43,4 +52,5 @@ async def create_feedback(
     await db.commit()
     await db.refresh(message)
     
-    return {"status": "success", "feedback": message.feedback}
+    # message_id differs from the one posted when an inherited message was copied
+    return {"status": "success", "feedback": message.feedback, "message_id": str(message.id)}
@@ -0,0 +1,110 @@
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Float, and_, func, literal, null, select, tuple_, union_all
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.models.session import Session
+from app.models.message import Message
+from app.schemas.search import SearchHit
+from app.api.pagination import encode_rank_cursor, decode_rank_cursor
+
+router = APIRouter()
+
+TITLE_BOOST = 2.0 # A title match outranks the same match in one message
+HEADLINE_CHARS = 20000 # Snippets are cut from the start of long messages
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2"
+
+@router.get("/", response_model=List[SearchHit])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500, description="Web-style query: words, \"phrases\", OR, -exclude"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ranked full-text search over message content (user and assistant
+    messages) and session titles of live sessions. Both go through GIN
+    indexes; snippets are only highlighted for the rows of the returned
+    page. Very broad queries are ranked among their newest
+    SEARCH_MAX_CANDIDATES message matches. Paginate by passing the
+    X-Next-Cursor response header back as `cursor`.
+    """
+    query = func.websearch_to_tsquery("english", q)
+    # Normalization 32 maps ranks to [0, 1), so title and message ranks are comparable
+    message_rank = func.ts_rank_cd(Message.search_vector, query, 32).cast(Float)
+    title_rank = (func.ts_rank_cd(Session.search_vector, query, 32) * TITLE_BOOST).cast(Float)
+
+    # Ranking needs every candidate, so broad queries only rank the newest
+    # SEARCH_MAX_CANDIDATES matches; for those the planner walks created_at backwards
+    candidates = (
+        select(
+            Message.id,
+            Message.session_id,
+            Message.role,
+            Message.created_at,
+            message_rank.label("rank")
+        )
+        .join(Session, Session.id == Message.session_id)
+        .where(Message.search_vector.op("@@")(query), Session.deleted_at.is_(None))
+        .order_by(Message.created_at.desc())
+        .limit(settings.SEARCH_MAX_CANDIDATES)
+        .subquery("candidates")
+    )
+    message_hits = select(literal("message").label("kind"), *candidates.c)
+    title_hits = (
+        select(
+            literal("session"),
+            Session.id,
+            Session.id,
+            null(),
+            Session.created_at,
+            title_rank
+        )
+        .where(Session.search_vector.op("@@")(query), Session.deleted_at.is_(None))
+    )
+    hits = union_all(message_hits, title_hits).subquery("hits")
+
+    page = select(hits)
+    if cursor:
+        rank, row_id = decode_rank_cursor(cursor)
+        page = page.where(tuple_(hits.c.rank, hits.c.id) < (rank, row_id))
+    page = page.order_by(hits.c.rank.desc(), hits.c.id.desc()).limit(limit + 1).subquery("page")
+
+    # Highlighting is the expensive part, so it runs on the page rows only
+    snippet = func.ts_headline(
+        "english",
+        func.coalesce(func.left(Message.content, HEADLINE_CHARS), Session.title),
+        query,
+        HEADLINE_OPTIONS
+    )
+    result = await db.execute(
+        select(page, Session.title, snippet)
+        .join(Session, Session.id == page.c.session_id)
+        .outerjoin(
+            Message,
+            and_(page.c.kind == "message", Message.id == page.c.id, Message.created_at == page.c.created_at)
+        )
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+    rows = result.all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_rank_cursor(rows[-1].rank, rows[-1].id)
+
+    return [
+        SearchHit(
+            kind=row.kind,
+            session_id=row.session_id,
+            session_title=row.title,
+            message_id=row.id if row.kind == "message" else None,
+            role=row.role,
+            created_at=row.created_at,
+            rank=row.rank,
+            snippet=row[-1]
+        )
+        for row in rows
+    ]
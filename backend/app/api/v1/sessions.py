@@ -1,26 +1,96 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from sqlalchemy.orm import selectinload
-from typing import List
+from sqlalchemy import select, update, func, tuple_, true
+from sqlalchemy.exc import IntegrityError
+from typing import List, Literal, Optional
 from uuid import UUID
 
-from app.core.database import get_db
+from app.core.database import get_db, async_session_factory
 from app.models.session import Session
 from app.models.message import Message
-from app.schemas.session import SessionCreate, SessionRead, SessionWithMessages, ForkSessionRequest
+from app.schemas.session import SessionCreate, SessionRead, SessionSummary, SessionWithMessages, ForkSessionRequest, MessageRead, BulkDeleteRequest, ImportResult
+from app.api.pagination import encode_cursor, decode_cursor
+from app.services import archive, history, transfer
 
 router = APIRouter()
 
-@router.get("/", response_model=List[SessionRead])
+PREVIEW_CHARS = 120
+EXPORT_BATCH_SIZE = 500
+
+# Columns for compact message pages: no tool payloads, content truncated in SQL
+COMPACT_COLUMNS = (
+    Message.id,
+    Message.role,
+    Message.created_at,
+    Message.token_count,
+    Message.execution_time,
+    Message.decision_count,
+    Message.status,
+    Message.feedback
+)
+
+@router.get("/", response_model=List[SessionSummary])
 async def list_sessions(
-    skip: int = 0, 
-    limit: int = 50, 
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Session).order_by(Session.updated_at.desc()).offset(skip).limit(limit)
+    """
+    Sidebar listing. Projection-only: message count and last-message preview
+    are computed in SQL, no Message rows are loaded. Paginate by passing the
+    X-Next-Cursor response header back as `cursor`.
+
+    Forks count the messages they inherit (stored at fork time); their
+    preview only shows messages of their own. Archived sessions use the
+    count and preview kept on their stub row.
+    """
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.session_id == Session.id)
+        .correlate(Session)
+        .scalar_subquery()
+    )
+    last_message = (
+        select(Message.content, Message.created_at)
+        .where(Message.session_id == Session.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .correlate(Session)
+        .lateral("last_message")
+    )
+
+    query = (
+        select(
+            Session.id,
+            Session.title,
+            Session.created_at,
+            Session.updated_at,
+            Session.parent_id,
+            Session.fork_message_id,
+            Session.archived_at,
+            (message_count + Session.inherited_messages + Session.archived_messages).label("message_count"),
+            func.coalesce(last_message.c.created_at, Session.archived_last_at, Session.fork_cutoff_at).label("last_activity_at"),
+            func.coalesce(func.left(last_message.c.content, PREVIEW_CHARS), Session.archived_preview).label("last_message_preview")
+        )
+        .outerjoin(last_message, true())
+        .where(Session.deleted_at.is_(None))
+        .order_by(Session.updated_at.desc(), Session.id.desc())
+        .limit(limit)
+    )
+
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        query = query.where(tuple_(Session.updated_at, Session.id) < tuple_(updated_at, session_id))
+
     result = await db.execute(query)
-    return result.scalars().all()
+    rows = result.mappings().all()
+
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+
+    return [SessionSummary(**row) for row in rows]
 
 @router.post("/", response_model=SessionRead)
 async def create_session(
@@ -34,88 +104,240 @@ async def create_session(
     await db.refresh(new_session)
     return new_session
 
+@router.get("/export")
+async def export_sessions(
+    session_id: Optional[List[UUID]] = Query(None, description="Only these sessions (and the ancestors they fork from)"),
+):
+    """
+    Streams sessions with their messages and tool invocations as NDJSON
+    (see app/services/transfer.py), reading from server-side cursors.
+    The output can be loaded into another deployment with POST /sessions/import.
+    """
+    async def generate():
+        async with async_session_factory() as stream_db:
+            async for chunk in transfer.export_ndjson(stream_db, session_id):
+                yield chunk
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="sessions.ndjson"'}
+    )
+
+@router.post("/import", response_model=ImportResult)
+async def import_sessions(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Loads an NDJSON export streamed in the request body, in batches,
+    keeping ids, lineage and timestamps. Rows that already exist are
+    skipped, so a failed import can be retried with the same file.
+    """
+    try:
+        counts = await transfer.import_ndjson(db, request.stream())
+    except transfer.TransferError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        # e.g. a fork whose parent is neither in the file nor in this database
+        raise HTTPException(status_code=409, detail=f"Import conflicts with existing data: {e.orig}")
+    return ImportResult(**counts)
+
 @router.get("/{session_id}", response_model=SessionWithMessages)
 async def get_session(
     session_id: UUID, 
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Session).options(selectinload(Session.messages)).where(Session.id == session_id)
-    result = await db.execute(query)
-    session = result.scalar_one_or_none()
+    # Archived sessions are brought back into the hot tables on first open
+    session = await archive.ensure_hot(db, session_id)
     
-    if not session:
+    if not session or session.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    return session
+    messages = await history.load_history(db, session_id)
+    return SessionWithMessages(**SessionRead.model_validate(session).model_dump(), messages=messages)
+
+@router.get("/{session_id}/messages", response_model=List[MessageRead])
+async def list_messages(
+    session_id: UUID,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    fields: Literal["full", "compact"] = "full",
+    max_content_chars: int = Query(2000, ge=0, le=100000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    One page of a session's messages in chronological order, keyed on
+    (created_at, id). Without a cursor the most recent page is returned.
+    Follow X-Before-Cursor to page back and X-After-Cursor to page forward.
+
+    fields=compact drops tool_calls and truncates content to max_content_chars.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either 'before' or 'after', not both")
+
+    session = await archive.ensure_hot(db, session_id)
+    if not session or session.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if fields == "compact":
+        query = history.history_select(
+            session_id,
+            *COMPACT_COLUMNS,
+            func.left(Message.content, max_content_chars).label("content"),
+            (func.length(Message.content) > max_content_chars).label("content_truncated")
+        )
+    else:
+        query = history.history_select(session_id)
+
+    key = tuple_(Message.created_at, Message.id)
+    backwards = after is None
+    if before:
+        query = query.where(key < tuple_(*decode_cursor(before)))
+    elif after:
+        query = query.where(key > tuple_(*decode_cursor(after)))
+
+    if backwards:
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.created_at, Message.id)
+
+    # One extra row tells us whether another page exists in the scan direction
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.mappings().all() if fields == "compact" else result.scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows = rows[::-1]
+
+    if rows:
+        first, last = rows[0], rows[-1]
+        if fields == "compact":
+            first_key, last_key = (first["created_at"], first["id"]), (last["created_at"], last["id"])
+        else:
+            first_key, last_key = (first.created_at, first.id), (last.created_at, last.id)
+        # Paging forward, older rows always exist; paging back, only if the extra row came back
+        if has_more or not backwards:
+            response.headers["X-Before-Cursor"] = encode_cursor(*first_key)
+        # The forward cursor is always returned so clients can poll for new messages
+        response.headers["X-After-Cursor"] = encode_cursor(*last_key)
+
+    if fields == "compact":
+        return [MessageRead(**{**row, "content_truncated": bool(row["content_truncated"])}) for row in rows]
+    return rows
+
+@router.get("/{session_id}/messages/export")
+async def export_messages(
+    session_id: UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streams every message of a session as NDJSON, one MessageRead per line,
+    fetching from a server-side cursor in batches instead of loading all rows.
+    """
+    session = await archive.ensure_hot(db, session_id)
+    if not session or session.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def generate():
+        # The request-scoped session is closed before the body is sent, so stream from our own
+        async with async_session_factory() as stream_db:
+            query = (
+                history.history_select(session_id)
+                .order_by(Message.created_at, Message.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            messages = await stream_db.stream_scalars(query)
+            async for partition in messages.partitions():
+                yield "".join(MessageRead.model_validate(m).model_dump_json() + "\n" for m in partition)
+                # Rows already sent are not needed again; keep the identity map small
+                stream_db.expunge_all()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="session-{session_id}.ndjson"'}
+    )
 
 @router.delete("/{session_id}")
 async def delete_session(
     session_id: UUID, 
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Session).where(Session.id == session_id)
-    result = await db.execute(query)
-    session = result.scalar_one_or_none()
-    
-    if not session:
+    """
+    Soft delete: one UPDATE hides the session right away. Its messages are
+    removed later, in batches, by the background purger.
+    """
+    result = await db.execute(
+        update(Session)
+        .where(Session.id == session_id, Session.deleted_at.is_(None))
+        .values(deleted_at=func.now(), updated_at=Session.updated_at)
+        .returning(Session.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    await db.delete(session)
     await db.commit()
     return {"ok": True}
 
+@router.post("/bulk-delete")
+async def bulk_delete_sessions(
+    request: BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        update(Session)
+        .where(Session.id.in_(request.session_ids), Session.deleted_at.is_(None))
+        .values(deleted_at=func.now(), updated_at=Session.updated_at)
+        .returning(Session.id)
+    )
+    deleted = result.scalars().all()
+    await db.commit()
+    return {"ok": True, "deleted": len(deleted)}
+
 @router.post("/{session_id}/fork", response_model=SessionRead)
 async def fork_session(
     session_id: UUID, 
     fork_req: ForkSessionRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
-    # 1. Fetch Original Session
-    query = select(Session).where(Session.id == session_id)
-    result = await db.execute(query)
-    original_session = result.scalar_one_or_none()
+    """
+    Copy-on-write fork: the new session references the original's history
+    up to fork_req.message_id instead of copying it. Deep fork chains are
+    compacted in the background.
+    """
+    # Share lock until commit: the archiver must not take the parent away under the new fork
+    original_session = await archive.ensure_hot(db, session_id, lock=True)
     
-    if not original_session:
+    if not original_session or original_session.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Original session not found")
         
-    # 2. Fetch Messages to Clone
-    msgs_query = select(Message).where(Message.session_id == session_id).order_by(Message.created_at)
-    msgs_result = await db.execute(msgs_query)
-    messages = msgs_result.scalars().all()
-    
-    # Filter if message_id provided
-    cutoff_time = None
-    if fork_req.message_id:
-        target = next((m for m in messages if m.id == fork_req.message_id), None)
-        if target:
-            cutoff_time = target.created_at
-            
-    # 3. Create New Session
-    new_title = f"Fork of {original_session.title}"[:100]
-    new_session = Session(title=new_title, context_summary=original_session.context_summary)
-    db.add(new_session)
-    await db.flush() # Get ID
-    
-    # 4. Clone Messages
-    for msg in messages:
-        if cutoff_time and msg.created_at > cutoff_time:
-            continue
-            
-        new_msg = Message(
-            session_id=new_session.id,
-            role=msg.role,
-            content=msg.content,
-            tool_calls=msg.tool_calls,
-            tool_call_id=msg.tool_call_id,
-            status=msg.status,
-            token_count=msg.token_count,
-            execution_time=msg.execution_time,
-            decision_count=msg.decision_count
-        )
-        db.add(new_msg)
-        
+    new_session = await history.fork(db, original_session, fork_req.message_id)
     await db.commit()
     await db.refresh(new_session)
+
+    if await history.needs_compaction(db, new_session.id):
+        background_tasks.add_task(history.materialize_in_background, new_session.id)
     
     return new_session
 
+@router.post("/{session_id}/materialize", status_code=202)
+async def materialize_session(
+    session_id: UUID,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Copies a fork's inherited messages into it so it no longer depends on its parent.
+    """
+    session = await db.get(Session, session_id)
+    if not session or session.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if session.parent_id is None:
+        return {"ok": True, "scheduled": False}
+
+    background_tasks.add_task(history.materialize_in_background, session_id)
+    return {"ok": True, "scheduled": True}
@@ -0,0 +1,107 @@
+"""
+Command line entry point for maintenance tasks.
+
+    cd backend
+    python -m app.cli export [--session-id ID ...] [-o sessions.ndjson]
+    python -m app.cli import sessions.ndjson
+    python -m app.cli archive [--idle-days 7]
+
+Export writes to stdout unless -o is given; import reads stdin for "-".
+Both stream, so memory use does not depend on the size of the data.
+"""
+import argparse
+import asyncio
+import sys
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.database import async_session_factory, engine
+from app.services import transfer
+from app.services.archive import SessionArchiver, SESSIONS_PER_PASS
+
+READ_CHUNK_BYTES = 1 << 20
+
+
+async def export_command(args) -> int:
+    out = open(args.output, "w", encoding="utf-8") if args.output != "-" else sys.stdout
+    try:
+        async with async_session_factory() as db:
+            async for chunk in transfer.export_ndjson(db, args.session_id):
+                out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+async def import_command(args) -> int:
+    source = open(args.input, "rb") if args.input != "-" else sys.stdin.buffer
+
+    async def chunks():
+        while True:
+            chunk = source.read(READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+    try:
+        async with async_session_factory() as db:
+            counts = await transfer.import_ndjson(db, chunks())
+    except transfer.TransferError as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(
+        f"Imported {counts['sessions']} sessions, {counts['messages']} messages, "
+        f"{counts['tool_invocations']} tool invocations ({counts['skipped']} already present)",
+        file=sys.stderr
+    )
+    return 0
+
+
+async def archive_command(args) -> int:
+    archiver = SessionArchiver(idle_days=args.idle_days)
+    totals = {}
+    while True:
+        report = await archiver.archive_once()
+        for key, value in report.items():
+            totals[key] = totals.get(key, 0) + value
+        # A short pass means no idle sessions are left (or the rest no longer qualified)
+        if report["sessions"] < SESSIONS_PER_PASS:
+            break
+    print(
+        f"Archived {totals['sessions']} sessions ({totals['messages']} messages, {totals['tool_invocations']} tool invocations): "
+        f"reclaimed {totals['bytes_reclaimed']} bytes from hot tables, wrote {totals['bytes_written']} bytes of Parquet",
+        file=sys.stderr
+    )
+    return 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Stream sessions as NDJSON")
+    export_parser.add_argument("--session-id", type=UUID, action="append", help="Only this session and its ancestors (repeatable)")
+    export_parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser("import", help="Load an NDJSON export")
+    import_parser.add_argument("input", help="NDJSON file, or - for stdin")
+    import_parser.set_defaults(handler=import_command)
+
+    archive_parser = commands.add_parser("archive", help="Archive idle sessions to Parquet now")
+    archive_parser.add_argument("--idle-days", type=int, default=settings.ARCHIVE_IDLE_DAYS, help="Idle threshold (default: ARCHIVE_IDLE_DAYS)")
+    archive_parser.set_defaults(handler=archive_command)
+
+    args = parser.parse_args()
+    try:
+        return await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -30,6 +30,80 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     DATABASE_POOL_SIZE: int = 20
     DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: int = 30 # Seconds to wait for a free connection before failing
+    DATABASE_POOL_RECYCLE: int = 1800 # Replace connections older than this (seconds)
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100 # asyncpg prepared statements cached per connection
+    DATABASE_PGBOUNCER: bool = False # Connecting through PgBouncer in transaction mode
+    MESSAGE_PARTITION_MONTHS_AHEAD: int = 3 # Only used when messages is partitioned
+    FORK_MATERIALIZE_DEPTH: int = 8 # Forks this deep in a lineage chain are copied in the background
+    SEARCH_MAX_CANDIDATES: int = 10000 # Only the newest matching messages are ranked
+
+    # Chat streaming
+    SSE_COALESCE_MS: int = 20 # Content deltas are merged into one frame per window (0 = a frame per delta)
+    SSE_COALESCE_CHARS: int = 512 # Flush earlier once this much content is pending
+    TURN_BUFFER_EVENTS: int = 2048 # Frames per turn kept for Last-Event-ID replay
+    TURN_RETENTION_SECONDS: int = 300 # Finished turns stay resumable this long
+    TURN_REDIS: bool = False # Mirror turn events to Redis streams so any worker can resume them
+    TURN_DISCONNECT_GRACE_SECONDS: int = 10 # A turn nobody follows is cancelled after this (0 = at once)
+
+    # Admission control for chat generations
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_PROVIDER_LIMIT: int = 64 # Concurrent generations per provider (ceiling of the adaptive limit)
+    ADMISSION_MODEL_LIMIT: int = 32 # Concurrent generations per model (ceiling of the adaptive limit)
+    ADMISSION_MIN_LIMIT: int = 4 # Adaptive limits never go below this
+    ADMISSION_QUEUE_LIMIT: int = 128 # Generations waiting per provider before answering 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: int = 30 # A queued generation gives up after this
+    ADMISSION_LATENCY_TOLERANCE: float = 2.0 # Limits shrink while TTFT is above this multiple of its baseline
+
+    # Rate limits per caller (the API key sent for the model's provider, else client address); 0 = unlimited
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REDIS: bool = False # Shared token buckets in Redis; otherwise each worker counts on its own
+    RATE_LIMIT_CHAT_PER_MINUTE: int = 30 # Bursts of up to a minute's worth are allowed
+    RATE_LIMIT_TOKENS_PER_MINUTE: int = 200000 # LLM tokens; charged after each turn, so one turn can overdraw it
+    RATE_LIMIT_UPLOADS_PER_MINUTE: int = 20
+    RATE_LIMIT_TOOL_CALLS_PER_MINUTE: int = 60
+    RATE_LIMIT_LOCAL_KEYS: int = 10000 # Buckets kept in memory when Redis is off or unreachable
+    # Proxies (IPs or CIDRs, comma-separated) whose X-Forwarded-For is believed, e.g. the nginx in front of the app
+    RATE_LIMIT_TRUSTED_PROXIES: Union[List[str], str] = []
+
+    @field_validator("RATE_LIMIT_TRUSTED_PROXIES", mode="after")
+    @classmethod
+    def assemble_trusted_proxies(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        return v
+
+    # Exact-match completion cache (opt-in)
+    COMPLETION_CACHE_ENABLED: bool = False
+    COMPLETION_CACHE_ENTRIES: int = 512 # Completions kept in process
+    COMPLETION_CACHE_REDIS: bool = False # Share cached completions between workers
+    COMPLETION_CACHE_TTL_SECONDS: int = 86400 # Redis entry lifetime
+    COMPLETION_CACHE_MAX_KB: int = 256 # Larger turns are not cached
+
+    # Near-duplicate index of first-turn prompts (MinHash/LSH), to reuse earlier solver results
+    PROMPT_INDEX_ENABLED: bool = True
+    PROMPT_INDEX_ENTRIES: int = 2000 # Prompts kept; the least recently used are evicted
+    PROMPT_INDEX_MAX_MB: int = 64 # Solver results kept across all prompts
+    PROMPT_INDEX_MAX_RESULT_KB: int = 256 # Larger results are not kept
+    PROMPT_INDEX_THRESHOLD: float = 0.7 # Estimated Jaccard similarity for a prompt to count as a near duplicate
+
+    # Purging of soft-deleted sessions
+    PURGE_ENABLED: bool = True
+    PURGE_INTERVAL_SECONDS: int = 60
+    PURGE_GRACE_SECONDS: int = 0 # How long a deleted session is kept before its rows are removed
+    PURGE_BATCH_SIZE: int = 5000 # Messages deleted per statement/transaction
+
+    # Analytics rollups
+    ROLLUP_ENABLED: bool = True
+    ROLLUP_INTERVAL_SECONDS: int = 60
+    ROLLUP_LAG_SECONDS: int = 300 # Rows younger than this are aggregated live, not rolled up
+    SKETCH_FLUSH_INTERVAL_SECONDS: int = 10 # How often in-process latency sketches are merged into the table
+
+    # Archival of idle sessions to Parquet
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_INTERVAL_SECONDS: int = 3600
+    ARCHIVE_IDLE_DAYS: int = 7 # Sessions without activity for this long are archived
+    ARCHIVE_STORAGE_URI: str | None = None # Local path or s3://bucket/prefix; defaults to STORAGE_LOCAL_PATH/archive
 
     # Redis
     REDIS_URL: str
@@ -50,10 +124,41 @@ class Settings(BaseSettings):
     AZURE_OPENAI_API_KEY: str | None = None
     AZURE_OPENAI_ENDPOINT: str | None = None
     AZURE_OPENAI_DEPLOYMENT_NAME: str | None = None
+    AZURE_OPENAI_API_VERSION: str = "2024-02-15-preview"
+    AZURE_OPENAI_MODELS: str | None = None # Comma-separated models the Azure deployment serves; unset = all
+
+    # Routing across OpenAI and Azure OpenAI deployments
+    LLM_DEPLOYMENTS: str | None = None # JSON list of more deployments: name, kind (openai|azure), api_key, endpoint, deployment, api_version, models
+    ROUTER_COOLDOWN_SECONDS: int = 30 # A deployment answering 429/5xx is skipped this long (or for its Retry-After)
+    ROUTER_MAX_ERROR_RATE: float = 0.5 # Above this recent error rate a deployment only gets traffic when all others fail
+    ROUTER_ERROR_HALF_LIFE_SECONDS: int = 60 # The error rate halves this often, so an avoided deployment is tried again
+    ROUTER_EXPLORE_RATE: float = 0.05 # Share of requests sent to another healthy deployment to refresh its latency
     
     # MCP Server
     MCP_SERVER_URL: str
-    
+
+    # Tool calls
+    MAX_TOOL_RETRIES: int = 0 # Opt-in retries, with backoff, when the solver could not be reached or answered 503
+    TOOL_INVOCATION_BATCH_SIZE: int = 50 # Invocation rows buffered per insert during a turn
+
+    # Storage
+    STORAGE_LOCAL_PATH: str = "/app/uploads"
+    DATASET_CACHE_ENTRIES: int = 16 # Parsed tables kept in memory for tool calls
+
+    # Uploads
+    MAX_FILE_SIZE_MB: int = 200
+    MAX_PDF_PAGES: int = 2000
+    UPLOAD_CHUNK_ROWS: int = 5000 # Rows parsed per chunk when streaming tables
+    TABLE_PREVIEW_TOKEN_BUDGET: int = 2000 # Default budget for summary-mode table previews
+    EXTRACTION_CACHE_MAX_MB: int = 1024 # Disk tier size before LRU eviction
+    EXTRACTION_CACHE_REDIS: bool = False
+    EXTRACTION_CACHE_REDIS_MAX_KB: int = 512 # Larger results stay disk-only
+
+    # CPU-bound work executor
+    EXECUTOR_THREAD_WORKERS: int = 8
+    EXECUTOR_PROCESS_WORKERS: int = 2
+    EXECUTOR_QUEUE_LIMIT: int = 64 # Waiting tasks per kind before rejecting
+
     # Observability
     OTEL_SERVICE_NAME: str = "coda-agent-backend"
     OTEL_EXPORTER_OTLP_ENDPOINT: str = "http://localhost:4318"
@@ -1,18 +1,73 @@
+import time
+from uuid import uuid4
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 from typing import AsyncGenerator
 
 # Ensure the URL is asyncpg
 DATABASE_URL = str(settings.DATABASE_URL).replace("postgresql://", "postgresql+asyncpg://")
 
+POOL_CHECKOUT_WAIT = Histogram(
+    "coda_db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool, including opening a new one",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "coda_db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after DATABASE_POOL_TIMEOUT"
+)
+POOL_CHECKED_OUT = Gauge("coda_db_pool_checked_out", "Connections currently checked out of the pool")
+POOL_OVERFLOW = Gauge("coda_db_pool_overflow", "Overflow connections in use beyond DATABASE_POOL_SIZE")
+POOL_SIZE = Gauge("coda_db_pool_size", "Configured pool size")
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long each checkout waited for a connection.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+connect_args = {"prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE}
+if settings.DATABASE_PGBOUNCER:
+    # PgBouncer in transaction mode hands each transaction a different server
+    # connection, so named prepared statements can't be cached or reused
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,  # Set to True for SQL debugging
     future=True,
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    connect_args=connect_args
 )
 
+POOL_SIZE.set(settings.DATABASE_POOL_SIZE)
+POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout())
+POOL_OVERFLOW.set_function(lambda: max(0, engine.pool.overflow()))
+
 async_session_factory = async_sessionmaker(
     engine, 
     class_=AsyncSession, 
@@ -0,0 +1,150 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+QUEUE_WAIT = Histogram(
+    "coda_executor_queue_wait_seconds",
+    "Time a CPU-bound task waited for a worker slot",
+    ["kind"]
+)
+RUN_TIME = Histogram(
+    "coda_executor_run_seconds",
+    "Time a CPU-bound task spent running in its pool",
+    ["kind"]
+)
+IN_FLIGHT = Gauge(
+    "coda_executor_in_flight",
+    "Tasks queued or running per task kind",
+    ["kind"]
+)
+REJECTED = Counter(
+    "coda_executor_rejected_total",
+    "Tasks rejected because the kind's queue was full",
+    ["kind"]
+)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a task kind already has its maximum number of queued tasks."""
+    def __init__(self, kind: str):
+        super().__init__(f"Too many pending '{kind}' tasks, try again shortly")
+        self.kind = kind
+
+
+@dataclass(frozen=True)
+class TaskKind:
+    pool: str         # "thread" for GIL-releasing work, "process" for pure-Python parsing
+    concurrency: int  # Tasks of this kind running at once
+    queue: int        # Tasks allowed to wait for a slot before rejecting
+
+
+# pypdf and tabulate (Markdown tables) are pure Python and hold the GIL, so they get
+# real processes. pandas/pyarrow parsing and tiktoken mostly release the GIL. json
+# holds it, but stays on threads: a worker process would have to pickle the same
+# object across and back, which costs this process about as much as parsing it.
+TASK_KINDS: Dict[str, TaskKind] = {
+    "pdf": TaskKind(pool="process", concurrency=settings.EXECUTOR_PROCESS_WORKERS, queue=settings.EXECUTOR_QUEUE_LIMIT),
+    "render": TaskKind(pool="process", concurrency=settings.EXECUTOR_PROCESS_WORKERS, queue=settings.EXECUTOR_QUEUE_LIMIT),
+    "parse": TaskKind(pool="thread", concurrency=4, queue=settings.EXECUTOR_QUEUE_LIMIT),
+    "tokenize": TaskKind(pool="thread", concurrency=4, queue=settings.EXECUTOR_QUEUE_LIMIT),
+    "json": TaskKind(pool="thread", concurrency=4, queue=settings.EXECUTOR_QUEUE_LIMIT),
+}
+
+_EXHAUSTED = object()
+
+
+class TaskExecutor:
+    """
+    Runs CPU-heavy work off the event loop on shared thread/process pools,
+    with per-kind concurrency limits and bounded waiting queues.
+    """
+    def __init__(self, kinds: Dict[str, TaskKind] = TASK_KINDS):
+        self.kinds = kinds
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pending: Dict[str, int] = {kind: 0 for kind in kinds}
+
+    def _pool(self, name: str) -> Executor:
+        # Pools are created lazily so importing the app never forks
+        if name == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(
+                    max_workers=settings.EXECUTOR_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=settings.EXECUTOR_THREAD_WORKERS,
+                thread_name_prefix="coda-cpu"
+            )
+        return self._threads
+
+    def _semaphore(self, kind: str) -> asyncio.Semaphore:
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.kinds[kind].concurrency)
+        return self._semaphores[kind]
+
+    async def run(self, kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs fn(*args, **kwargs) in the pool for `kind`. Raises ExecutorSaturated
+        instead of queueing without bound.
+        """
+        spec = self.kinds[kind]
+        if self._pending[kind] >= spec.concurrency + spec.queue:
+            REJECTED.labels(kind).inc()
+            raise ExecutorSaturated(kind)
+
+        self._pending[kind] += 1
+        IN_FLIGHT.labels(kind).inc()
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphore(kind):
+                started_at = time.perf_counter()
+                QUEUE_WAIT.labels(kind).observe(started_at - queued_at)
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._pool(spec.pool), partial(fn, *args, **kwargs))
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM on a hostile PDF); start a fresh pool next time
+                    self._processes = None
+                    raise
+                finally:
+                    RUN_TIME.labels(kind).observe(time.perf_counter() - started_at)
+        finally:
+            self._pending[kind] -= 1
+            IN_FLIGHT.labels(kind).dec()
+
+    async def iterate(self, kind: str, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """
+        Drives a blocking iterator one item per task, so each step is scheduled
+        (and limited) like any other task of its kind.
+        """
+        while True:
+            item = await self.run(kind, next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+# Global instance
+task_executor = TaskExecutor()
@@ -54,6 +54,13 @@ You have access to a specific set of high-performance solvers. You MUST use thes
 5. **Interpret**: Explain the solver's output (Objective Value, Variables, Status) in plain English to the user.
 
 If the user provides raw data (CSV, text), parse it carefully into the required JSON format.
+
+### UPLOADED TABLES
+Uploaded CSV/Excel files are stored server-side and announced with a `file_id`. Never re-type their rows into a tool call.
+Wherever a tool expects an array, pass a reference instead: `{"file_id": "<id>", "columns": ["col_a", "col_b"], "rows": [start, stop], "orient": "records"}`.
+- `orient: "records"` gives a list of objects keyed by column name (e.g. assignment entries).
+- `orient: "matrix"` gives a list of row lists (e.g. a distance or cost matrix).
+- `orient: "column"` gives a flat list of one column's values (e.g. a t-test sample).
 """
 
 def get_system_prompt() -> str:
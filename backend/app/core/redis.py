@@ -0,0 +1,22 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+
+_client: Optional[aioredis.Redis] = None
+
+def get_redis() -> aioredis.Redis:
+    """
+    Shared async Redis client. The connection pool is created on first use.
+    """
+    global _client
+    if _client is None:
+        _client = aioredis.from_url(settings.REDIS_URL)
+    return _client
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
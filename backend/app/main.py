@@ -1,9 +1,43 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.api import api_router
 
 from app.core.telemetry import setup_telemetry
+from app.core.executor import task_executor
+from app.core.redis import close_redis
+from app.services.purger import session_purger
+from app.services.partitions import ensure_message_partitions
+from app.services.rollups import rollup_job
+from app.services.sketches import latency_recorder
+from app.services.archive import session_archiver
+from app.services.turns import turn_registry
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_message_partitions()
+    except Exception as e:
+        logger.exception(f"Failed to create message partitions: {e}")
+    if settings.PURGE_ENABLED:
+        session_purger.start()
+    if settings.ROLLUP_ENABLED:
+        rollup_job.start()
+    if settings.ARCHIVE_ENABLED:
+        session_archiver.start()
+    latency_recorder.start()
+    yield
+    await turn_registry.close()
+    await session_archiver.stop()
+    await latency_recorder.stop()
+    await rollup_job.stop()
+    await session_purger.stop()
+    task_executor.shutdown()
+    await close_redis()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -11,6 +45,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url=f"{settings.API_V1_STR}/docs",
     redoc_url=f"{settings.API_V1_STR}/redoc",
+    lifespan=lifespan,
 )
 
 setup_telemetry(app)
@@ -25,6 +60,11 @@ if settings.CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            "X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor", "X-Turn-Id", "Retry-After",
+            "X-RateLimit-Limit-Requests", "X-RateLimit-Remaining-Requests", "X-RateLimit-Reset-Requests",
+            "X-RateLimit-Limit-Tokens", "X-RateLimit-Remaining-Tokens", "X-RateLimit-Reset-Tokens",
+        ],
     )
 
 @app.get("/health")
@@ -1,2 +1,4 @@
 from .session import Session
 from .message import Message
+from .analytics import UsageRollup, ToolRollup, LatencySketch, RollupState
+from .tool_invocation import ToolInvocation
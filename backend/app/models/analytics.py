@@ -0,0 +1,71 @@
+from sqlalchemy import String, DateTime, BigInteger, Integer, Float, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+from typing import Optional
+
+class UsageRollup(Base):
+    """
+    Hourly totals per model. Rows with model '' hold messages without a
+    model (user/tool messages) and the sessions created in that hour.
+    """
+    __tablename__ = "usage_rollup_hourly"
+
+    bucket: Mapped[DateTime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    model: Mapped[str] = mapped_column(String, primary_key=True)
+
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    tokens: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    execution_time_sum: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    execution_time_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+class ToolRollup(Base):
+    """
+    Hourly tool call totals per tool name, folded from tool_invocations.
+    """
+    __tablename__ = "tool_rollup_hourly"
+
+    bucket: Mapped[DateTime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    tool_name: Mapped[str] = mapped_column(String, primary_key=True)
+    calls: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    errors: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    duration_sum: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    duration_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    request_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    response_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    cache_hits: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    retries: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+class LatencySketch(Base):
+    """
+    Hourly latency distribution per metric and dimension (model or tool
+    name, '' for none) as a log-bucketed histogram; see app/services/sketches.py.
+    bins maps bin index -> count.
+    """
+    __tablename__ = "latency_sketches"
+    __table_args__ = (
+        Index("ix_latency_sketches_metric_bucket", "metric", "bucket"),
+    )
+
+    bucket: Mapped[DateTime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    metric: Mapped[str] = mapped_column(String, primary_key=True)
+    dimension: Mapped[str] = mapped_column(String, primary_key=True)
+
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    zero_count: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    sum: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    bins: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default="{}")
+
+class RollupState(Base):
+    """
+    Rows created before `watermark` are counted in the rollup tables;
+    anything newer is aggregated live.
+    """
+    __tablename__ = "rollup_state"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    watermark: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,5 +1,5 @@
-from sqlalchemy import String, DateTime, func, ForeignKey, Text
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import String, DateTime, func, ForeignKey, Text, Index, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 import uuid
 from app.core.database import Base
@@ -10,6 +10,18 @@ if TYPE_CHECKING:
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # History loads, message pages, counts and last-message previews
+        Index("ix_messages_session_created", "session_id", "created_at", "id"),
+        # Tool analytics only scan messages that made tool calls
+        Index("ix_messages_tool_calls_created", "created_at", postgresql_where=text("tool_calls IS NOT NULL")),
+        # Rated messages (feedback also carries thoughts, so filter on the score key)
+        Index("ix_messages_feedback_scored", "created_at", postgresql_where=text("feedback ? 'score'")),
+        # Live tail of the analytics rollups (rows past the watermark)
+        Index("ix_messages_created_at", "created_at"),
+        # Full-text search over user/assistant content
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
@@ -29,6 +41,9 @@ class Message(Base):
     decision_count: Mapped[Optional[int]] = mapped_column(nullable=True) # Number of tool calls/decisions
     status: Mapped[Optional[str]] = mapped_column(nullable=True) # success, error, etc.
     feedback: Mapped[Optional[Any]] = mapped_column(JSONB, nullable=True) # { score: 1|-1, comment: str }
+    model: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Model that produced an assistant message
+    # Maintained by a trigger (user/assistant content only); deferred so history loads skip it
+    search_vector: Mapped[Optional[Any]] = mapped_column(TSVECTOR, nullable=True, deferred=True)
     
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -1,21 +1,52 @@
-from sqlalchemy import Column, String, DateTime, func, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, func, Text, ForeignKey, Integer, Index, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 import uuid
 from app.core.database import Base
-from typing import List, TYPE_CHECKING
+from typing import Any, List, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .message import Message
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+        # Sidebar listing: keyset on (updated_at, id) over live sessions
+        Index("ix_sessions_live_updated", text("updated_at DESC"), text("id DESC"), postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_sessions_created_at", "created_at"),
+        Index("ix_sessions_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title: Mapped[str] = mapped_column(String, nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     context_summary: Mapped[str] = mapped_column(Text, nullable=True) # Summary of older messages
+
+    # Lineage: a fork shares its parent's messages up to fork_cutoff_at instead of copying them.
+    # RESTRICT so a parent can never be removed before its forks are materialized.
+    parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="RESTRICT"), nullable=True, index=True)
+    fork_message_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True) # Message forked from, if any
+    fork_cutoff_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True) # Last inherited created_at
+    inherited_messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0") # Count visible through lineage
+
+    # Soft delete: hidden immediately, rows removed later by the background purger
+    deleted_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Archival: messages and tool invocations of an idle session live in Parquet files
+    # (app/services/archive.py) and this row is a stub until the session is reopened
+    archived_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    archive_path: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Relative to ARCHIVE_STORAGE_URI
+    archived_messages: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0") # Sidebar count while archived
+    archived_preview: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # Sidebar preview while archived
+    archived_last_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    rehydrated_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True) # Not archived again until idle since
+
+    # Title search, maintained by a trigger
+    search_vector: Mapped[Optional[Any]] = mapped_column(TSVECTOR, nullable=True, deferred=True)
     
     # Relationship
-    messages: Mapped[List["Message"]] = relationship("Message", back_populates="session", cascade="all, delete-orphan", lazy="selectin")
+    # Not eager: listing sessions must never pull their messages. Load explicitly with selectinload().
+    # passive_deletes: the FK's ON DELETE CASCADE removes messages, the ORM never loads them to delete.
+    messages: Mapped[List["Message"]] = relationship("Message", back_populates="session", cascade="all, delete-orphan", lazy="select", passive_deletes=True)
@@ -0,0 +1,33 @@
+from sqlalchemy import String, DateTime, Integer, Float, Boolean, ForeignKey, Index, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+import uuid
+from app.core.database import Base
+from typing import Optional
+
+class ToolInvocation(Base):
+    """
+    One row per tool call made by the agent loop.
+    """
+    __tablename__ = "tool_invocations"
+    __table_args__ = (
+        Index("ix_tool_invocations_tool_started", "tool_name", "started_at"),
+        Index("ix_tool_invocations_created_at", "created_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Assistant message that requested the call. No FK: messages may be partitioned (composite key).
+    message_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True, index=True)
+    tool_call_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    tool_name: Mapped[str] = mapped_column(String, nullable=False)
+
+    started_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True) # seconds, including retries
+    status: Mapped[str] = mapped_column(String, nullable=False) # success, error, invalid_arguments
+    request_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    cache_hit: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false")
+    retry_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
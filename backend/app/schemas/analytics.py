@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 class AnalyticsOverview(BaseModel):
@@ -7,9 +8,24 @@ class AnalyticsOverview(BaseModel):
     total_tokens: int
     avg_execution_time: float
 
+class ModelUsage(BaseModel):
+    model: str
+    messages: int
+    tokens: int
+    avg_execution_time: float
+
+class ModelAnalytics(BaseModel):
+    usage: List[ModelUsage]
+
 class ToolUsage(BaseModel):
     tool_name: str
     count: int
+    errors: Optional[int] = None
+    avg_duration: Optional[float] = None # seconds
+    request_bytes: Optional[int] = None
+    response_bytes: Optional[int] = None
+    cache_hits: Optional[int] = None
+    retries: Optional[int] = None
 
 class ToolAnalytics(BaseModel):
     usage: List[ToolUsage]
@@ -20,3 +36,29 @@ class DecisionUsage(BaseModel):
 
 class DecisionAnalytics(BaseModel):
     usage: List[DecisionUsage]
+
+class LatencySummary(BaseModel):
+    dimension: Optional[str] = None # model or tool name; None for all of them
+    count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+
+class LatencyAnalytics(BaseModel):
+    metric: str
+    start: datetime
+    end: datetime
+    overall: LatencySummary
+    by_dimension: List[LatencySummary]
+
+class LatencyPoint(LatencySummary):
+    bucket: datetime
+
+class LatencySeries(BaseModel):
+    metric: str
+    interval: str
+    points: List[LatencyPoint]
@@ -10,3 +10,5 @@ class ChatRequest(BaseModel):
     messages: List[Message]
     model: str = "gpt-4"
     stream: bool = True
+    temperature: Optional[float] = None # Provider default when unset
+    cache: Optional[bool] = None # Completion cache: unset = only at temperature 0
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from uuid import UUID
+from datetime import datetime
+from typing import Literal, Optional
+
+class SearchHit(BaseModel):
+    kind: Literal["message", "session"] # session = the title matched
+    session_id: UUID
+    session_title: Optional[str] = None
+    message_id: Optional[UUID] = None
+    role: Optional[str] = None
+    created_at: datetime
+    rank: float
+    snippet: Optional[str] = None # Matches wrapped in <mark></mark>
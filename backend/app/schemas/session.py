@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from uuid import UUID
 from datetime import datetime
 from typing import Optional, List
@@ -12,13 +12,30 @@ class SessionCreate(SessionBase):
 class ForkSessionRequest(BaseModel):
     message_id: Optional[UUID] = None # If null, fork entire session
 
+class BulkDeleteRequest(BaseModel):
+    session_ids: List[UUID] = Field(..., min_length=1, max_length=1000)
+
+class ImportResult(BaseModel):
+    sessions: int
+    messages: int
+    tool_invocations: int
+    skipped: int # Records whose id already existed
+
 class SessionRead(SessionBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    parent_id: Optional[UUID] = None # Set while a fork shares its parent's history
+    fork_message_id: Optional[UUID] = None
+    archived_at: Optional[datetime] = None # Set while the messages are archived; opening the session restores them
     
     model_config = ConfigDict(from_attributes=True)
 
+class SessionSummary(SessionRead):
+    message_count: int = 0
+    last_activity_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+
 class MessageRead(BaseModel):
     id: UUID
     role: str
@@ -30,6 +47,7 @@ class MessageRead(BaseModel):
     decision_count: Optional[int] = None
     status: Optional[str] = None
     feedback: Optional[dict] = None
+    content_truncated: bool = False # Set by compact message pages
     
     model_config = ConfigDict(from_attributes=True)
 
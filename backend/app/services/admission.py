@@ -0,0 +1,273 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.core.config import settings
+
+LATENCY_ALPHA = 0.2 # Weight of a new TTFT sample in the moving average
+BASELINE_DRIFT = 0.01 # How fast the no-load baseline follows a higher average
+RETRY_AFTER_MAX = 60
+
+LIMIT = Gauge(
+    "coda_admission_limit",
+    "Current adaptive concurrency limit",
+    ["scope", "key"]
+)
+IN_FLIGHT = Gauge(
+    "coda_admission_in_flight",
+    "Chat generations holding a slot",
+    ["scope", "key"]
+)
+QUEUED = Gauge(
+    "coda_admission_queued",
+    "Chat generations waiting for a slot",
+    ["provider"]
+)
+QUEUE_WAIT = Histogram(
+    "coda_admission_queue_wait_seconds",
+    "Time a chat generation waited for a slot",
+    ["provider"]
+)
+REJECTED = Counter(
+    "coda_admission_rejected_total",
+    "Chat generations rejected because the queue was full or the wait timed out",
+    ["provider", "reason"]
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a provider's wait queue is full, or a queued request waited too long."""
+    def __init__(self, provider: str, retry_after: int, reason: str = "queue_full"):
+        super().__init__(f"Too many concurrent requests to {provider}, try again in {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit between floor and ceiling that follows upstream
+    latency: it shrinks by 10% while the TTFT average is above `tolerance`
+    times its no-load baseline, and grows back by about one slot per
+    `limit` healthy samples.
+    """
+    def __init__(self, scope: str, key: str, ceiling: int, floor: int, tolerance: float):
+        self.scope = scope
+        self.key = key
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.tolerance = tolerance
+        self.limit = float(ceiling)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.hold: Optional[float] = None # Average time a slot is held
+        LIMIT.labels(scope, key).set(self.limit)
+
+    @property
+    def available(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def acquire(self):
+        self.in_flight += 1
+        IN_FLIGHT.labels(self.scope, self.key).inc()
+
+    def release(self, held: float):
+        self.in_flight -= 1
+        IN_FLIGHT.labels(self.scope, self.key).dec()
+        self.hold = held if self.hold is None else self.hold + (held - self.hold) * LATENCY_ALPHA
+
+    def observe(self, latency: float) -> bool:
+        """
+        Feeds a TTFT sample. Returns True if a slot opened up.
+        """
+        before = int(self.limit)
+        self.latency = latency if self.latency is None else self.latency + (latency - self.latency) * LATENCY_ALPHA
+        if self.baseline is None or self.latency < self.baseline:
+            self.baseline = self.latency
+        else:
+            self.baseline += (self.latency - self.baseline) * BASELINE_DRIFT
+
+        if self.latency > self.baseline * self.tolerance:
+            self.limit = max(float(self.floor), self.limit * 0.9)
+        else:
+            self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+        LIMIT.labels(self.scope, self.key).set(self.limit)
+        return int(self.limit) > before
+
+
+class Ticket:
+    """
+    A chat generation's place in the admission queue, and then its slot.
+    release() is safe to call more than once.
+    """
+    def __init__(self, controller: "AdmissionController", provider: str, model: str):
+        self.controller = controller
+        self.provider = provider
+        self.model = model
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._changed = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout: float = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS) -> AsyncIterator[int]:
+        """
+        Yields the ticket's queue position (1 = next) whenever it changes,
+        and returns once it holds a slot. Raises AdmissionRejected after
+        `timeout` seconds in the queue.
+        """
+        deadline = self.enqueued_at + timeout
+        position = None
+        while not self.admitted:
+            current = self.controller.position(self)
+            if current != position:
+                position = current
+                yield position
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                if self.admitted:
+                    return
+                retry_after = self.controller.retry_after(self.provider)
+                self.release()
+                REJECTED.labels(self.provider, "timeout").inc()
+                raise AdmissionRejected(self.provider, retry_after, "timeout")
+
+    def observe_latency(self, seconds: float):
+        self.controller.observe(self.provider, self.model, seconds)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self)
+
+
+class AdmissionController:
+    """
+    Limits how many chat generations run at once per provider and per
+    model, each limit adapting to the provider's time to first token.
+    Requests over the limit wait in a bounded FIFO queue per provider;
+    when that is full they are rejected so the client can back off
+    instead of piling up open streams.
+    """
+    def __init__(
+        self,
+        enabled: bool = settings.ADMISSION_ENABLED,
+        provider_limit: int = settings.ADMISSION_PROVIDER_LIMIT,
+        model_limit: int = settings.ADMISSION_MODEL_LIMIT,
+        min_limit: int = settings.ADMISSION_MIN_LIMIT,
+        queue_limit: int = settings.ADMISSION_QUEUE_LIMIT,
+        tolerance: float = settings.ADMISSION_LATENCY_TOLERANCE
+    ):
+        self.enabled = enabled
+        self.provider_limit = provider_limit
+        self.model_limit = model_limit
+        self.min_limit = min_limit
+        self.queue_limit = queue_limit
+        self.tolerance = tolerance
+        self._providers: Dict[str, AdaptiveLimit] = {}
+        self._models: Dict[Tuple[str, str], AdaptiveLimit] = {}
+        self._queues: Dict[str, Deque[Ticket]] = {}
+
+    def _limits(self, provider: str, model: str) -> Tuple[AdaptiveLimit, AdaptiveLimit]:
+        if provider not in self._providers:
+            self._providers[provider] = AdaptiveLimit("provider", provider, self.provider_limit, self.min_limit, self.tolerance)
+            self._queues[provider] = deque()
+        if (provider, model) not in self._models:
+            self._models[(provider, model)] = AdaptiveLimit("model", model, self.model_limit, self.min_limit, self.tolerance)
+        return self._providers[provider], self._models[(provider, model)]
+
+    def _can_admit(self, provider: str, model: str) -> bool:
+        provider_limit, model_limit = self._limits(provider, model)
+        return not self.enabled or (provider_limit.available and model_limit.available)
+
+    def _admit(self, ticket: Ticket):
+        for limit in self._limits(ticket.provider, ticket.model):
+            limit.acquire()
+        ticket.admitted_at = time.monotonic()
+        QUEUE_WAIT.labels(ticket.provider).observe(ticket.admitted_at - ticket.enqueued_at)
+
+    def enqueue(self, provider: str, model: str) -> Ticket:
+        """
+        Takes a slot for a generation, or a place in the queue. Raises
+        AdmissionRejected if the provider's queue is full.
+        """
+        ticket = Ticket(self, provider, model)
+        if not self._can_admit(provider, model) and len(self._queues[provider]) >= self.queue_limit:
+            REJECTED.labels(provider, "queue_full").inc()
+            raise AdmissionRejected(provider, self.retry_after(provider))
+        self._queues[provider].append(ticket)
+        QUEUED.labels(provider).inc()
+        self._drain(provider)
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        for i, queued in enumerate(self._queues[ticket.provider]):
+            if queued is ticket:
+                return i + 1
+        return 0
+
+    def retry_after(self, provider: str) -> int:
+        """
+        Seconds until the queue has room again, estimated from how long
+        slots are held.
+        """
+        limit = self._providers.get(provider)
+        if limit is None or limit.hold is None:
+            return 1
+        waiting = len(self._queues[provider]) + 1
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(limit.hold * waiting / max(int(limit.limit), 1))))
+
+    def release(self, ticket: Ticket):
+        if ticket.admitted:
+            held = time.monotonic() - ticket.admitted_at
+            for limit in self._limits(ticket.provider, ticket.model):
+                limit.release(held)
+        else:
+            try:
+                self._queues[ticket.provider].remove(ticket)
+                QUEUED.labels(ticket.provider).dec()
+            except ValueError:
+                pass
+        self._drain(ticket.provider)
+
+    def observe(self, provider: str, model: str, latency: float):
+        opened = False
+        for limit in self._limits(provider, model):
+            opened = limit.observe(latency) or opened
+        if opened:
+            self._drain(provider)
+
+    def _drain(self, provider: str):
+        # Admits queued tickets in order; one whose model is at its limit
+        # does not hold up other models behind it
+        queue = self._queues[provider]
+        admitted = []
+        for ticket in queue:
+            if self._can_admit(provider, ticket.model):
+                self._admit(ticket)
+                admitted.append(ticket)
+        if not admitted:
+            return
+        for ticket in admitted:
+            queue.remove(ticket)
+            QUEUED.labels(provider).dec()
+        # Admitted tickets stop waiting, the rest have moved up
+        for ticket in admitted + list(queue):
+            ticket._notify()
+
+# Global instance
+admission_controller = AdmissionController()
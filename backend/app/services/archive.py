@@ -0,0 +1,388 @@
+import asyncio
+import json
+import logging
+import posixpath
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from prometheus_client import Counter
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer, Table, Uuid, delete, exists, func, null, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.models.tool_invocation import ToolInvocation
+from app.services import rollups
+
+logger = logging.getLogger(__name__)
+
+# Archive layout: <root>/<yyyy>/<mm>/<session id>/{messages,tool_invocations}.parquet,
+# one zstd-compressed Parquet file per table. The session row stays behind as a stub
+# with enough for the sidebar (message count, last preview) and the relative path.
+SESSIONS_PER_PASS = 50
+ROW_BATCH_SIZE = 1000 # Rows per cursor fetch, Parquet row group and rehydration INSERT
+COMPRESSION = "zstd"
+PREVIEW_CHARS = 120 # Same as the sidebar preview
+
+# Trigger-maintained, rebuilt when rows are inserted back
+SKIPPED_COLUMNS = {"search_vector"}
+
+TABLES = {
+    "messages": Message.__table__,
+    "tool_invocations": ToolInvocation.__table__,
+}
+
+ARCHIVED_SESSIONS = Counter(
+    "coda_archive_sessions_total",
+    "Sessions moved to the archive or rehydrated from it",
+    ["action"]
+)
+RECLAIMED_BYTES = Counter(
+    "coda_archive_reclaimed_bytes_total",
+    "Row bytes removed from the hot tables by archiving"
+)
+
+
+@lru_cache
+def _storage() -> Tuple[pafs.FileSystem, str]:
+    # A local path, file://, s3:// or gs:// URI; credentials come from the environment
+    uri = settings.ARCHIVE_STORAGE_URI or posixpath.join(settings.STORAGE_LOCAL_PATH, "archive")
+    return pafs.FileSystem.from_uri(uri)
+
+
+def _columns(table: Table):
+    return [c for c in table.columns if c.name not in SKIPPED_COLUMNS]
+
+
+def _arrow_type(column) -> pa.DataType:
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    # UUIDs as text, JSON serialized
+    return pa.string()
+
+
+@lru_cache
+def _schema(name: str) -> pa.Schema:
+    return pa.schema([pa.field(c.name, _arrow_type(c)) for c in _columns(TABLES[name])])
+
+
+def _to_arrow(name: str, rows: List[Dict[str, Any]]) -> pa.RecordBatch:
+    columns = _columns(TABLES[name])
+    for row in rows:
+        for c in columns:
+            value = row[c.name]
+            if value is None:
+                continue
+            if isinstance(c.type, Uuid):
+                row[c.name] = str(value)
+            elif isinstance(c.type, JSON):
+                row[c.name] = json.dumps(value, ensure_ascii=False)
+    return pa.RecordBatch.from_pylist(rows, schema=_schema(name))
+
+
+def _from_arrow(name: str, batch: pa.RecordBatch) -> List[Dict[str, Any]]:
+    columns = {c.name: c for c in _columns(TABLES[name])}
+    rows = batch.to_pylist()
+    for row in rows:
+        for key, value in row.items():
+            if value is None:
+                continue
+            if isinstance(columns[key].type, Uuid):
+                row[key] = UUID(value)
+            elif isinstance(columns[key].type, JSON):
+                row[key] = json.loads(value)
+    return rows
+
+
+async def read_archive(archive_path: str) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Yields (table name, rows) batches of an archived session, decoded to the
+    values the database would return. Reads ROW_BATCH_SIZE rows at a time.
+    """
+    fs, root = _storage()
+    for name in TABLES:
+        path = posixpath.join(root, archive_path, f"{name}.parquet")
+        info = await asyncio.to_thread(fs.get_file_info, path)
+        if info.type == pafs.FileType.NotFound:
+            continue # The session had no rows in this table
+        source = await asyncio.to_thread(fs.open_input_file, path)
+        try:
+            batches = pq.ParquetFile(source).iter_batches(batch_size=ROW_BATCH_SIZE)
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                yield name, _from_arrow(name, batch)
+        finally:
+            source.close()
+
+
+async def _write_table(db: AsyncSession, fs: pafs.FileSystem, path: str, name: str, session_id: UUID) -> Tuple[int, int]:
+    """
+    Streams a session's rows of one table into a Parquet file, created only
+    if there are any. Returns the number of rows and their size in the
+    table (pg_column_size of each row).
+    """
+    table = TABLES[name]
+    query = (
+        select(*_columns(table), func.pg_column_size(table.table_valued()).label("_row_bytes"))
+        .where(table.c.session_id == session_id)
+        .order_by(table.c.created_at, table.c.id)
+        .execution_options(yield_per=ROW_BATCH_SIZE)
+    )
+    count = row_bytes = 0
+    sink = writer = None
+    try:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            if writer is None:
+                sink = await asyncio.to_thread(fs.open_output_stream, path)
+                writer = pq.ParquetWriter(sink, _schema(name), compression=COMPRESSION)
+            rows = [row._asdict() for row in partition]
+            row_bytes += sum(row.pop("_row_bytes") for row in rows)
+            count += len(rows)
+            await asyncio.to_thread(writer.write_batch, _to_arrow(name, rows))
+    finally:
+        if writer is not None:
+            await asyncio.to_thread(writer.close)
+            await asyncio.to_thread(sink.close)
+    return count, row_bytes
+
+
+def idle_sessions(cutoff: datetime):
+    """
+    Live, unarchived sessions with messages but no activity since cutoff.
+    Sessions with forks (even deleted ones) are never archived: forks read
+    their parent's rows in place, so every ancestor stays in the hot tables.
+    """
+    child = aliased(Session)
+    return select(Session).where(
+        Session.archived_at.is_(None),
+        Session.deleted_at.is_(None),
+        Session.updated_at < cutoff,
+        or_(Session.rehydrated_at.is_(None), Session.rehydrated_at < cutoff),
+        ~exists().where(child.parent_id == Session.id),
+        ~exists().where(Message.session_id == Session.id, Message.created_at >= cutoff),
+        ~exists().where(ToolInvocation.session_id == Session.id, ToolInvocation.created_at >= cutoff),
+        exists().where(Message.session_id == Session.id)
+    )
+
+
+async def archive_session(session_id: UUID, cutoff: datetime) -> Optional[Dict[str, int]]:
+    """
+    Moves one session's messages and tool invocations into Parquet files and
+    deletes them from the hot tables, in one transaction. The session row is
+    locked first, so chat turns and forks (which take a share lock on it)
+    wait, and eligibility is checked again after the lock. Returns None if
+    the session no longer qualifies.
+
+    The analytics rollups keep counting archived rows: only rows below the
+    watermark are archived (see SessionArchiver.archive_once).
+    """
+    fs, root = _storage()
+    async with async_session_factory() as db:
+        await db.execute(select(Session.id).where(Session.id == session_id).with_for_update())
+        # A new statement, so it sees whatever committed while we waited for the lock
+        session = await db.scalar(idle_sessions(cutoff).where(Session.id == session_id))
+        if session is None:
+            return None
+
+        archive_path = f"{session.created_at:%Y/%m}/{session.id}"
+        prefix = posixpath.join(root, archive_path)
+        last = (await db.execute(
+            select(func.left(Message.content, PREVIEW_CHARS), Message.created_at)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+        )).first()
+
+        report = {"messages": 0, "tool_invocations": 0, "bytes_reclaimed": 0, "bytes_written": 0}
+        try:
+            await asyncio.to_thread(fs.create_dir, prefix, recursive=True)
+            for name in TABLES:
+                path = posixpath.join(prefix, f"{name}.parquet")
+                count, row_bytes = await _write_table(db, fs, path, name, session_id)
+                report[name] = count
+                report["bytes_reclaimed"] += row_bytes
+                if count:
+                    report["bytes_written"] += (await asyncio.to_thread(fs.get_file_info, path)).size
+
+            for table in TABLES.values():
+                await db.execute(delete(table).where(table.c.session_id == session_id))
+            await db.execute(
+                update(Session)
+                .where(Session.id == session_id)
+                .values(
+                    archived_at=func.now(),
+                    archive_path=archive_path,
+                    archived_messages=report["messages"],
+                    archived_preview=last[0],
+                    archived_last_at=last[1],
+                    updated_at=Session.updated_at
+                )
+            )
+            await db.commit()
+        except BaseException:
+            # Never leave files behind that no stub points to
+            try:
+                await asyncio.to_thread(fs.delete_dir, prefix)
+            except OSError:
+                pass
+            raise
+
+    ARCHIVED_SESSIONS.labels("archived").inc()
+    RECLAIMED_BYTES.inc(report["bytes_reclaimed"])
+    return report
+
+
+async def rehydrate(session_id: UUID) -> bool:
+    """
+    Inserts an archived session's rows back into the hot tables (ids and
+    timestamps unchanged, rollups untouched since they never dropped them)
+    and clears the stub. Safe to race: the session row is locked and
+    already-present rows are skipped. Returns False if it was not archived.
+    """
+    fs, root = _storage()
+    async with async_session_factory() as db:
+        session = await db.scalar(select(Session).where(Session.id == session_id).with_for_update())
+        if session is None or session.archived_at is None:
+            return False
+        archive_path = session.archive_path
+
+        async for name, rows in read_archive(archive_path):
+            table = TABLES[name]
+            json_columns = [c.name for c in _columns(table) if isinstance(c.type, JSON)]
+            for row in rows:
+                for key in json_columns:
+                    if row[key] is None:
+                        row[key] = null() # SQL NULL, not a JSON 'null'
+            await db.execute(pg_insert(table).values(rows).on_conflict_do_nothing())
+
+        await db.execute(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(
+                archived_at=None,
+                archive_path=None,
+                archived_messages=0,
+                archived_preview=None,
+                archived_last_at=None,
+                rehydrated_at=func.now(),
+                updated_at=Session.updated_at
+            )
+        )
+        await db.commit()
+
+    try:
+        await asyncio.to_thread(fs.delete_dir, posixpath.join(root, archive_path))
+    except OSError as e:
+        logger.warning(f"Could not remove archive {archive_path}: {e}")
+    ARCHIVED_SESSIONS.labels("rehydrated").inc()
+    logger.info(f"Rehydrated session {session_id} from {archive_path}")
+    return True
+
+
+async def ensure_hot(db: AsyncSession, session_id: UUID, lock: bool = False) -> Optional[Session]:
+    """
+    Loads a session, rehydrating it first if it is archived (and not deleted).
+    lock=True takes a share lock on the row until the caller commits, which
+    keeps the archiver out while new messages or forks are written.
+    """
+    options = {"with_for_update": {"read": True}, "populate_existing": True} if lock else {}
+    session = await db.get(Session, session_id, **options)
+    if session is None or session.archived_at is None or session.deleted_at is not None:
+        return session
+    if lock:
+        # Our share lock would block the rehydration
+        await db.rollback()
+    await rehydrate(session_id)
+    # rehydrated_at keeps it from being archived again right away
+    return await db.get(Session, session_id, **{**options, "populate_existing": True})
+
+
+class SessionArchiver:
+    """
+    Background task that moves sessions idle for ARCHIVE_IDLE_DAYS out of the
+    hot tables into Parquet files, one session per transaction.
+    """
+    def __init__(
+        self,
+        interval: int = settings.ARCHIVE_INTERVAL_SECONDS,
+        idle_days: int = settings.ARCHIVE_IDLE_DAYS
+    ):
+        self.interval = interval
+        self.idle_days = idle_days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.archive_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Session archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def archive_once(self, limit: int = SESSIONS_PER_PASS) -> Dict[str, int]:
+        """
+        Archives up to `limit` of the longest-idle sessions and returns the
+        totals. bytes_reclaimed is the size of the deleted rows (reusable
+        once autovacuum has run); bytes_written the size of the Parquet files.
+        """
+        totals = {"sessions": 0, "messages": 0, "tool_invocations": 0, "bytes_reclaimed": 0, "bytes_written": 0}
+        async with async_session_factory() as db:
+            watermark = await rollups.get_watermark(db)
+            if watermark is None:
+                # Rows above the watermark are not in the rollups yet and would be lost from analytics
+                logger.info("Analytics rollups not initialized yet, skipping archival")
+                return totals
+            cutoff = min(datetime.now(timezone.utc) - timedelta(days=self.idle_days), watermark)
+            result = await db.execute(
+                idle_sessions(cutoff).with_only_columns(Session.id).order_by(Session.updated_at).limit(limit)
+            )
+            session_ids = result.scalars().all()
+
+        for session_id in session_ids:
+            report = await archive_session(session_id, cutoff)
+            if report is None:
+                continue
+            totals["sessions"] += 1
+            for key, value in report.items():
+                totals[key] += value
+
+        if totals["sessions"]:
+            logger.info(
+                f"Archived {totals['sessions']} sessions ({totals['messages']} messages, "
+                f"{totals['tool_invocations']} tool invocations): reclaimed {totals['bytes_reclaimed'] / 2**20:.1f} MB "
+                f"from hot tables, wrote {totals['bytes_written'] / 2**20:.1f} MB of Parquet"
+            )
+        return totals
+
+# Global instance
+session_archiver = SessionArchiver()
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import orjson
+from prometheus_client import Counter
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1 # Bump when the recorded event format changes
+REDIS_PREFIX = "coda:completion:"
+
+LOOKUPS = Counter(
+    "coda_completion_cache_lookups_total",
+    "Chat turns by completion cache outcome",
+    ["status"]
+)
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The parts of a prompt that decide the completion, with whitespace and
+    line-ending differences that do not matter taken out.
+    """
+    normalized = []
+    for message in messages:
+        entry = {"role": message["role"]}
+        content = message.get("content")
+        if content:
+            entry["content"] = content.replace("\r\n", "\n").strip()
+        if message.get("tool_calls"):
+            entry["tool_calls"] = message["tool_calls"]
+        if message.get("tool_call_id"):
+            entry["tool_call_id"] = message["tool_call_id"]
+        normalized.append(entry)
+    return normalized
+
+
+class CompletionRecorder:
+    """
+    Collects the provider events of one turn. Usage is left out (a replay
+    costs no tokens) and tool invocations are marked as served from cache.
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Dict[str, Any]] = []
+
+    def add(self, event: Dict[str, Any]):
+        if event.get("type") == "usage":
+            return
+        if event.get("type") == "tool_invocation":
+            invocation = {k: v for k, v in event["invocation"].items() if k != "started_at"}
+            invocation.update(cache_hit=True, duration=None, retry_count=0)
+            event = {"type": "tool_invocation", "invocation": invocation}
+        self.events.append(event)
+
+
+class CompletionCache:
+    """
+    Exact-match cache of chat turns: the provider event stream (content,
+    thoughts, persisted tool messages) keyed by a hash of the normalized
+    prompt, model, temperature and tool catalog version. Kept in an
+    in-process LRU, optionally shared through Redis.
+    """
+    def __init__(
+        self,
+        enabled: bool = settings.COMPLETION_CACHE_ENABLED,
+        entries: int = settings.COMPLETION_CACHE_ENTRIES,
+        use_redis: bool = settings.COMPLETION_CACHE_REDIS,
+        ttl: int = settings.COMPLETION_CACHE_TTL_SECONDS,
+        max_bytes: int = settings.COMPLETION_CACHE_MAX_KB * 1024
+    ):
+        self.enabled = enabled
+        self.entries = entries
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def applies(self, temperature: Optional[float], opt_in: Optional[bool]) -> bool:
+        """
+        Only deterministic requests (temperature 0) are served from cache,
+        unless the request says otherwise. Without a temperature the
+        provider default (above 0) applies.
+        """
+        if not self.enabled:
+            return False
+        if opt_in is not None:
+            return opt_in
+        return temperature == 0
+
+    def key(self, messages: List[Dict[str, Any]], model: str, temperature: Optional[float], tools_version: str) -> str:
+        payload = {
+            "v": CACHE_VERSION,
+            "messages": normalize_messages(messages),
+            "model": model,
+            "temperature": temperature,
+            "tools": tools_version,
+        }
+        return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        data = self._local.get(key)
+        if data is not None:
+            self._local.move_to_end(key)
+        elif self.use_redis:
+            try:
+                data = await get_redis().get(REDIS_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"Completion cache Redis lookup failed: {e}")
+            if data is not None:
+                self._remember(key, data)
+        # Decoded per hit, so a replay can never alter the stored entry
+        return orjson.loads(data) if data is not None else None
+
+    async def put(self, recorder: CompletionRecorder):
+        data = orjson.dumps(recorder.events)
+        if len(data) > self.max_bytes:
+            return
+        self._remember(recorder.key, data)
+        if self.use_redis:
+            try:
+                await get_redis().set(REDIS_PREFIX + recorder.key, data, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Completion cache Redis write failed: {e}")
+
+    def _remember(self, key: str, data: bytes):
+        self._local[key] = data
+        self._local.move_to_end(key)
+        while len(self._local) > self.entries:
+            self._local.popitem(last=False)
+
+
+async def replay(events: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Yields recorded provider events as a provider stream would, without pauses."""
+    for event in events:
+        if event.get("type") == "tool_invocation":
+            event["invocation"]["started_at"] = datetime.now(timezone.utc)
+        yield event
+
+# Global instance
+completion_cache = CompletionCache()
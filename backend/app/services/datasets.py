@@ -0,0 +1,242 @@
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from app.core.config import settings
+
+DATASETS_DIR = Path(settings.STORAGE_LOCAL_PATH) / "datasets"
+
+# Keys a data reference may carry. Any other key means the object is regular tool input.
+DATA_REF_KEYS = {"file_id", "columns", "rows", "orient"}
+
+# JSON schema advertised to the LLM wherever a tool accepts an array
+DATA_REF_SCHEMA = {
+    "type": "object",
+    "description": (
+        "Reference to an uploaded table instead of inline data. "
+        "The server expands it into the real array before calling the solver."
+    ),
+    "properties": {
+        "file_id": {"type": "string", "description": "file_id returned by the file upload."},
+        "columns": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Columns to select, in order. Defaults to all columns."
+        },
+        "rows": {
+            "type": "array",
+            "items": {"type": "integer"},
+            "description": "Half-open [start, stop) row range. Defaults to all rows."
+        },
+        "orient": {
+            "type": "string",
+            "enum": ["records", "matrix", "column"],
+            "description": "records: list of objects, matrix: list of row lists, column: flat list of a single column."
+        }
+    },
+    "required": ["file_id"]
+}
+
+
+class DataRefError(ValueError):
+    """Raised when a data reference points at a missing file, column or row range."""
+
+
+class DatasetStore:
+    """
+    Keeps uploaded tables server-side as Parquet files keyed by file_id so
+    tool calls can reference them instead of inlining the data.
+    """
+    def __init__(self, root: Path = DATASETS_DIR, cache_entries: int = settings.DATASET_CACHE_ENTRIES):
+        self.root = root
+        self.cache_entries = cache_entries
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        # load() runs on several executor threads at once
+        self._lock = threading.Lock()
+
+    def _data_dir(self, file_id: str) -> Path:
+        return self.root / file_id
+
+    def _meta_path(self, file_id: str) -> Path:
+        return self.root / f"{file_id}.json"
+
+    def writer(self, filename: str) -> "DatasetWriter":
+        """
+        Opens an incremental writer so large tables can be stored chunk by chunk.
+        """
+        return DatasetWriter(self, uuid.uuid4().hex, filename)
+
+    def save(self, df: pd.DataFrame, filename: str) -> Dict[str, Any]:
+        """
+        Persists a parsed table and returns its descriptor.
+        """
+        writer = self.writer(filename)
+        writer.write(df)
+        return writer.close()
+
+    def describe(self, file_id: str) -> Optional[Dict[str, Any]]:
+        meta_path = self._meta_path(file_id)
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    def load(self, file_id: str) -> pd.DataFrame:
+        with self._lock:
+            df = self._frames.get(file_id)
+            if df is not None:
+                self._frames.move_to_end(file_id)
+                return df
+
+        # file_id is user-controlled, never let it escape the datasets directory
+        if not file_id.isalnum():
+            raise DataRefError(f"Invalid file_id '{file_id}'")
+
+        parts = sorted(self._data_dir(file_id).glob("part-*.parquet"))
+        if not parts:
+            raise DataRefError(f"Unknown file_id '{file_id}'")
+
+        # Read outside the lock; two threads missing at once both read, the last one is kept.
+        # concat promotes dtypes that drifted between chunks (e.g. int -> float)
+        df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        self._remember(file_id, df)
+        return df
+
+    def _remember(self, file_id: str, df: pd.DataFrame):
+        with self._lock:
+            self._frames[file_id] = df
+            self._frames.move_to_end(file_id)
+            while len(self._frames) > self.cache_entries:
+                self._frames.popitem(last=False)
+
+    def resolve(self, ref: Dict[str, Any]) -> List[Any]:
+        """
+        Materializes a single data reference into plain JSON values.
+        """
+        df = self.load(str(ref["file_id"]))
+
+        columns = ref.get("columns") or list(df.columns)
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise DataRefError(f"Unknown column(s) {missing} in file '{ref['file_id']}'")
+
+        rows = ref.get("rows")
+        if rows:
+            if len(rows) != 2:
+                raise DataRefError("'rows' must be a [start, stop) pair")
+            df = df.iloc[rows[0]:rows[1]]
+
+        frame = df[columns]
+        orient = ref.get("orient", "records")
+
+        # Round-trip through to_json so numpy scalars, NaN and timestamps become plain JSON
+        if orient == "records":
+            return json.loads(frame.to_json(orient="records", date_format="iso"))
+        elif orient == "matrix":
+            return json.loads(frame.to_json(orient="values", date_format="iso"))
+        elif orient == "column":
+            if len(columns) != 1:
+                raise DataRefError("orient 'column' requires exactly one column")
+            return json.loads(frame[columns[0]].to_json(orient="values", date_format="iso"))
+        raise DataRefError(f"Unknown orient '{orient}'")
+
+    def expand_refs(self, value: Any) -> Any:
+        """
+        Recursively replaces data references inside tool arguments with their data.
+        """
+        if isinstance(value, dict):
+            if is_data_ref(value):
+                return self.resolve(value)
+            return {k: self.expand_refs(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.expand_refs(v) for v in value]
+        return value
+
+
+class DatasetWriter:
+    """
+    Writes one Parquet part per chunk so peak memory stays at a single chunk.
+    """
+    def __init__(self, store: DatasetStore, file_id: str, filename: str):
+        self.store = store
+        self.file_id = file_id
+        self.filename = filename
+        self.rows = 0
+        self.parts = 0
+        self.dtypes: Dict[str, str] = {}
+        self.directory = store._data_dir(file_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def write(self, df: pd.DataFrame):
+        # Parquet requires string column names
+        df = df.rename(columns=str)
+        df.to_parquet(self.directory / f"part-{self.parts:05d}.parquet", index=False)
+        for col, dtype in df.dtypes.items():
+            self.dtypes.setdefault(col, str(dtype))
+        self.rows += len(df)
+        self.parts += 1
+
+    def close(self) -> Dict[str, Any]:
+        info = {
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "rows": self.rows,
+            "columns": list(self.dtypes.keys()),
+            "dtypes": self.dtypes
+        }
+        with open(self.store._meta_path(self.file_id), "w") as f:
+            json.dump(info, f)
+        return info
+
+
+def is_data_ref(value: Any) -> bool:
+    return isinstance(value, dict) and "file_id" in value and set(value.keys()) <= DATA_REF_KEYS
+
+
+def describe_for_prompt(info: Dict[str, Any]) -> str:
+    """
+    One-line note placed above an uploaded table so the model knows it can reference it.
+    """
+    file_id = info["file_id"]
+    return (
+        f"[Table stored server-side: file_id={file_id}, rows={info['rows']}, "
+        f"columns={json.dumps(info['columns'])}. Pass "
+        f'{{"file_id": "{file_id}", "columns": [...], "rows": [start, stop], "orient": "records|matrix|column"}}'
+        " in place of any array tool argument instead of copying the data.]"
+    )
+
+
+def with_data_refs(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns a copy of a tool parameter schema where every top-most array also
+    accepts a data reference, including arrays held in maps
+    (additionalProperties) and in the objects of other arrays.
+    """
+    if not isinstance(schema, dict):
+        return schema
+
+    if schema.get("type") == "array":
+        items = schema.get("items")
+        if isinstance(items, dict) and items.get("type") != "array":
+            # Objects in the array may have array fields of their own; nested
+            # arrays (matrices) are covered by referencing the outer one
+            schema = {**schema, "items": with_data_refs(items)}
+        wrapped = {"anyOf": [schema, DATA_REF_SCHEMA]}
+        if "description" in schema:
+            wrapped["description"] = schema["description"]
+        return wrapped
+
+    result = dict(schema)
+    if isinstance(schema.get("properties"), dict):
+        result["properties"] = {k: with_data_refs(v) for k, v in schema["properties"].items()}
+    if isinstance(schema.get("additionalProperties"), dict):
+        result["additionalProperties"] = with_data_refs(schema["additionalProperties"])
+    return result
+
+# Global instance
+dataset_store = DatasetStore()
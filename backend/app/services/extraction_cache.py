@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+from app.core.config import settings
+from app.core.executor import task_executor
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(settings.STORAGE_LOCAL_PATH) / "extraction_cache"
+REDIS_PREFIX = "coda:extract:"
+
+
+class CacheRecorder:
+    """
+    Writes extraction events to a temp file as they are produced. The entry
+    only becomes visible on commit(), so failed or partial extractions are never cached.
+    """
+    def __init__(self, cache: "ExtractionCache", key: str):
+        self.cache = cache
+        self.key = key
+        cache.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache.root, suffix=".tmp")
+        self.tmp_path = Path(tmp_path)
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def add(self, event: dict):
+        self._file.write(json.dumps(event) + "\n")
+
+    async def commit(self):
+        self._file.close()
+        path = self.cache._path(self.key)
+        os.replace(self.tmp_path, path)
+        await self.cache._after_commit(self.key, path)
+
+    def abort(self):
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of upload extraction results, keyed by the SHA-256
+    of the file bytes plus the parser version. Entries are NDJSON event logs
+    on local disk (size-bounded LRU by mtime), optionally mirrored to Redis.
+    """
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        max_bytes: int = settings.EXTRACTION_CACHE_MAX_MB * 1024 * 1024,
+        use_redis: bool = settings.EXTRACTION_CACHE_REDIS
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.use_redis = use_redis
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.ndjson"
+
+    async def lookup(self, key: str) -> Optional[Path]:
+        """
+        Returns the path of a cached event log, pulling it from Redis into the
+        disk tier if needed. Touches the entry so LRU eviction keeps it.
+        """
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+            return path
+
+        if not self.use_redis:
+            return None
+
+        try:
+            data = await get_redis().get(REDIS_PREFIX + key)
+        except Exception as e:
+            logger.warning(f"Extraction cache Redis lookup failed: {e}")
+            return None
+        if data is None:
+            return None
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        await task_executor.run("parse", _write_atomic, path, data)
+        return path
+
+    async def last_event(self, path: Path) -> dict:
+        """
+        Reads only the trailing 'done' event of a cached log.
+        """
+        return await task_executor.run("parse", _read_last_event, path)
+
+    def replay(self, path: Path) -> AsyncIterator[dict]:
+        return task_executor.iterate("parse", _iter_events(path))
+
+    def recorder(self, key: str) -> CacheRecorder:
+        return CacheRecorder(self, key)
+
+    async def _after_commit(self, key: str, path: Path):
+        if self.use_redis and path.stat().st_size <= settings.EXTRACTION_CACHE_REDIS_MAX_KB * 1024:
+            try:
+                data = await task_executor.run("parse", path.read_bytes)
+                await get_redis().set(REDIS_PREFIX + key, data, ex=settings.REDIS_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Extraction cache Redis write failed: {e}")
+
+        await task_executor.run("parse", self._evict)
+
+    def _evict(self):
+        """
+        Deletes least recently used entries until the disk tier fits max_bytes.
+        """
+        entries = []
+        total = 0
+        for entry in self.root.glob("*.ndjson"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _read_last_event(path: Path) -> dict:
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        block = 4096
+        while True:
+            start = max(0, end - block)
+            f.seek(start)
+            lines = f.read(end - start).rstrip(b"\n").rsplit(b"\n", 1)
+            if len(lines) == 2 or start == 0:
+                return json.loads(lines[-1])
+            block *= 2
+
+
+def _iter_events(path: Path) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+# Global instance
+extraction_cache = ExtractionCache()
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+from typing import Any, List, Optional
+from uuid import UUID
+
+from sqlalchemy import Select, String, cast, func, insert, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.services import rollups
+
+logger = logging.getLogger(__name__)
+
+# Columns copied when materializing inherited messages (everything except id and session_id)
+COPIED_COLUMNS = (
+    "role", "content", "tool_calls", "tool_call_id", "token_count",
+    "execution_time", "decision_count", "status", "feedback", "model", "created_at"
+)
+
+
+def copy_id(session_id: UUID, message_id: UUID) -> UUID:
+    """
+    Id of the copy of inherited message message_id made when session_id is
+    materialized. Derived from both ids, so ids a client still holds from
+    before the copy can be mapped to the session's own rows.
+    """
+    return UUID(hashlib.md5(f"{session_id}:{message_id}".encode()).hexdigest())
+
+
+def lineage(session_id: UUID):
+    """
+    Recursive CTE of a session and its ancestors. Each row carries
+    visible_until: the latest created_at of that session's messages the
+    starting session can see (NULL = all, for the session itself).
+    """
+    chain = (
+        select(
+            Session.id,
+            Session.parent_id,
+            Session.fork_cutoff_at,
+            literal(None).cast(Session.fork_cutoff_at.type).label("visible_until"),
+            literal(0).label("depth")
+        )
+        .where(Session.id == session_id)
+        .cte("lineage", recursive=True)
+    )
+    parent = aliased(Session)
+    return chain.union_all(
+        select(
+            parent.id,
+            parent.parent_id,
+            parent.fork_cutoff_at,
+            # LEAST ignores NULLs, so the tightest cutoff along the chain wins
+            func.least(chain.c.visible_until, chain.c.fork_cutoff_at),
+            chain.c.depth + 1
+        )
+        .join(chain, parent.id == chain.c.parent_id)
+    )
+
+
+def history_select(session_id: UUID, *columns: Any, inherited_only: bool = False) -> Select:
+    """
+    SELECT over every message visible in a session, its own plus those
+    inherited through forks. Callers add ordering, cursors and limits.
+    Passing columns projects them instead of loading Message entities.
+    """
+    chain = lineage(session_id)
+    query = (
+        select(*(columns or (Message,)))
+        .select_from(Message)
+        .join(chain, Message.session_id == chain.c.id)
+        .where(or_(chain.c.visible_until.is_(None), Message.created_at <= chain.c.visible_until))
+    )
+    if inherited_only:
+        query = query.where(chain.c.depth > 0)
+    return query
+
+
+async def load_history(db: AsyncSession, session_id: UUID) -> List[Message]:
+    result = await db.execute(
+        history_select(session_id).order_by(Message.created_at, Message.id)
+    )
+    return list(result.scalars().all())
+
+
+async def lineage_depth(db: AsyncSession, session_id: UUID) -> int:
+    chain = lineage(session_id)
+    return await db.scalar(select(func.max(chain.c.depth)))
+
+
+async def materialize(db: AsyncSession, session_id: UUID) -> int:
+    """
+    Copies a fork's inherited messages into the session itself with a single
+    INSERT ... SELECT and detaches it from its parent. Original timestamps
+    are kept, so ordering and the cutoffs of the fork's own forks still hold.
+    Returns the number of rows copied (0 if it was not a fork, or another
+    worker got there first). Does not commit.
+    """
+    # The background compaction and the purgers of other workers may be materializing
+    # the same fork: lock its row and only copy if it is still attached
+    parent_id = await db.scalar(select(Session.parent_id).where(Session.id == session_id).with_for_update())
+    if parent_id is None:
+        return 0
+
+    # The copies keep their old timestamps, so they land below the analytics watermark
+    await rollups.apply_messages(db, history_select(session_id, *rollups.MESSAGE_COLUMNS, inherited_only=True), 1)
+
+    source = history_select(
+        session_id,
+        # Same as copy_id()
+        func.md5(func.concat(str(session_id), ":", cast(Message.id, String))).cast(Message.id.type),
+        literal(session_id, Message.session_id.type),
+        *(getattr(Message, c) for c in COPIED_COLUMNS),
+        inherited_only=True
+    )
+    result = await db.execute(
+        insert(Message).from_select(["id", "session_id", *COPIED_COLUMNS], source)
+    )
+    await db.execute(
+        update(Session)
+        .where(Session.id == session_id)
+        .values(parent_id=None, fork_cutoff_at=None, inherited_messages=0, updated_at=Session.updated_at)
+    )
+    return result.rowcount
+
+
+async def own_message(db: AsyncSession, session_id: UUID, message_id: UUID) -> Optional[Message]:
+    """
+    The session's own row for a message it shows, to be changed without
+    touching the sessions that share it. A message the session inherits
+    through a fork is copied first (the fork is materialized and the
+    transaction committed). Also accepts the id an inherited message had
+    before the session was materialized.
+    """
+    owner = await db.scalar(history_select(session_id, Message.session_id).where(Message.id == message_id))
+    if owner is None:
+        return await db.get(Message, copy_id(session_id, message_id))
+    if owner == session_id:
+        return await db.get(Message, message_id)
+    copied = await materialize(db, session_id)
+    await db.commit()
+    logger.info(f"Materialized fork {session_id} before changing inherited message {message_id}: copied {copied} messages")
+    return await db.get(Message, copy_id(session_id, message_id))
+
+
+async def materialize_children(db: AsyncSession, session_id: UUID) -> int:
+    """
+    Materializes the live direct forks of a session so it can be purged.
+    Deeper descendants keep pointing at those (now self-contained) forks.
+    """
+    result = await db.execute(
+        select(Session.id).where(Session.parent_id == session_id, Session.deleted_at.is_(None))
+    )
+    children = result.scalars().all()
+    for child_id in children:
+        await materialize(db, child_id)
+    return len(children)
+
+
+async def materialize_in_background(session_id: UUID):
+    """
+    Background-task entry point: compacts one fork in its own transaction.
+    """
+    async with async_session_factory() as db:
+        copied = await materialize(db, session_id)
+        await db.commit()
+        logger.info(f"Materialized fork {session_id}: copied {copied} inherited messages")
+
+
+async def fork(db: AsyncSession, source: Session, message_id: Optional[UUID] = None) -> Session:
+    """
+    Creates a fork of source that shares its history up to message_id
+    (or all of it) by reference. No messages are copied. Does not commit.
+    """
+    cutoff_at = None
+    if message_id:
+        cutoff_at = await db.scalar(
+            history_select(source.id, Message.created_at).where(Message.id == message_id)
+        )
+    if cutoff_at is None:
+        # Unknown or no message id: fork the whole conversation as it is now
+        message_id = None
+        cutoff_at = await db.scalar(history_select(source.id, func.max(Message.created_at)))
+
+    inherited = 0
+    if cutoff_at is not None:
+        inherited = await db.scalar(
+            history_select(source.id, func.count()).where(Message.created_at <= cutoff_at)
+        )
+
+    new_session = Session(
+        title=f"Fork of {source.title}"[:100],
+        context_summary=source.context_summary,
+        parent_id=source.id if inherited else None,
+        fork_message_id=message_id,
+        fork_cutoff_at=cutoff_at if inherited else None,
+        inherited_messages=inherited
+    )
+    db.add(new_session)
+    await db.flush()
+    return new_session
+
+
+async def needs_compaction(db: AsyncSession, session_id: UUID) -> bool:
+    """
+    Long fork chains make every history read walk more sessions; past
+    FORK_MATERIALIZE_DEPTH a fork is materialized in the background.
+    """
+    return (await lineage_depth(db, session_id)) >= settings.FORK_MATERIALIZE_DEPTH
@@ -0,0 +1,296 @@
+import codecs
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+import pandas as pd
+from fastapi import UploadFile
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # pragma: no cover - pyarrow is in requirements, pandas is the fallback
+    pa = None
+    pa_csv = None
+
+from app.core.config import settings
+from app.core.executor import task_executor
+from app.services.datasets import dataset_store
+from app.services.extraction_cache import extraction_cache
+from app.services import pdf_text
+from app.services.tabular import TableProfiler, markdown_rows, render_summary
+
+SPOOL_DIR = Path(settings.STORAGE_LOCAL_PATH) / "spool"
+READ_CHUNK_BYTES = 1024 * 1024
+PDF_PAGE_BATCH = 8 # Pages extracted per worker-process task
+
+# Bump whenever extraction output changes so cached results are not reused
+PARSER_VERSION = "2"
+
+TEXT_EXTENSIONS = {".txt", ".md", ".py", ".js", ".ts", ".json", ".html", ".css", ".xml", ".yaml", ".yml"}
+TABLE_EXTENSIONS = {".csv", ".xlsx", ".xls"}
+
+
+class IngestionError(Exception):
+    """Raised when an upload cannot be ingested. Carries the HTTP status to report."""
+    status_code = 422
+
+
+class UploadTooLarge(IngestionError):
+    status_code = 413
+
+
+@dataclass
+class SpooledUpload:
+    path: Path
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+
+    @property
+    def ext(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    def cleanup(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = settings.MAX_FILE_SIZE_MB * 1024 * 1024) -> SpooledUpload:
+    """
+    Copies the upload to a temp file in fixed-size chunks, hashing as it goes.
+    Parsers then read from disk so the raw bytes are never held in memory at once.
+    """
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    # Keep the extension, some readers (openpyxl) dispatch on it
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    fd, tmp_path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=suffix)
+    path = Path(tmp_path)
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(READ_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+    return SpooledUpload(
+        path=path,
+        filename=file.filename or "upload",
+        content_type=file.content_type,
+        size=size,
+        sha256=digest.hexdigest()
+    )
+
+
+def iter_table_chunks(path: Path, ext: str, chunk_rows: int = settings.UPLOAD_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Yields the table as DataFrames of at most chunk_rows rows.
+    """
+    if ext == ".csv":
+        yield from _iter_csv_chunks(path, chunk_rows)
+    elif ext == ".xlsx":
+        yield from _iter_xlsx_chunks(path, chunk_rows)
+    elif ext == ".xls":
+        # Legacy binary workbooks have no streaming reader
+        yield pd.read_excel(path)
+    else:
+        raise IngestionError(f"Unsupported table type: {ext}")
+
+
+def _iter_csv_chunks(path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    rows_read = 0
+    if pa_csv is not None:
+        # pyarrow's multithreaded streaming reader is several times faster than pandas' C parser
+        try:
+            with pa_csv.open_csv(path) as reader:
+                for batch in reader:
+                    chunk = batch.to_pandas()
+                    rows_read += len(chunk)
+                    yield chunk
+            return
+        except pa.ArrowInvalid:
+            # Types inferred from the first block didn't fit a later one; pandas finishes the file
+            pass
+
+    with pd.read_csv(path, chunksize=chunk_rows, skiprows=range(1, rows_read + 1)) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def _iter_xlsx_chunks(path: Path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    # read_only mode streams rows from the sheet XML instead of building the whole workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_text_chunks(path: Path, chunk_bytes: int = READ_CHUNK_BYTES) -> Iterator[str]:
+    """
+    Decodes UTF-8 incrementally so multi-byte characters split across chunks survive.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_bytes):
+            try:
+                text = decoder.decode(chunk)
+            except UnicodeDecodeError:
+                raise IngestionError("File is not valid UTF-8 text")
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _iter_local_events(upload: SpooledUpload, summary: bool, token_budget: int) -> Iterator[dict]:
+    """
+    Extracts tables and text incrementally, yielding one event per row chunk
+    or text chunk. Runs step by step on the executor's thread pool.
+
+    In summary mode tables are still stored in full, but only a column profile
+    and the sample rows that fit token_budget are rendered.
+    """
+    ext = upload.ext
+
+    if ext in TABLE_EXTENSIONS:
+        writer = dataset_store.writer(upload.filename)
+        profiler = TableProfiler() if summary else None
+        start = 0
+        for chunk in iter_table_chunks(upload.path, ext):
+            writer.write(chunk)
+            if profiler:
+                profiler.update(chunk)
+            else:
+                # Rendered by the caller in a worker process
+                yield {"type": "rows", "start": start, "count": len(chunk), "chunk": chunk}
+            start += len(chunk)
+        if profiler:
+            profile = profiler.result()
+            rendered = render_summary(profile, profiler.sample, token_budget)
+            yield {"type": "profile", "profile": profile, "sample_rows": rendered["sample_rows"], "content": rendered["content"]}
+        dataset = writer.close()
+        yield {"type": "dataset", "file_id": dataset["file_id"], "columns": dataset["columns"], "rows": dataset["rows"]}
+
+    elif ext in TEXT_EXTENSIONS:
+        for text in iter_text_chunks(upload.path):
+            yield {"type": "text", "content": text}
+
+    else:
+        # Unknown extension: accept it only if it decodes as UTF-8 text
+        try:
+            for text in iter_text_chunks(upload.path):
+                yield {"type": "text", "content": text}
+        except IngestionError:
+            error = IngestionError(f"Unsupported file type: {ext}")
+            error.status_code = 400
+            raise error
+
+
+async def iter_upload_events(
+    upload: SpooledUpload,
+    summary: bool = False,
+    token_budget: int = settings.TABLE_PREVIEW_TOKEN_BUDGET,
+    max_pages: int = settings.MAX_PDF_PAGES
+) -> AsyncIterator[dict]:
+    """
+    Extracts a spooled upload incrementally, yielding one event per page,
+    row chunk or text chunk, followed by a final 'done' event. All parsing
+    happens on the shared executor, never on the event loop.
+    """
+    done = {
+        "type": "done",
+        "filename": upload.filename,
+        "content_type": upload.content_type,
+        "bytes": upload.size
+    }
+
+    if upload.ext == ".pdf":
+        path = str(upload.path)
+        page_count = await task_executor.run("pdf", pdf_text.count_pages, path)
+        if page_count > max_pages:
+            raise UploadTooLarge(f"PDF has {page_count} pages, the limit is {max_pages}")
+
+        for start in range(0, page_count, PDF_PAGE_BATCH):
+            stop = min(start + PDF_PAGE_BATCH, page_count)
+            texts = await task_executor.run("pdf", pdf_text.extract_pages, path, start, stop)
+            for offset, text in enumerate(texts):
+                yield {"type": "page", "page": start + offset + 1, "content": text}
+    else:
+        async for event in task_executor.iterate("parse", _iter_local_events(upload, summary, token_budget)):
+            if event["type"] == "dataset":
+                done.update(file_id=event["file_id"], columns=event["columns"], rows=event["rows"])
+            elif event["type"] == "rows":
+                content = await task_executor.run("render", markdown_rows, event.pop("chunk"), event["start"] == 0)
+                yield {**event, "content": content}
+            else:
+                yield event
+
+    yield done
+
+
+async def extract_upload(
+    upload: SpooledUpload,
+    summary: bool = False,
+    token_budget: int = settings.TABLE_PREVIEW_TOKEN_BUDGET
+) -> AsyncIterator[dict]:
+    """
+    iter_upload_events behind the content-addressed extraction cache. The
+    final 'done' event reports whether the result came from the cache.
+    """
+    key = f"{PARSER_VERSION}-{upload.ext.lstrip('.') or 'bin'}-{upload.sha256}"
+    if summary and upload.ext in TABLE_EXTENSIONS:
+        key += f"-summary{token_budget}"
+
+    path = await extraction_cache.lookup(key)
+    if path is not None:
+        last = await extraction_cache.last_event(path)
+        # A cached table is only reusable while its stored dataset still exists
+        if "file_id" not in last or dataset_store.describe(last["file_id"]) is not None:
+            async for event in extraction_cache.replay(path):
+                if event["type"] == "done":
+                    event.update(filename=upload.filename, content_type=upload.content_type, cached=True)
+                yield event
+            return
+
+    recorder = extraction_cache.recorder(key)
+    try:
+        async for event in iter_upload_events(upload, summary, token_budget):
+            await task_executor.run("json", recorder.add, event)
+            if event["type"] == "done":
+                await recorder.commit()
+                event = {**event, "cached": False}
+            yield event
+    except BaseException:
+        recorder.abort()
+        raise
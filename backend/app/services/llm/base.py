@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import AsyncGenerator, Dict, List, Any
+from app.core.executor import task_executor
 
 class BaseLLM(ABC):
     @abstractmethod
@@ -22,3 +23,9 @@ class BaseLLM(ABC):
         Count the number of tokens in the text.
         """
         pass
+
+    async def count_tokens_async(self, text: str) -> int:
+        """
+        count_tokens on the executor's thread pool, for use from request handlers.
+        """
+        return await task_executor.run("tokenize", self.count_tokens, text)
@@ -1,28 +1,21 @@
-import openai
 from typing import AsyncGenerator, Dict, List, Any
 from app.core.config import settings
 from app.services.llm.base import BaseLLM
+from app.services.llm.router import deployment_router
 from app.services.tools_bridge import tools_bridge
+from app.core.executor import task_executor
 import json
-import tiktoken
+from app.services.llm.tokens import count_tokens
 import time
+from datetime import datetime, timezone
 from opentelemetry import trace
 
 tracer = trace.get_tracer(__name__)
 
 class OpenAIProvider(BaseLLM):
     def __init__(self, api_key: str = None):
-        self.api_key = api_key or settings.OPENAI_API_KEY
-        self.client = openai.AsyncOpenAI(api_key=self.api_key)
-        
-        # Azure OpenAI support
-        if settings.AZURE_OPENAI_API_KEY and settings.AZURE_OPENAI_ENDPOINT:
-            self.client = openai.AsyncAzureOpenAI(
-                api_key=settings.AZURE_OPENAI_API_KEY,
-                api_version="2024-02-15-preview",
-                azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-                azure_deployment=settings.AZURE_OPENAI_DEPLOYMENT_NAME
-            )
+        # The caller's own OpenAI key, if any; OpenAI and Azure deployments are picked per request
+        self.api_key = api_key
 
     async def chat_completion(
         self,
@@ -49,41 +42,47 @@ class OpenAIProvider(BaseLLM):
         # 1. Start the Stream
         with tracer.start_as_current_span("openai_completion_create") as span:
             span.set_attribute("llm.model", model)
-            response = await self.client.chat.completions.create(**completion_params)
+            response = await deployment_router.open_stream(completion_params, self.api_key)
+            span.set_attribute("llm.deployment", response.deployment.name)
+            span.set_attribute("llm.deployment.kind", response.deployment.kind)
         
         # State capability for tool accumulation
         tool_calls_buffer = [] 
         
-        async for chunk in response:
-            # Usage tracking (last chunk)
-            if hasattr(chunk, 'usage') and chunk.usage:
-                yield {"type": "usage", "usage": chunk.usage.model_dump()}
+        try:
+            async for chunk in response:
+                # Usage tracking (last chunk)
+                if hasattr(chunk, 'usage') and chunk.usage:
+                    yield {"type": "usage", "usage": chunk.usage.model_dump()}
 
-            if not chunk.choices:
-                continue
+                if not chunk.choices:
+                    continue
                 
-            choice = chunk.choices[0]
-            delta = choice.delta
+                choice = chunk.choices[0]
+                delta = choice.delta
 
-            # A. Text Content: Yield immediately
-            if delta.content:
-                yield {"type": "content", "content": delta.content}
+                # A. Text Content: Yield immediately
+                if delta.content:
+                    yield {"type": "content", "content": delta.content}
 
-            # B. Tool Calls: Accumulate chunks
-            if delta.tool_calls:
-                for tc_chunk in delta.tool_calls:
-                    if len(tool_calls_buffer) <= tc_chunk.index:
-                        tool_calls_buffer.append({
-                            "id": tc_chunk.id,
-                            "type": "function",
-                            "function": {"name": "", "arguments": ""}
-                        })
+                # B. Tool Calls: Accumulate chunks
+                if delta.tool_calls:
+                    for tc_chunk in delta.tool_calls:
+                        if len(tool_calls_buffer) <= tc_chunk.index:
+                            tool_calls_buffer.append({
+                                "id": tc_chunk.id,
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""}
+                            })
                     
-                    tc = tool_calls_buffer[tc_chunk.index]
-                    if tc_chunk.id: tc["id"] = tc_chunk.id
-                    if tc_chunk.function.name: tc["function"]["name"] += tc_chunk.function.name
-                    if tc_chunk.function.arguments: tc["function"]["arguments"] += tc_chunk.function.arguments
-        
+                        tc = tool_calls_buffer[tc_chunk.index]
+                        if tc_chunk.id: tc["id"] = tc_chunk.id
+                        if tc_chunk.function.name: tc["function"]["name"] += tc_chunk.function.name
+                        if tc_chunk.function.arguments: tc["function"]["arguments"] += tc_chunk.function.arguments
+        finally:
+            # Closes the HTTP response when the turn is cancelled, so the provider stops generating
+            await response.close()
+
         # 2. Check if we have gathered tool calls to execute
         if tool_calls_buffer:
             # Yield a thought marker
@@ -105,28 +104,40 @@ class OpenAIProvider(BaseLLM):
                 args_str = tool_call["function"]["arguments"]
                 call_id = tool_call["id"]
                 
+                # Per-call record for the tool_invocations table, batched by the caller
+                invocation = {
+                    "tool_call_id": call_id,
+                    "tool_name": func_name or "Unknown",
+                    "started_at": datetime.now(timezone.utc),
+                    "status": "error"
+                }
+                recorded = False
                 try:
-                    arguments = json.loads(args_str)
+                    arguments = await task_executor.run("json", json.loads, args_str)
                     # Yield structured info about the call
                     yield {"type": "thought", "content": f"Calling `{func_name}`..."}
                     
-                    start_time = time.time() # Optional: track tool execution time
+                    invocation["started_at"] = datetime.now(timezone.utc)
                     
                     with tracer.start_as_current_span("tool_execution", attributes={"tool.name": func_name}) as span:
                         try:
-                            result = await tools_bridge.execute_tool(func_name, arguments)
+                            result, stats = await tools_bridge.invoke(func_name, arguments)
+                            invocation.update(stats)
                         except Exception as e:
                             span.record_exception(e)
                             result = {"error": str(e)}
 
-                    # Determine status
-                    status = "error" if isinstance(result, dict) and "error" in result else "success"
-                    # Add status to span if context is available? (Span closed)
+                        # Determine status
+                        status = "error" if isinstance(result, dict) and "error" in result else "success"
+                        span.set_attribute("tool.status", status)
+                    invocation["status"] = status
+                    recorded = True
+                    yield {"type": "tool_invocation", "invocation": invocation}
                     
                     tool_msg = {
                         "role": "tool",
                         "tool_call_id": tool_call["id"], # Use tool_call["id"] instead of tool_call.id
-                        "content": json.dumps(result),
+                        "content": await task_executor.run("json", json.dumps, result),
                         "status": status
                     }
 
@@ -143,6 +154,8 @@ class OpenAIProvider(BaseLLM):
                 except json.JSONDecodeError as e:
                     # Handle JSON parsing error for tool arguments
                     error_msg = f"Error parsing arguments for tool '{func_name}': {e}"
+                    invocation.update(status="invalid_arguments", request_bytes=len(args_str.encode()))
+                    yield {"type": "tool_invocation", "invocation": invocation}
                     tool_msg = {
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
@@ -155,6 +168,8 @@ class OpenAIProvider(BaseLLM):
                 except Exception as e:
                     # Catch any other unexpected errors during tool preparation/execution
                     error_msg = f"An unexpected error occurred during tool '{func_name}' execution: {e}"
+                    if not recorded:
+                        yield {"type": "tool_invocation", "invocation": invocation}
                     tool_msg = {
                         "role": "tool",
                         "tool_call_id": tool_call["id"],
@@ -176,9 +191,4 @@ class OpenAIProvider(BaseLLM):
                 yield chunk
 
     def count_tokens(self, text: str) -> int:
-        try:
-            encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-            return len(encoding.encode(text))
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-            return len(encoding.encode(text))
+        return count_tokens(text)
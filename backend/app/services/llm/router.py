@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import openai
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_ALPHA = 0.2 # Weight of a new TTFT sample in the moving average
+ERROR_ALPHA = 0.1 # Weight of a new outcome in the error rate
+ERROR_PENALTY = 4.0 # Score multiplier per unit of error rate
+MAX_ATTEMPTS = 3 # Deployments tried (or retried) before giving up on a request
+RETRY_BACKOFF_SECONDS = 0.5
+
+REQUESTS = Counter(
+    "coda_llm_deployment_requests_total",
+    "Completion requests per deployment and outcome (ok, failover, error)",
+    ["deployment", "model", "outcome"]
+)
+TTFT = Histogram(
+    "coda_llm_deployment_ttft_seconds",
+    "Time from request to first streamed chunk, per deployment",
+    ["deployment"]
+)
+TTFT_EWMA = Gauge(
+    "coda_llm_deployment_ttft_ewma_seconds",
+    "Moving average of time to first chunk used for routing",
+    ["deployment"]
+)
+ERROR_RATE = Gauge(
+    "coda_llm_deployment_error_rate",
+    "Moving average of failed requests (429, 5xx, connection errors) used for routing",
+    ["deployment"]
+)
+
+
+class NoDeployment(Exception):
+    """Raised when no configured deployment serves the requested model."""
+    def __init__(self, model: str):
+        super().__init__(f"No OpenAI or Azure OpenAI deployment serves model '{model}'")
+        self.model = model
+
+
+@dataclass
+class Deployment:
+    name: str
+    kind: str # "openai" or "azure"
+    api_key: Optional[str] = None
+    endpoint: Optional[str] = None # Azure resource endpoint, or base URL of an OpenAI-compatible API
+    deployment: Optional[str] = None # Azure deployment; unset = the requested model name
+    api_version: Optional[str] = None
+    models: Optional[Set[str]] = None # Logical models served; None = any
+    ttft: Optional[float] = None
+    error_rate: float = 0.0
+    error_at: float = 0.0 # When error_rate was last brought up to date
+    cooldown_until: float = 0.0
+    in_flight: int = 0 # Requests started here and not yet closed
+    _client: Optional[openai.AsyncOpenAI] = field(default=None, repr=False)
+
+    def serves(self, model: str, api_key: Optional[str] = None) -> bool:
+        # OpenAI without a server key is only usable with the caller's own
+        usable = bool(self.api_key or (self.kind == "openai" and api_key))
+        return usable and (self.models is None or model in self.models)
+
+    def decay(self, now: float):
+        """
+        Fades the error rate with time since it was last updated, so a
+        deployment that stopped getting traffic for its errors recovers.
+        """
+        if self.error_rate and now > self.error_at:
+            self.error_rate *= 0.5 ** ((now - self.error_at) / settings.ROUTER_ERROR_HALF_LIFE_SECONDS)
+            ERROR_RATE.labels(self.name).set(self.error_rate)
+        self.error_at = now
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until and self.error_rate < settings.ROUTER_MAX_ERROR_RATE
+
+    def score(self) -> float:
+        # Expected wait: latency, inflated by recent errors and by streams already
+        # running there, so load spreads over pools. Unmeasured deployments score best.
+        return (self.ttft or 0.0) * (1 + ERROR_PENALTY * self.error_rate) * (1 + self.in_flight)
+
+    def client(self, api_key: Optional[str] = None) -> openai.AsyncOpenAI:
+        """
+        The deployment's client; shared (one connection pool) unless the
+        caller brings its own OpenAI key. The router retries elsewhere, so
+        the SDK's own retries are off.
+        """
+        if api_key and self.kind == "openai" and api_key != self.api_key:
+            return openai.AsyncOpenAI(api_key=api_key, base_url=self.endpoint, max_retries=0)
+        if self._client is None:
+            if self.kind == "azure":
+                self._client = openai.AsyncAzureOpenAI(
+                    api_key=self.api_key,
+                    api_version=self.api_version or settings.AZURE_OPENAI_API_VERSION,
+                    azure_endpoint=self.endpoint,
+                    azure_deployment=self.deployment,
+                    max_retries=0
+                )
+            else:
+                self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.endpoint, max_retries=0)
+        return self._client
+
+    def observe_ttft(self, seconds: float):
+        self.ttft = seconds if self.ttft is None else self.ttft + (seconds - self.ttft) * LATENCY_ALPHA
+        self.decay(time.monotonic())
+        self.error_rate -= self.error_rate * ERROR_ALPHA
+        TTFT.labels(self.name).observe(seconds)
+        TTFT_EWMA.labels(self.name).set(self.ttft)
+        ERROR_RATE.labels(self.name).set(self.error_rate)
+
+    def observe_failure(self, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        self.decay(now)
+        self.error_rate += (1 - self.error_rate) * ERROR_ALPHA
+        self.cooldown_until = now + (retry_after or settings.ROUTER_COOLDOWN_SECONDS)
+        ERROR_RATE.labels(self.name).set(self.error_rate)
+
+
+def _models(value: Any) -> Optional[Set[str]]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return {model.strip() for model in value if model.strip()}
+
+
+def configured_deployments() -> List[Deployment]:
+    """
+    OpenAI itself, the Azure deployment from AZURE_OPENAI_*, and any
+    listed in LLM_DEPLOYMENTS (a JSON list of Deployment fields).
+    """
+    deployments = [Deployment(name="openai", kind="openai", api_key=settings.OPENAI_API_KEY)]
+    if settings.AZURE_OPENAI_API_KEY and settings.AZURE_OPENAI_ENDPOINT:
+        deployments.append(Deployment(
+            name="azure",
+            kind="azure",
+            api_key=settings.AZURE_OPENAI_API_KEY,
+            endpoint=settings.AZURE_OPENAI_ENDPOINT,
+            deployment=settings.AZURE_OPENAI_DEPLOYMENT_NAME,
+            models=_models(settings.AZURE_OPENAI_MODELS)
+        ))
+    for spec in json.loads(settings.LLM_DEPLOYMENTS or "[]"):
+        deployments.append(Deployment(
+            name=spec["name"],
+            kind=spec.get("kind", "azure"),
+            api_key=spec.get("api_key"),
+            endpoint=spec.get("endpoint"),
+            deployment=spec.get("deployment"),
+            api_version=spec.get("api_version"),
+            models=_models(spec.get("models"))
+        ))
+    return deployments
+
+
+def _failover_delay(error: Exception) -> Tuple[bool, Optional[float]]:
+    """Whether an error is the deployment's fault (429, 5xx, unreachable), and its Retry-After."""
+    if isinstance(error, openai.APIConnectionError):
+        return True, None
+    if isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500):
+        try:
+            return True, float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return True, None
+    return False, None
+
+
+class DeploymentRouter:
+    """
+    Sends each OpenAI-compatible completion to the best healthy deployment
+    of its model, by moving averages of time to first chunk and error
+    rate. A 429, 5xx or connection error before the first chunk puts the
+    deployment in cooldown and the request moves on to the next one.
+    """
+    def __init__(self, deployments: Optional[List[Deployment]] = None):
+        self._deployments = deployments
+
+    @property
+    def deployments(self) -> List[Deployment]:
+        # Built on first use, so settings can be changed before
+        if self._deployments is None:
+            self._deployments = configured_deployments()
+        return self._deployments
+
+    def candidates(self, model: str, api_key: Optional[str] = None) -> List[Deployment]:
+        """Deployments of `model` in the order to try them: healthy ones by score, then the rest."""
+        serving = [d for d in self.deployments if d.serves(model, api_key)]
+        if not serving:
+            raise NoDeployment(model)
+        now = time.monotonic()
+        for d in serving:
+            d.decay(now)
+        healthy = sorted((d for d in serving if d.healthy(now)), key=lambda d: (d.score(), random.random()))
+        # Occasionally try another healthy one, so a recovered deployment's average catches up
+        if len(healthy) > 1 and random.random() < settings.ROUTER_EXPLORE_RATE:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        unhealthy = sorted((d for d in serving if not d.healthy(now)), key=lambda d: d.cooldown_until)
+        return healthy + unhealthy
+
+    async def open_stream(self, params: Dict[str, Any], api_key: Optional[str] = None) -> "RoutedStream":
+        """
+        Starts a streamed completion on the best deployment and waits for
+        its first chunk, failing over until one answers. The returned
+        stream must be closed.
+        """
+        model = params["model"]
+        candidates = self.candidates(model, api_key)
+        error: Optional[Exception] = None
+        for attempt in range(max(MAX_ATTEMPTS, len(candidates))):
+            deployment = candidates[attempt % len(candidates)]
+            if attempt >= len(candidates):
+                # Every deployment failed once; back off before asking again
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - len(candidates)))
+            # Counted from now, so a burst of requests spreads before any TTFT is known
+            deployment.in_flight += 1
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await deployment.client(api_key).chat.completions.create(**params)
+                first = await response.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException as e:
+                deployment.in_flight -= 1
+                if response is not None:
+                    await response.close()
+                failover, retry_after = _failover_delay(e)
+                if not failover:
+                    if isinstance(e, Exception):
+                        REQUESTS.labels(deployment.name, model, "error").inc()
+                    raise
+                logger.warning(f"Deployment {deployment.name} failed for {model}, failing over: {e}")
+                deployment.observe_failure(retry_after)
+                REQUESTS.labels(deployment.name, model, "failover").inc()
+                error = e
+                continue
+            deployment.observe_ttft(time.perf_counter() - started)
+            REQUESTS.labels(deployment.name, model, "ok").inc()
+            return RoutedStream(deployment, response, first)
+        raise error
+
+
+class RoutedStream:
+    """A started completion stream and the deployment serving it."""
+    def __init__(self, deployment: Deployment, response: Any, first: Any):
+        self.deployment = deployment
+        self._response = response
+        self._first = first
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        if self._first is not None:
+            yield self._first
+        async for chunk in self._response:
+            yield chunk
+
+    async def close(self):
+        """Closes the HTTP response, so the deployment stops generating. Idempotent."""
+        if self._closed:
+            return
+        self._closed = True
+        self.deployment.in_flight -= 1
+        await self._response.close()
+
+# Global instance
+deployment_router = DeploymentRouter()
@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+import tiktoken
+
+@lru_cache
+def get_encoding() -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model("gpt-3.5-turbo")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with the cl100k encoding. Blocking; call through the executor
+    from async code.
+    """
+    return len(get_encoding().encode(text))
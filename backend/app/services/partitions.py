@@ -0,0 +1,47 @@
+import logging
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def ensure_message_partitions(months_ahead: int = settings.MESSAGE_PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Creates upcoming monthly partitions when messages is range-partitioned
+    (see the e41c6a0f8d27 migration). Rows that would land in a missing
+    month fall into the DEFAULT partition, which then blocks creating that
+    month, so this runs at startup well ahead of time. Returns partitions created.
+    """
+    created = 0
+    async with engine.begin() as conn:
+        partitioned = await conn.scalar(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'messages'::regclass)"
+        ))
+        if not partitioned:
+            return 0
+
+        month = datetime.now(timezone.utc).date().replace(day=1)
+        for _ in range(months_ahead + 1):
+            upper = _add_months(month, 1)
+            name = f"messages_p{month:%Y%m}"
+            exists = await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+            if not exists:
+                await conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF messages "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+                ))
+                created += 1
+            month = upper
+
+    if created:
+        logger.info(f"Created {created} message partitions")
+    return created
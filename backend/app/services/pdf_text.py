@@ -0,0 +1,22 @@
+"""
+PDF text extraction helpers that run inside executor worker processes.
+Kept free of app imports so spawned workers start quickly.
+"""
+from typing import List
+
+from pypdf import PdfReader
+
+
+def count_pages(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+def extract_pages(path: str, start: int, stop: int) -> List[str]:
+    """
+    Extracts pages [start, stop). pypdf parses pages lazily from the file
+    handle, so only the requested pages are loaded.
+    """
+    with open(path, "rb") as f:
+        reader = PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
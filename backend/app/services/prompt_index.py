@@ -0,0 +1,209 @@
+import hashlib
+import json
+import re
+import zlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from prometheus_client import Counter
+
+from app.core.config import settings
+
+NUM_PERM = 128
+BANDS = 16 # 16 bands of 8 rows: pairs above ~0.7 similarity share a band with high probability
+ROWS = NUM_PERM // BANDS
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_SOLVES_PER_PROMPT = 8
+SEED = 1337 # Fixed so signatures are comparable across restarts
+
+_rng = np.random.default_rng(SEED)
+# a * x + b stays below 2**64 for 32-bit shingle hashes, so uint64 never wraps
+_A = _rng.integers(1, 1 << 32, size=(NUM_PERM, 1), dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, size=(NUM_PERM, 1), dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+
+REUSED_RESULTS = Counter(
+    "coda_prompt_index_reused_results_total",
+    "Tool calls answered with the result of a near-duplicate earlier prompt",
+    ["tool"]
+)
+MATCHES = Counter(
+    "coda_prompt_index_lookups_total",
+    "First-turn prompts looked up in the near-duplicate index",
+    ["matched"]
+)
+
+
+def shingles(text: str) -> Set[int]:
+    """
+    Word unigrams and bigrams of the lowercased text, hashed to 32 bits.
+    Unigrams keep reordered wording similar; bigrams keep some order.
+    """
+    words = _WORD.findall(text.lower())
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return {zlib.crc32(gram.encode()) for gram in grams}
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature: per permutation, the minimum of (a * x + b) mod p over the shingles."""
+    hashed = np.fromiter(shingles(text), dtype=np.uint64)
+    if not hashed.size:
+        return np.full(NUM_PERM, MERSENNE_PRIME, dtype=np.uint64)
+    return ((_A * hashed[np.newaxis, :] + _B) % MERSENNE_PRIME).min(axis=1)
+
+
+def arguments_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{tool_name}\n{canonical}".encode()).hexdigest()
+
+
+@dataclass
+class Entry:
+    slot: int
+    bands: List[bytes]
+    solves: Dict[str, bytes] # arguments_key -> JSON of the result
+    size: int
+
+
+@dataclass
+class PromptSolves:
+    """
+    Tool results of one first-turn prompt: those offered by near-duplicate
+    earlier prompts, and those its own tool calls produce.
+    """
+    prompt: str
+    offers: Dict[str, Tuple[bytes, float]] = field(default_factory=dict) # arguments_key -> (result JSON, similarity)
+    solved: Dict[str, bytes] = field(default_factory=dict)
+
+    def lookup(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[Any]:
+        offer = self.offers.get(arguments_key(tool_name, arguments))
+        if offer is None:
+            return None
+        REUSED_RESULTS.labels(tool_name).inc()
+        return json.loads(offer[0])
+
+    def record(self, tool_name: str, arguments: Dict[str, Any], result: Any):
+        if len(self.solved) < MAX_SOLVES_PER_PROMPT:
+            self.solved[arguments_key(tool_name, arguments)] = json.dumps(result).encode()
+
+
+# The PromptSolves of the chat turn being generated, read by the tools bridge
+current_solves: ContextVar[Optional[PromptSolves]] = ContextVar("prompt_solves", default=None)
+
+
+class PromptIndex:
+    """
+    Near-duplicate index over recent first-turn prompts and the solver
+    results their tool calls produced. MinHash signatures live in one
+    preallocated array and are bucketed by LSH bands, so a lookup only
+    compares against prompts sharing a band. Memory is bounded by the
+    entry count and the total size of kept results; the least recently
+    used prompts are evicted first.
+    """
+    def __init__(
+        self,
+        enabled: bool = settings.PROMPT_INDEX_ENABLED,
+        entries: int = settings.PROMPT_INDEX_ENTRIES,
+        max_bytes: int = settings.PROMPT_INDEX_MAX_MB * 1024 * 1024,
+        max_result_bytes: int = settings.PROMPT_INDEX_MAX_RESULT_KB * 1024,
+        threshold: float = settings.PROMPT_INDEX_THRESHOLD
+    ):
+        self.enabled = enabled
+        self.entries = entries
+        self.max_bytes = max_bytes
+        self.max_result_bytes = max_result_bytes
+        self.threshold = threshold
+        self._signatures = np.zeros((entries, NUM_PERM), dtype=np.uint64)
+        self._free = list(range(entries - 1, -1, -1))
+        self._entries: "OrderedDict[int, Entry]" = OrderedDict()
+        self._buckets: Dict[bytes, Set[int]] = {}
+        self._bytes = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _bands(sig: np.ndarray) -> List[bytes]:
+        return [bytes([band]) + sig[band * ROWS:(band + 1) * ROWS].tobytes() for band in range(BANDS)]
+
+    def similar(self, text: str) -> List[Tuple[float, int]]:
+        """(estimated Jaccard similarity, entry id) of indexed prompts at or above the threshold, best first."""
+        sig = signature(text)
+        candidates = set()
+        for band in self._bands(sig):
+            candidates.update(self._buckets.get(band, ()))
+        if not candidates:
+            return []
+        ids = list(candidates)
+        slots = [self._entries[entry_id].slot for entry_id in ids]
+        similarity = (self._signatures[slots] == sig).mean(axis=1)
+        matches = [(float(s), entry_id) for s, entry_id in zip(similarity, ids) if s >= self.threshold]
+        return sorted(matches, reverse=True)
+
+    def solves_for(self, prompt: str) -> PromptSolves:
+        """
+        A PromptSolves for a new first-turn prompt, offering the results of
+        its near duplicates (the most similar prompt wins for equal calls).
+        """
+        solves = PromptSolves(prompt)
+        if not self.enabled:
+            return solves
+        matches = self.similar(prompt)
+        MATCHES.labels(str(bool(matches)).lower()).inc()
+        for similarity, entry_id in reversed(matches):
+            entry = self._entries[entry_id]
+            self._entries.move_to_end(entry_id)
+            for key, result in entry.solves.items():
+                solves.offers[key] = (result, similarity)
+        return solves
+
+    def add(self, solves: PromptSolves):
+        """Indexes a finished first turn that produced solver results."""
+        kept = {key: result for key, result in solves.solved.items() if len(result) <= self.max_result_bytes}
+        if not self.enabled or not kept:
+            return
+        sig = signature(solves.prompt)
+        # The same canned prompt again: merge into its entry rather than indexing a copy
+        for similarity, entry_id in self.similar(solves.prompt)[:1]:
+            if similarity == 1.0:
+                entry = self._entries[entry_id]
+                for key, result in kept.items():
+                    if key not in entry.solves and len(entry.solves) < MAX_SOLVES_PER_PROMPT:
+                        entry.solves[key] = result
+                        entry.size += len(result)
+                        self._bytes += len(result)
+                self._entries.move_to_end(entry_id)
+                return
+        size = sum(len(result) for result in kept.values())
+        while self._entries and (not self._free or self._bytes + size > self.max_bytes):
+            self._evict()
+        if not self._free:
+            return
+        entry = Entry(slot=self._free.pop(), bands=self._bands(sig), solves=kept, size=size)
+        self._signatures[entry.slot] = sig
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        for band in entry.bands:
+            self._buckets.setdefault(band, set()).add(entry_id)
+        self._bytes += size
+
+    def _evict(self):
+        entry_id, entry = self._entries.popitem(last=False)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+        self._free.append(entry.slot)
+        self._bytes -= entry.size
+
+# Global instance
+prompt_index = PromptIndex()
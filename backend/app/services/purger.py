@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import delete, func, select
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.models.tool_invocation import ToolInvocation
+from app.services import archive, history, rollups
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_PER_PASS = 100
+ADVISORY_LOCK_KEY = 0x636F6461_7067 # Held by the one worker running a purge pass
+BATCH_PAUSE_SECONDS = 0.05 # Breathing room for other queries between batches
+
+
+class SessionPurger:
+    """
+    Background task that physically removes soft-deleted sessions. Messages
+    go in bounded batches, each in its own short transaction, so purging a
+    huge session never holds locks or a connection for long.
+    """
+    def __init__(
+        self,
+        interval: int = settings.PURGE_INTERVAL_SECONDS,
+        grace: int = settings.PURGE_GRACE_SECONDS,
+        batch_size: int = settings.PURGE_BATCH_SIZE
+    ):
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                purged = await self.purge_once()
+                if purged:
+                    logger.info(f"Purged {purged} deleted sessions")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Session purge failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def purge_once(self) -> int:
+        """
+        Purges deleted sessions past the grace period. Newest first, so forks
+        that were deleted along with their parent go before it.
+
+        Every worker runs a purger; a transaction-level advisory lock, held
+        in a transaction left open for the pass, lets only one of them purge
+        at a time. The others skip the pass.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.grace)
+        async with async_session_factory() as lock_db:
+            if not await lock_db.scalar(select(func.pg_try_advisory_xact_lock(ADVISORY_LOCK_KEY))):
+                return 0
+
+            async with async_session_factory() as db:
+                result = await db.execute(
+                    select(Session.id)
+                    .where(Session.deleted_at.is_not(None), Session.deleted_at <= cutoff)
+                    .order_by(Session.created_at.desc())
+                    .limit(SESSIONS_PER_PASS)
+                )
+                session_ids = result.scalars().all()
+
+            purged = 0
+            for session_id in session_ids:
+                if await self.purge_session(session_id):
+                    purged += 1
+            # Leaving the block rolls the lock transaction back, which releases the lock
+            return purged
+
+    async def purge_session(self, session_id: UUID) -> bool:
+        # Archived rows are still counted in the rollups; bring them back so they are subtracted below
+        await archive.rehydrate(session_id)
+
+        async with async_session_factory() as db:
+            # Live forks still read history through this session: give them their own copy
+            await history.materialize_children(db, session_id)
+            await db.commit()
+
+            pending_children = await db.scalar(select(Session.id).where(Session.parent_id == session_id).limit(1))
+            if pending_children:
+                # A deleted fork not yet purged; it goes first, retry on the next pass
+                return False
+
+        while True:
+            async with async_session_factory() as db:
+                result = await db.execute(
+                    select(Message.id).where(Message.session_id == session_id).limit(self.batch_size)
+                )
+                batch = result.scalars().all()
+                if batch:
+                    # Take the purged rows out of the analytics rollups in the same transaction
+                    await rollups.apply_messages(db, select(*rollups.MESSAGE_COLUMNS).where(Message.id.in_(batch)), -1)
+                    await db.execute(
+                        delete(Message).where(Message.id.in_(batch)),
+                        execution_options={"synchronize_session": False}
+                    )
+                await db.commit()
+            if len(batch) < self.batch_size:
+                break
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+        async with async_session_factory() as db:
+            # Tool invocations go with the session row (ON DELETE CASCADE)
+            await rollups.apply_tool_invocations(
+                db, select(*rollups.TOOL_COLUMNS).where(ToolInvocation.session_id == session_id), -1
+            )
+            await rollups.apply_sessions(
+                db, select(Session.created_at).where(Session.id == session_id, Session.deleted_at.is_not(None)), -1
+            )
+            await db.execute(
+                delete(Session).where(Session.id == session_id, Session.deleted_at.is_not(None)),
+                execution_options={"synchronize_session": False}
+            )
+            await db.commit()
+        return True
+
+# Global instance
+session_purger = SessionPurger()
@@ -0,0 +1,246 @@
+import hashlib
+import ipaddress
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from prometheus_client import Counter
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "coda:ratelimit:"
+REDIS_RETRY_SECONDS = 30 # After a Redis error, buckets are kept locally this long
+
+# Refills by elapsed time, then takes `cost` if the bucket has it; with
+# `force` it always takes it, leaving the bucket in debt. Returns
+# {allowed, tokens left (as a string, Lua numbers are truncated), ms until `cost` is available}.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local force = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or capacity
+local at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - at, 0) * rate / 1000)
+local allowed = 0
+if force == 1 or tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+local wait = 0
+if allowed == 0 then
+    wait = math.ceil((cost - tokens) / rate * 1000)
+end
+return {allowed, tostring(tokens), wait}
+"""
+
+REJECTED = Counter(
+    "coda_rate_limit_rejected_total",
+    "Requests and tool calls refused because the caller's budget was spent",
+    ["bucket"]
+)
+
+# The caller a chat turn runs for, so tool calls made during it are counted against them
+current_identity: ContextVar[Optional[str]] = ContextVar("rate_limit_identity", default=None)
+
+
+@dataclass(frozen=True)
+class Bucket:
+    per_minute: int # Refill rate; also the burst size (0 = unlimited)
+    unit: str       # "requests" or "tokens", used in the response headers
+
+
+BUCKETS: Dict[str, Bucket] = {
+    "chat": Bucket(per_minute=settings.RATE_LIMIT_CHAT_PER_MINUTE, unit="requests"),
+    "tokens": Bucket(per_minute=settings.RATE_LIMIT_TOKENS_PER_MINUTE, unit="tokens"),
+    "uploads": Bucket(per_minute=settings.RATE_LIMIT_UPLOADS_PER_MINUTE, unit="requests"),
+    "tools": Bucket(per_minute=settings.RATE_LIMIT_TOOL_CALLS_PER_MINUTE, unit="requests"),
+}
+
+
+@dataclass
+class Budget:
+    bucket: Bucket
+    allowed: bool
+    remaining: float
+    retry_after: float # Seconds until the request would be allowed (0 when it was)
+
+    def headers(self) -> Dict[str, str]:
+        """
+        X-RateLimit-* headers in the style of the upstream providers: the
+        limit per minute, what is left, and seconds until the bucket is full.
+        """
+        if not self.bucket.per_minute:
+            return {}
+        rate = self.bucket.per_minute / 60
+        unit = self.bucket.unit.capitalize()
+        return {
+            f"X-RateLimit-Limit-{unit}": str(self.bucket.per_minute),
+            f"X-RateLimit-Remaining-{unit}": str(max(int(self.remaining), 0)),
+            f"X-RateLimit-Reset-{unit}": f"{max(self.bucket.per_minute - self.remaining, 0) / rate:.1f}s",
+        }
+
+
+TRUSTED_PROXIES = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES]
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    """
+    The address a request came from. When the peer is a trusted proxy,
+    X-Forwarded-For is read right to left, past the trusted hops, so
+    addresses a client puts in the header itself are ignored.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _trusted(address):
+        return address
+    for hop in reversed(request.headers.get("X-Forwarded-For", "").split(",")):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _trusted(hop):
+            break
+    return address
+
+
+def client_identity(request: Request, api_key: Optional[str] = None) -> str:
+    """
+    Whom a request is counted against: the provider API key it will be
+    sent with (hashed, several users can share an address), otherwise
+    its address. Pass only the key the chosen provider uses, so other
+    key headers cannot be varied to get a fresh bucket.
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    return "ip:" + client_address(request)
+
+
+class RateLimiter:
+    """
+    Token buckets per caller and bucket kind. With RATE_LIMIT_REDIS the
+    buckets live in Redis and are updated atomically by a Lua script, so
+    all workers share them; otherwise (and while Redis is unreachable)
+    each worker keeps its own in an LRU-bounded dict.
+    """
+    def __init__(
+        self,
+        buckets: Dict[str, Bucket] = BUCKETS,
+        enabled: bool = settings.RATE_LIMIT_ENABLED,
+        use_redis: bool = settings.RATE_LIMIT_REDIS,
+        local_keys: int = settings.RATE_LIMIT_LOCAL_KEYS
+    ):
+        self.buckets = buckets
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.local_keys = local_keys
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._script = None
+        self._redis_down_until = 0.0
+
+    async def hit(self, name: str, identity: str, cost: float = 1, force: bool = False) -> Budget:
+        """
+        Takes `cost` from the caller's `name` bucket. Returns the budget
+        with allowed=False if it does not have that much; force=True takes
+        it regardless, for usage that is only known afterwards.
+        """
+        bucket = self.buckets[name]
+        if not self.enabled or not bucket.per_minute:
+            return Budget(bucket, True, math.inf, 0)
+        key = f"{REDIS_PREFIX}{name}:{identity}"
+        rate = bucket.per_minute / 60
+
+        budget = None
+        if self.use_redis and time.monotonic() >= self._redis_down_until:
+            budget = await self._hit_redis(key, bucket, rate, cost, force)
+        if budget is None:
+            budget = self._hit_local(key, bucket, rate, cost, force)
+        if not budget.allowed:
+            REJECTED.labels(name).inc()
+        return budget
+
+    async def _hit_redis(self, key: str, bucket: Bucket, rate: float, cost: float, force: bool) -> Optional[Budget]:
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(TOKEN_BUCKET_LUA)
+            allowed, remaining, wait_ms = await self._script(
+                keys=[key], args=[rate, bucket.per_minute, cost, int(force)]
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit Redis call failed, counting locally for {REDIS_RETRY_SECONDS}s: {e}")
+            self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return None
+        return Budget(bucket, bool(allowed), float(remaining), wait_ms / 1000)
+
+    def _hit_local(self, key: str, bucket: Bucket, rate: float, cost: float, force: bool) -> Budget:
+        now = time.monotonic()
+        tokens, at = self._local.pop(key, (bucket.per_minute, now))
+        tokens = min(bucket.per_minute, tokens + (now - at) * rate)
+        allowed = force or tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._local[key] = (tokens, now)
+        if len(self._local) > self.local_keys:
+            self._local.popitem(last=False)
+        return Budget(bucket, allowed, tokens, 0 if allowed else (cost - tokens) / rate)
+
+    async def charge(self, name: str, identity: str, cost: float):
+        """
+        Records usage after the fact (e.g. tokens of a finished turn).
+        Never raises.
+        """
+        if cost <= 0:
+            return
+        try:
+            await self.hit(name, identity, cost, force=True)
+        except Exception as e:
+            logger.warning(f"Charging {name} budget failed: {e}")
+
+# Global instance
+rate_limiter = RateLimiter()
+
+
+def rejection(budget: Budget, what: str) -> HTTPException:
+    """A 429 for a spent budget, with Retry-After and the X-RateLimit-* headers."""
+    retry_after = max(1, math.ceil(budget.retry_after))
+    return HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded for {what}, try again in {retry_after}s",
+        headers={**budget.headers(), "Retry-After": str(retry_after)}
+    )
+
+
+def limit(name: str):
+    """
+    Route dependency that spends one unit of the caller's `name` bucket,
+    answers 429 when it is empty, and sets the X-RateLimit-* headers. It
+    returns the headers too, for routes that build their own response.
+    """
+    async def dependency(request: Request, response: Response) -> Dict[str, str]:
+        budget = await rate_limiter.hit(name, client_identity(request))
+        if not budget.allowed:
+            raise rejection(budget, name)
+        headers = budget.headers()
+        response.headers.update(headers)
+        return headers
+    return dependency
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Select, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.analytics import RollupState, ToolRollup, UsageRollup
+from app.models.message import Message
+from app.models.session import Session
+from app.models.tool_invocation import ToolInvocation
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "analytics"
+MAX_STEP = timedelta(days=1) # Largest time range folded into the rollups per transaction
+
+# Columns a message source must provide to apply_messages()
+MESSAGE_COLUMNS = (Message.created_at, Message.model, Message.token_count, Message.execution_time)
+
+# Columns a tool invocation source must provide to apply_tool_invocations()
+TOOL_COLUMNS = (
+    ToolInvocation.created_at, ToolInvocation.started_at, ToolInvocation.tool_name, ToolInvocation.status,
+    ToolInvocation.duration, ToolInvocation.request_bytes, ToolInvocation.response_bytes,
+    ToolInvocation.cache_hit, ToolInvocation.retry_count
+)
+
+
+TOOL_ROLLUP_SUMS = (
+    "calls", "errors", "duration_sum", "duration_count",
+    "request_bytes", "response_bytes", "cache_hits", "retries"
+)
+
+
+def _bucket(column):
+    return func.date_trunc("hour", column, "UTC")
+
+
+async def get_watermark(db: AsyncSession, lock: Optional[str] = None) -> Optional[datetime]:
+    """
+    Reads the watermark. lock="update" serializes rollup advances; lock="share"
+    lets writers adjust rows below the watermark without racing an advance.
+    """
+    query = select(RollupState.watermark).where(RollupState.name == ROLLUP_NAME)
+    if lock == "update":
+        query = query.with_for_update()
+    elif lock == "share":
+        query = query.with_for_update(read=True)
+    return await db.scalar(query)
+
+
+async def _fold_messages(db: AsyncSession, rows: Select, sign: int):
+    """
+    Adds (sign=1) or subtracts (sign=-1) the contribution of `rows` to the
+    hourly usage rollup with an upsert.
+    """
+    src = rows.subquery()
+    bucket = _bucket(src.c.created_at)
+    model = func.coalesce(src.c.model, "")
+    usage = (
+        select(
+            bucket,
+            model,
+            literal(0),
+            func.count() * sign,
+            func.coalesce(func.sum(src.c.token_count), 0) * sign,
+            func.coalesce(func.sum(src.c.execution_time), 0.0) * sign,
+            func.count(src.c.execution_time) * sign
+        )
+        .group_by(bucket, model)
+    )
+    stmt = pg_insert(UsageRollup).from_select(
+        ["bucket", "model", "sessions", "messages", "tokens", "execution_time_sum", "execution_time_count"], usage
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "model"],
+        set_={c: getattr(UsageRollup, c) + stmt.excluded[c] for c in ("messages", "tokens", "execution_time_sum", "execution_time_count")}
+    ))
+
+
+async def _fold_tool_invocations(db: AsyncSession, rows: Select, sign: int):
+    # Bucketed by when the call started; the watermark only decides which rows are folded
+    src = rows.subquery()
+    bucket = _bucket(src.c.started_at)
+    tools = (
+        select(
+            bucket,
+            src.c.tool_name,
+            func.count() * sign,
+            func.count().filter(src.c.status != "success") * sign,
+            func.coalesce(func.sum(src.c.duration), 0.0) * sign,
+            func.count(src.c.duration) * sign,
+            func.coalesce(func.sum(src.c.request_bytes), 0) * sign,
+            func.coalesce(func.sum(src.c.response_bytes), 0) * sign,
+            func.count().filter(src.c.cache_hit) * sign,
+            func.coalesce(func.sum(src.c.retry_count), 0) * sign
+        )
+        .group_by(bucket, src.c.tool_name)
+    )
+    stmt = pg_insert(ToolRollup).from_select(
+        ["bucket", "tool_name", *TOOL_ROLLUP_SUMS], tools
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "tool_name"],
+        set_={c: getattr(ToolRollup, c) + stmt.excluded[c] for c in TOOL_ROLLUP_SUMS}
+    ))
+
+
+async def _fold_sessions(db: AsyncSession, rows: Select, sign: int):
+    src = rows.subquery()
+    bucket = _bucket(src.c.created_at)
+    sessions = select(bucket, literal(""), func.count() * sign).group_by(bucket)
+    stmt = pg_insert(UsageRollup).from_select(["bucket", "model", "sessions"], sessions)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "model"],
+        set_={"sessions": UsageRollup.sessions + stmt.excluded.sessions}
+    ))
+
+
+async def apply_messages(db: AsyncSession, rows: Select, sign: int):
+    """
+    Keeps the rollups exact when messages older than the watermark are
+    inserted (sign=1, e.g. fork materialization) or deleted (sign=-1, purge).
+    `rows` selects MESSAGE_COLUMNS for the affected messages and must run in
+    the same transaction as the change itself.
+    """
+    watermark = await get_watermark(db, lock="share")
+    if watermark is None:
+        return
+    src = rows.subquery()
+    await _fold_messages(db, select(src).where(src.c.created_at < watermark), sign)
+
+
+async def apply_sessions(db: AsyncSession, rows: Select, sign: int):
+    """
+    Session counterpart of apply_messages; `rows` selects Session.created_at.
+    """
+    watermark = await get_watermark(db, lock="share")
+    if watermark is None:
+        return
+    src = rows.subquery()
+    await _fold_sessions(db, select(src).where(src.c.created_at < watermark), sign)
+
+
+async def apply_tool_invocations(db: AsyncSession, rows: Select, sign: int):
+    """
+    Tool invocation counterpart of apply_messages; `rows` selects TOOL_COLUMNS.
+    """
+    watermark = await get_watermark(db, lock="share")
+    if watermark is None:
+        return
+    src = rows.subquery()
+    await _fold_tool_invocations(db, select(src).where(src.c.created_at < watermark), sign)
+
+
+async def advance(db: AsyncSession, lag: int = settings.ROLLUP_LAG_SECONDS) -> bool:
+    """
+    Folds rows created between the watermark and now() - lag (at most
+    MAX_STEP at a time) into the rollups and moves the watermark. The lag
+    leaves room for transactions that commit rows with an older created_at.
+    Returns True if there is more to fold. Commits.
+    """
+    watermark = await get_watermark(db, lock="update")
+    target = datetime.now(timezone.utc) - timedelta(seconds=lag)
+
+    if watermark is None:
+        # First run: start at the oldest row instead of stepping through empty days
+        oldest = await db.scalar(select(func.least(
+            select(func.min(Message.created_at)).scalar_subquery(),
+            select(func.min(Session.created_at)).scalar_subquery(),
+            select(func.min(ToolInvocation.created_at)).scalar_subquery()
+        )))
+        watermark = min(oldest, target) if oldest is not None else target
+
+    upper = min(target, watermark + MAX_STEP)
+    if upper > watermark:
+        await _fold_messages(
+            db, select(*MESSAGE_COLUMNS).where(Message.created_at >= watermark, Message.created_at < upper), 1
+        )
+        await _fold_sessions(
+            db, select(Session.created_at).where(Session.created_at >= watermark, Session.created_at < upper), 1
+        )
+        await _fold_tool_invocations(
+            db, select(*TOOL_COLUMNS).where(ToolInvocation.created_at >= watermark, ToolInvocation.created_at < upper), 1
+        )
+
+    await db.execute(
+        update(RollupState).where(RollupState.name == ROLLUP_NAME).values(watermark=max(upper, watermark))
+    )
+    await db.commit()
+    return upper < target
+
+
+class RollupJob:
+    """
+    Background task that advances the analytics watermark every
+    ROLLUP_INTERVAL_SECONDS, so dashboards only aggregate a short live tail.
+    """
+    def __init__(self, interval: int = settings.ROLLUP_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self):
+        while True:
+            async with async_session_factory() as db:
+                if not await advance(db):
+                    return
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Analytics rollup failed: {e}")
+            await asyncio.sleep(self.interval)
+
+# Global instance
+rollup_job = RollupJob()
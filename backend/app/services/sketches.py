@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.analytics import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+# Every stored sketch uses the same bin layout, so any two can be merged.
+# Changing this requires rebuilding latency_sketches.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE = 1e-6 # Smaller values (and zero) are counted in zero_count
+
+# Recorded metrics and what their dimension holds
+METRICS = {
+    "turn_duration": "model",     # seconds from request to the final message
+    "ttft": "model",              # seconds until the first content token
+    "tokens_per_second": "model", # completion tokens over the time from first token to end of generation
+    "tool_latency": "tool_name",  # seconds per tool call, including retries
+}
+
+
+def bin_index(value: float) -> int:
+    return math.ceil(math.log(value) / math.log(GAMMA))
+
+
+def bin_value(index: int) -> float:
+    # Midpoint of (GAMMA^(i-1), GAMMA^i] in relative terms; within RELATIVE_ACCURACY of anything in the bin
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+class LogHistogram:
+    """
+    Log-bucketed histogram with relative error guarantees (the layout of
+    DDSketch). Merging is adding bin counts, so hourly sketches can be
+    combined into any time range in SQL or in Python.
+    """
+    def __init__(self):
+        self.bins: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        if value is None or math.isnan(value) or value < 0:
+            return
+        if value < MIN_VALUE:
+            self.zero_count += 1
+        else:
+            self.bins[bin_index(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LogHistogram"):
+        for index, n in other.bins.items():
+            self.bins[index] += n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return self.min
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Clamp so p0/p100 report the exact extremes
+                return min(max(bin_value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    @classmethod
+    def from_bins(
+        cls, bins: Iterable[Tuple[int, int]], zero_count: int, count: int,
+        total: float, minimum: Optional[float], maximum: Optional[float]
+    ) -> "LogHistogram":
+        sketch = cls()
+        for index, n in bins:
+            sketch.bins[int(index)] += int(n)
+        sketch.zero_count = zero_count or 0
+        sketch.count = count or 0
+        sketch.sum = total or 0.0
+        sketch.min = minimum
+        sketch.max = maximum
+        return sketch
+
+
+class LatencyRecorder:
+    """
+    Collects latency samples into per-process sketches keyed by
+    (hour, metric, dimension) and merges them into latency_sketches every
+    SKETCH_FLUSH_INTERVAL_SECONDS, so request paths never touch the table.
+    """
+    def __init__(self, interval: int = settings.SKETCH_FLUSH_INTERVAL_SECONDS):
+        self.interval = interval
+        self._pending: Dict[Tuple[datetime, str, str], LogHistogram] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, metric: str, value: Optional[float], dimension: Optional[str] = None, at: Optional[datetime] = None):
+        if value is None:
+            return
+        bucket = (at or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+        key = (bucket, metric, dimension or "")
+        sketch = self._pending.get(key)
+        if sketch is None:
+            sketch = self._pending[key] = LogHistogram()
+        sketch.add(value)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        committed = False
+        try:
+            async with async_session_factory() as db:
+                for (bucket, metric, dimension), sketch in sorted(pending.items(), key=lambda item: item[0]):
+                    await db.execute(merge_statement(bucket, metric, dimension, sketch))
+                await db.commit()
+                committed = True
+        finally:
+            # Keep the samples for the next attempt, also when the flush is cancelled
+            if not committed:
+                for key, sketch in pending.items():
+                    if key in self._pending:
+                        sketch.merge(self._pending[key])
+                    self._pending[key] = sketch
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.exception(f"Final latency sketch flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Latency sketch flush failed: {e}")
+
+
+def merge_statement(bucket: datetime, metric: str, dimension: str, sketch: LogHistogram):
+    """
+    Upsert that adds `sketch` to the stored one. Bins are summed key by key
+    by merge_sketch_bins(), a SQL function created by the migration.
+    """
+    stmt = pg_insert(LatencySketch).values(
+        bucket=bucket,
+        metric=metric,
+        dimension=dimension,
+        count=sketch.count,
+        zero_count=sketch.zero_count,
+        sum=sketch.sum,
+        min=sketch.min,
+        max=sketch.max,
+        bins={str(index): n for index, n in sketch.bins.items()}
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["bucket", "metric", "dimension"],
+        set_={
+            "count": LatencySketch.count + stmt.excluded.count,
+            "zero_count": LatencySketch.zero_count + stmt.excluded.zero_count,
+            "sum": LatencySketch.sum + stmt.excluded.sum,
+            "min": func.least(LatencySketch.min, stmt.excluded.min),
+            "max": func.greatest(LatencySketch.max, stmt.excluded.max),
+            "bins": func.merge_sketch_bins(LatencySketch.bins, stmt.excluded.bins),
+        }
+    )
+
+# Global instance
+latency_recorder = LatencyRecorder()
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+import orjson
+
+from app.core.config import settings
+
+DONE = "[DONE]" # The only event that is not a JSON object
+
+Event = Union[Dict[str, Any], str]
+
+
+def encode(event: Event, event_id: Optional[str] = None) -> bytes:
+    data = f"data: {event}\n\n".encode() if isinstance(event, str) else b"data: " + orjson.dumps(event) + b"\n\n"
+    if event_id is None:
+        return data
+    return f"id: {event_id}\n".encode() + data
+
+
+class SSEWriter:
+    """
+    Merges consecutive content deltas into one `{"content": ...}` event per
+    window_ms or max_chars, whichever comes first, and passes every event on
+    to `emit`. Any other event (session_id, thought, message_id, [DONE], ...)
+    flushes pending content and is emitted at once, so ordering is
+    preserved. window_ms=0 emits every event as it comes.
+
+    Run it in the task that consumes the provider stream: merging is inline
+    and the window is a loop timer, so a stalled provider still gets its
+    pending text out on time.
+    """
+    def __init__(
+        self,
+        emit: Callable[[Event], None],
+        window_ms: int = settings.SSE_COALESCE_MS,
+        max_chars: int = settings.SSE_COALESCE_CHARS
+    ):
+        self.emit = emit
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            content = "".join(self._pending)
+            self._pending = []
+            self._pending_chars = 0
+            self.emit({"content": content})
+
+    def add(self, event: Event):
+        if self.window and isinstance(event, dict) and len(event) == 1 and "content" in event:
+            self._pending.append(event["content"])
+            self._pending_chars += len(event["content"])
+            if self._pending_chars >= self.max_chars:
+                self.flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+            return
+        self.flush()
+        self.emit(event)
+
+    async def run(self, events: AsyncIterator[Event]):
+        """
+        Consumes `events` to the end. Pending content is emitted before
+        returning or raising.
+        """
+        try:
+            async for event in events:
+                self.add(event)
+        finally:
+            self.flush()
@@ -0,0 +1,181 @@
+import math
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from pandas.api import types as ptypes
+
+from app.services.llm.tokens import count_tokens
+
+DISTINCT_CAP = 10000  # Past this, cardinality is reported as a lower bound
+SAMPLE_CAP = 500      # Rows kept in memory as sample candidates
+
+
+def _plain(value: Any) -> Any:
+    """
+    Converts numpy/pandas scalars into JSON-serializable Python values.
+    """
+    if value is None:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
+
+
+class ColumnProfiler:
+    """
+    Accumulates dtype, range, null count and cardinality of one column across chunks.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.dtype: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.min: Any = None
+        self.max: Any = None
+        self.total = 0.0
+        self.numeric = True
+        self.ranged = True
+        self.distinct: set = set()
+        self.distinct_exact = True
+
+    def update(self, series: pd.Series):
+        dtype = str(series.dtype)
+        if self.dtype is None:
+            self.dtype = dtype
+        elif self.dtype != dtype:
+            # Chunks disagreed (e.g. int then float): keep the wider type
+            both_numeric = ptypes.is_numeric_dtype(series) and self.numeric
+            self.dtype = "float64" if both_numeric else "object"
+            if not both_numeric:
+                # A range over only the numeric chunks would be misleading
+                self.ranged = False
+                self.min = self.max = None
+
+        self.numeric = self.numeric and ptypes.is_numeric_dtype(series) and not ptypes.is_bool_dtype(series)
+
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        self.count += len(values)
+        if values.empty:
+            return
+
+        if self.ranged and (ptypes.is_numeric_dtype(values) or ptypes.is_datetime64_any_dtype(values)):
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            if self.numeric:
+                self.total += float(values.sum())
+
+        if self.distinct_exact:
+            self.distinct.update(values.unique().tolist())
+            if len(self.distinct) > DISTINCT_CAP:
+                # Stop tracking to bound memory; report the cap as a lower bound
+                self.distinct = set(list(self.distinct)[:DISTINCT_CAP])
+                self.distinct_exact = False
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": _plain(self.min),
+            "max": _plain(self.max),
+            "mean": round(self.total / self.count, 6) if self.numeric and self.count else None,
+            "distinct": len(self.distinct),
+            "distinct_exact": self.distinct_exact
+        }
+
+
+class TableProfiler:
+    """
+    Builds a column profile and keeps the first rows as preview candidates
+    while a table is read chunk by chunk.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, ColumnProfiler] = {}
+        self.sample: Optional[pd.DataFrame] = None
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        for name in chunk.columns:
+            key = str(name)
+            if key not in self.columns:
+                self.columns[key] = ColumnProfiler(key)
+            self.columns[key].update(chunk[name])
+
+        if self.sample is None:
+            self.sample = chunk.head(SAMPLE_CAP)
+        elif len(self.sample) < SAMPLE_CAP:
+            self.sample = pd.concat([self.sample, chunk.head(SAMPLE_CAP - len(self.sample))], ignore_index=True)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "columns": [c.result() for c in self.columns.values()]
+        }
+
+
+def markdown_rows(chunk: pd.DataFrame, include_header: bool) -> str:
+    """
+    Renders a row chunk as a Markdown table. tabulate is pure Python, so
+    this runs in the executor's worker processes.
+    """
+    rendered = chunk.to_markdown(index=False)
+    if include_header:
+        return rendered
+    # Drop the header and separator lines so chunks concatenate into one table
+    return rendered.split("\n", 2)[2] if rendered.count("\n") >= 2 else ""
+
+
+def _cell(value: Any) -> str:
+    value = _plain(value)
+    if value is None:
+        return ""
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _row(cells: List[Any]) -> str:
+    return "| " + " | ".join(_cell(c) for c in cells) + " |"
+
+
+def render_summary(profile: Dict[str, Any], sample: Optional[pd.DataFrame], token_budget: int) -> Dict[str, Any]:
+    """
+    Renders the column profile followed by as many sample rows as fit in
+    token_budget. Returns the markdown and how many rows made it in.
+    """
+    columns = profile["columns"]
+    lines = [
+        f"Table profile: {profile['rows']} rows x {len(columns)} columns.",
+        "",
+        _row(["column", "dtype", "nulls", "min", "max", "mean", "distinct"]),
+        "|" + "---|" * 7
+    ]
+    for c in columns:
+        distinct = c["distinct"] if c["distinct_exact"] else f">={c['distinct']}"
+        lines.append(_row([c["name"], c["dtype"], c["nulls"], c["min"], c["max"], c["mean"], distinct]))
+
+    used = count_tokens("\n".join(lines))
+    shown = 0
+    if sample is not None and not sample.empty:
+        header = ["", "Sample rows:", "", _row(list(sample.columns)), "|" + "---|" * len(sample.columns)]
+        used += count_tokens("\n".join(header))
+        body = []
+        for values in sample.itertuples(index=False, name=None):
+            line = _row(list(values))
+            cost = count_tokens(line) + 1  # newline
+            if used + cost > token_budget:
+                break
+            body.append(line)
+            used += cost
+        shown = len(body)
+        if shown:
+            header[1] = f"Sample rows ({shown} of {profile['rows']}):"
+            lines.extend(header + body)
+
+    return {"content": "\n".join(lines), "sample_rows": shown, "tokens": used}
@@ -1,15 +1,33 @@
+import asyncio
+import hashlib
 import json
 import os
+import time
 import httpx
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+from app.core.config import settings
+from app.core.executor import task_executor
+from app.services.datasets import dataset_store, with_data_refs, DataRefError
+from app.services.rate_limit import rate_limiter, current_identity
+from app.services.prompt_index import current_solves
 
 TOOLS_DIR = Path(__file__).parent.parent / "tools"
 
+# Only failures that mean the solver never started the work are retried: solves are
+# not idempotent, and a timed-out or 502/504 one may still be running
+RETRY_STATUSES = {503}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+RETRY_BACKOFF_SECONDS = 0.5
+
 class ToolsBridge:
     def __init__(self):
         self.tools_registry = {}  # {tool_name: {schema, url, path, method}}
         self._load_tools()
+        # Part of completion cache keys, so a changed tool set never replays old answers
+        self.catalog_version = hashlib.sha256(
+            json.dumps(self.get_openai_tools(), sort_keys=True).encode()
+        ).hexdigest()[:16]
 
     def _load_tools(self):
         """
@@ -70,7 +88,7 @@ class ToolsBridge:
                             "description": description,
                             "url": base_url + path_key,
                             "method": "POST",
-                            "parameters": req_body,
+                            "parameters": with_data_refs(req_body),
                             "spec": spec  # Keep full spec just in case
                         }
                         return # Only register one main endpoint per tool folder for now
@@ -97,25 +115,79 @@ class ToolsBridge:
         """
         Executes the tool via HTTP request to the GCP endpoint.
         """
+        result, _ = await self.invoke(tool_name, arguments)
+        return result
+
+    async def invoke(self, tool_name: str, arguments: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Like execute_tool, but also returns per-call stats for the
+        tool_invocations table: duration (seconds, including retries),
+        request_bytes, response_bytes, retry_count and cache_hit (the
+        result of the same call made for a near-duplicate earlier prompt).
+        Connection failures and 503s are retried up to MAX_TOOL_RETRIES
+        times (none by default).
+        """
+        stats = {"duration": None, "request_bytes": None, "response_bytes": None, "retry_count": 0, "cache_hit": False}
         tool = self.tools_registry.get(tool_name)
         if not tool:
-            return {"error": f"Tool '{tool_name}' not found."}
+            return {"error": f"Tool '{tool_name}' not found."}, stats
+
+        # A near-duplicate earlier prompt already made this exact call: reuse its result
+        solves = current_solves.get()
+        if solves is not None:
+            cached = solves.lookup(tool_name, arguments)
+            if cached is not None:
+                solves.record(tool_name, arguments, cached)
+                stats.update(cache_hit=True, duration=0.0)
+                return cached, stats
+
+        # Counted against the caller of the chat turn making the call
+        identity = current_identity.get()
+        if identity is not None:
+            budget = await rate_limiter.hit("tools", identity)
+            if not budget.allowed:
+                return {"error": f"Tool call rate limit exceeded, try again in {budget.retry_after:.0f}s"}, stats
 
         url = tool["url"]
         print(f"Executing Tool: {tool_name} at {url}")
 
+        started = time.perf_counter()
+        # Swap uploaded-table references for the real data just before dispatch
+        try:
+            expanded = await task_executor.run("parse", dataset_store.expand_refs, arguments)
+            body = await task_executor.run("json", json.dumps, expanded)
+        except DataRefError as e:
+            return {"error": f"Invalid data reference: {str(e)}"}, stats
+        stats["request_bytes"] = len(body.encode())
+
         try:
             async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=arguments)
+                while True:
+                    try:
+                        response = await client.post(url, content=body, headers={"Content-Type": "application/json"})
+                        if response.status_code not in RETRY_STATUSES or stats["retry_count"] >= settings.MAX_TOOL_RETRIES:
+                            break
+                    except RETRY_ERRORS:
+                        if stats["retry_count"] >= settings.MAX_TOOL_RETRIES:
+                            raise
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** stats["retry_count"])
+                    stats["retry_count"] += 1
+                stats["response_bytes"] = len(response.content)
                 response.raise_for_status()
-                return response.json()
+                # Solver results can be large, decode them off the event loop
+                result = await task_executor.run("json", json.loads, response.content)
+                if solves is not None and not (isinstance(result, dict) and "error" in result):
+                    solves.record(tool_name, arguments, result)
+                return result, stats
         except httpx.HTTPStatusError as e:
             return {
                 "error": f"HTTP Error {e.response.status_code}", 
                 "details": e.response.text
-            }
+            }, stats
         except Exception as e:
-             return {"error": f"Execution failed: {str(e)}"}
+             return {"error": f"Execution failed: {str(e)}"}, stats
+        finally:
+            stats["duration"] = time.perf_counter() - started
 
 # Global instance
 tools_bridge = ToolsBridge()
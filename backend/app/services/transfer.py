@@ -0,0 +1,208 @@
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import JSON, DateTime, Table, Uuid, null, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models.message import Message
+from app.models.session import Session
+from app.models.tool_invocation import ToolInvocation
+from app.services import archive, rollups
+
+# NDJSON layout: a header line, then per page of sessions the session lines
+# followed by their messages and tool invocations. Parents always precede
+# their forks (a fork is created after its parent), so lineage survives an import.
+FORMAT_VERSION = 1
+SESSION_PAGE_SIZE = 500 # Sessions per export page
+ROW_BATCH_SIZE = 1000 # Rows per server-side cursor fetch and per import INSERT
+
+# Trigger-maintained (rebuilt on import), or archive bookkeeping: archived
+# rows are exported inline and imported into the hot tables
+SKIPPED_COLUMNS = {
+    "search_vector", "archived_at", "archive_path", "archived_messages",
+    "archived_preview", "archived_last_at", "rehydrated_at"
+}
+
+TABLES = {
+    "session": Session.__table__,
+    "message": Message.__table__,
+    "tool_invocation": ToolInvocation.__table__,
+}
+
+
+class TransferError(ValueError):
+    pass
+
+
+def _columns(table: Table):
+    return [c for c in table.columns if c.name not in SKIPPED_COLUMNS]
+
+
+# Archive table name -> record type
+ARCHIVE_KINDS = {"messages": "message", "tool_invocations": "tool_invocation"}
+
+
+def _encode(kind: str, row: Dict[str, Any]) -> str:
+    record = {"type": kind, **row}
+    return json.dumps(record, default=str, ensure_ascii=False) + "\n"
+
+
+async def export_ndjson(db: AsyncSession, session_ids: Optional[Sequence[UUID]] = None) -> AsyncIterator[str]:
+    """
+    Streams sessions (all of them, or `session_ids` plus their ancestors),
+    their own messages and tool invocations as NDJSON. Rows come from
+    server-side cursors in ROW_BATCH_SIZE batches and sessions are paged
+    by keyset, so memory stays flat however much is exported. Soft-deleted
+    sessions are included with their deleted_at; archived sessions are
+    exported from their Parquet files without being rehydrated.
+    """
+    yield json.dumps({
+        "type": "header", "version": FORMAT_VERSION, "exported_at": datetime.now(timezone.utc).isoformat()
+    }) + "\n"
+
+    sessions = select(*_columns(Session.__table__)).order_by(Session.created_at, Session.id)
+    if session_ids is not None:
+        # A fork's parent must exist before the fork can be imported: one recursive
+        # CTE walks up from all requested sessions at once
+        wanted = (
+            select(Session.id, Session.parent_id)
+            .where(Session.id.in_(session_ids))
+            .cte("wanted", recursive=True)
+        )
+        parent = aliased(Session)
+        wanted = wanted.union(
+            select(parent.id, parent.parent_id).join(wanted, parent.id == wanted.c.parent_id)
+        )
+        sessions = sessions.where(Session.id.in_(select(wanted.c.id)))
+
+    last = None
+    while True:
+        page = sessions
+        if last is not None:
+            page = page.where(tuple_(Session.created_at, Session.id) > last)
+        rows = (await db.execute(page.limit(SESSION_PAGE_SIZE))).all()
+        if not rows:
+            return
+        last = (rows[-1].created_at, rows[-1].id)
+        page_ids = [row.id for row in rows]
+        yield "".join(_encode("session", row._asdict()) for row in rows)
+
+        for kind, table in (("message", Message.__table__), ("tool_invocation", ToolInvocation.__table__)):
+            query = (
+                select(*_columns(table))
+                .where(table.c.session_id.in_(page_ids))
+                .order_by(table.c.created_at, table.c.id)
+                .execution_options(yield_per=ROW_BATCH_SIZE)
+            )
+            result = await db.stream(query)
+            async for partition in result.partitions():
+                yield "".join(_encode(kind, row._asdict()) for row in partition)
+
+        archived = await db.execute(
+            select(Session.archive_path).where(Session.id.in_(page_ids), Session.archive_path.is_not(None))
+        )
+        for archive_path in archived.scalars().all():
+            async for name, records in archive.read_archive(archive_path):
+                yield "".join(_encode(ARCHIVE_KINDS[name], record) for record in records)
+
+
+async def _iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def _decode(table: Table, record: Dict[str, Any]) -> Dict[str, Any]:
+    row = {}
+    for c in _columns(table):
+        if c.name not in record:
+            continue
+        value = record[c.name]
+        if value is None and isinstance(c.type, JSON):
+            value = null() # SQL NULL, not a JSON 'null'
+        elif value is not None and isinstance(c.type, Uuid):
+            value = UUID(value)
+        elif value is not None and isinstance(c.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[c.name] = value
+    return row
+
+
+async def _flush(db: AsyncSession, kind: str, batch: List[Dict[str, Any]]) -> int:
+    """
+    Inserts one batch, skipping rows whose id already exists, and adds the
+    inserted rows to the analytics rollups (they keep their old timestamps,
+    so they land below the watermark). Does not commit.
+    """
+    table = TABLES[kind]
+    columns, apply = {
+        "session": ((Session.created_at,), rollups.apply_sessions),
+        "message": (rollups.MESSAGE_COLUMNS, rollups.apply_messages),
+        "tool_invocation": (rollups.TOOL_COLUMNS, rollups.apply_tool_invocations),
+    }[kind]
+    result = await db.execute(
+        pg_insert(table).values(batch).on_conflict_do_nothing().returning(table.c.id)
+    )
+    inserted = result.scalars().all()
+    if inserted:
+        await apply(db, select(*columns).where(table.c.id.in_(inserted)), 1)
+    batch.clear()
+    return len(inserted)
+
+
+async def import_ndjson(db: AsyncSession, chunks: AsyncIterable[bytes]) -> Dict[str, int]:
+    """
+    Imports an export_ndjson() stream with multi-row INSERTs of
+    ROW_BATCH_SIZE, keeping ids, lineage and timestamps. Rows that already
+    exist are skipped, so an interrupted import can simply be rerun. Commits
+    after every flush. Raises TransferError on malformed input.
+    """
+    batches: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in TABLES}
+    counts = {"sessions": 0, "messages": 0, "tool_invocations": 0, "skipped": 0}
+    records = 0
+    keys = {"session": "sessions", "message": "messages", "tool_invocation": "tool_invocations"}
+
+    async def flush(upto: str):
+        # Sessions first: messages and invocations reference them
+        for kind in TABLES:
+            inserted = await _flush(db, kind, batches[kind]) if batches[kind] else 0
+            counts[keys[kind]] += inserted
+            if kind == upto:
+                break
+        await db.commit()
+
+    line_number = 0
+    async for line in _iter_lines(chunks):
+        line_number += 1
+        try:
+            record = json.loads(line)
+            kind = record.pop("type")
+        except (ValueError, KeyError, AttributeError):
+            raise TransferError(f"Line {line_number}: not a JSON record with a type")
+        if kind == "header":
+            if record.get("version") != FORMAT_VERSION:
+                raise TransferError(f"Unsupported export version: {record.get('version')}")
+            continue
+        if kind not in TABLES:
+            raise TransferError(f"Line {line_number}: unknown record type '{kind}'")
+        try:
+            batches[kind].append(_decode(TABLES[kind], record))
+        except (ValueError, TypeError) as e:
+            raise TransferError(f"Line {line_number}: {e}")
+        records += 1
+        if len(batches[kind]) >= ROW_BATCH_SIZE:
+            await flush(kind)
+
+    await flush("tool_invocation")
+    counts["skipped"] = records - counts["sessions"] - counts["messages"] - counts["tool_invocations"]
+    return counts
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from prometheus_client import Counter
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services import sse
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "coda:turn:"
+REDIS_RUNNING_TTL = 3600 # Stream TTL while a turn runs (long tool calls publish nothing for a while)
+REDIS_BLOCK_MS = 15000 # XREAD wait before checking that the stream still exists
+REDIS_FOLLOWED_SUFFIX = ":followed" # Heartbeat key of followers on other workers
+DISCONNECT_POLL_SECONDS = 1.0 # How often a waiting follower checks its client is still there
+
+CANCELLED_TURNS = Counter(
+    "coda_turns_cancelled_total",
+    "Chat turns cancelled before they finished",
+    ["reason"]
+)
+
+
+class TurnNotFound(Exception):
+    pass
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """
+    Event ids are "<turn id>:<seq>". Returns (turn id, seq); a bare number
+    is a seq without a turn, anything else counts as nothing received.
+    """
+    if not value:
+        return None, 0
+    turn_id, _, seq = value.strip().rpartition(":")
+    try:
+        return turn_id or None, int(seq)
+    except ValueError:
+        return None, 0
+
+
+class Turn:
+    """
+    The numbered SSE frames of one chat turn, in a bounded ring. The
+    generation task publishes into it; any number of responses follow it.
+    """
+    def __init__(
+        self,
+        turn_id: str,
+        session_id: UUID,
+        buffer_size: int = settings.TURN_BUFFER_EVENTS,
+        disconnect_grace: int = settings.TURN_DISCONNECT_GRACE_SECONDS
+    ):
+        self.id = turn_id
+        self.session_id = session_id
+        self.frames: Deque[Tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self.last_seq = 0
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_reason: Optional[str] = None
+        self.followers = 0
+        self.disconnect_grace = disconnect_grace
+        self.followed_elsewhere: Optional[Callable[[], Awaitable[bool]]] = None
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: sse.Event):
+        self.last_seq += 1
+        self.frames.append((self.last_seq, sse.encode(event, f"{self.id}:{self.last_seq}")))
+        self._notify()
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+        self._notify()
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Cancels the generation task. Returns False if the turn already
+        finished (or is being cancelled).
+        """
+        if self.finished or self.cancel_reason is not None or self.task is None:
+            return False
+        self.cancel_reason = reason
+        CANCELLED_TURNS.labels(reason=reason).inc()
+        self.task.cancel()
+        return True
+
+    def watch_followers(self, grace: Optional[float] = None):
+        """
+        Cancels the turn once nobody has followed it for `grace` seconds
+        (disconnect_grace by default), so an abandoned turn stops spending
+        tokens while a client that drops briefly can still resume.
+        """
+        grace = self.disconnect_grace if grace is None else grace
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+        if self.followers or self.finished:
+            return
+        if grace <= 0:
+            self._orphaned()
+        else:
+            self._orphan_timer = asyncio.get_running_loop().call_later(grace, self._orphaned)
+
+    def _orphaned(self):
+        self._orphan_timer = None
+        if self.followed_elsewhere is None:
+            self.cancel("disconnected")
+        else:
+            asyncio.create_task(self._check_elsewhere())
+
+    async def _check_elsewhere(self):
+        if await self.followed_elsewhere():
+            # Resumed on another worker; look again after another grace period
+            if not self.followers and not self.finished and self._orphan_timer is None:
+                self._orphan_timer = asyncio.get_running_loop().call_later(
+                    max(self.disconnect_grace, 1), self._orphaned
+                )
+        elif not self.followers:
+            self.cancel("disconnected")
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def frames_after(self, seq: int) -> List[Tuple[int, bytes]]:
+        new = []
+        for entry in reversed(self.frames):
+            if entry[0] <= seq:
+                break
+            new.append(entry)
+        new.reverse()
+        return new
+
+    async def follow(
+        self,
+        after: int = 0,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Yields the frames after seq `after`, then new ones as they are
+        published, until the turn finishes. Frames that are ready together
+        come as one chunk. If the ring has already dropped some of the
+        missed frames, a resume_gap event says how many.
+
+        The server may only notice a gone client when a send fails, which
+        never happens during a long tool call; `is_disconnected` is polled
+        while waiting so the follower ends anyway.
+        """
+        self.followers += 1
+        self.watch_followers()
+        try:
+            while True:
+                changed = self._changed
+                new = self.frames_after(after)
+                if new:
+                    chunk = b"".join(frame for _, frame in new)
+                    missed = new[0][0] - after - 1
+                    if missed > 0:
+                        chunk = sse.encode({"resume_gap": missed}) + chunk
+                    after = new[-1][0]
+                    yield chunk
+                if self.finished and after >= self.last_seq:
+                    return
+                if is_disconnected is None:
+                    await changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), DISCONNECT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+        finally:
+            self.followers -= 1
+            self.watch_followers()
+
+
+class TurnRegistry:
+    """
+    Runs chat turns in tasks of their own, so generation carries on when
+    the response that started it goes away, and keeps finished turns for
+    TURN_RETENTION_SECONDS so a client can reconnect with Last-Event-ID.
+    With TURN_REDIS the frames are mirrored to a Redis stream as well, so
+    the reconnect can land on any worker.
+    """
+    def __init__(
+        self,
+        retention: int = settings.TURN_RETENTION_SECONDS,
+        buffer_size: int = settings.TURN_BUFFER_EVENTS,
+        use_redis: bool = settings.TURN_REDIS,
+        disconnect_grace: int = settings.TURN_DISCONNECT_GRACE_SECONDS
+    ):
+        self.retention = retention
+        self.buffer_size = buffer_size
+        self.use_redis = use_redis
+        self.disconnect_grace = disconnect_grace
+        self._turns: Dict[str, Turn] = {}
+        self._mirrors: Dict[str, asyncio.Task] = {}
+
+    def start(self, turn_id: str, session_id: UUID, events: AsyncIterator[sse.Event]) -> Turn:
+        self._expire()
+        turn = Turn(turn_id, session_id, self.buffer_size, self.disconnect_grace)
+        self._turns[turn_id] = turn
+        turn.task = asyncio.create_task(self._run(turn, events))
+        # A task cancelled before its first step never reaches _run's finally
+        turn.task.add_done_callback(lambda _: None if turn.finished else turn.finish())
+        if self.use_redis:
+            turn.followed_elsewhere = lambda: self._followed_remotely(turn_id)
+        # Covers a response that never starts following; gives it time to start
+        turn.watch_followers(max(self.disconnect_grace, DISCONNECT_POLL_SECONDS))
+        if self.use_redis:
+            self._mirrors[turn_id] = asyncio.create_task(self._mirror(turn))
+        return turn
+
+    def get(self, turn_id: str) -> Optional[Turn]:
+        return self._turns.get(turn_id)
+
+    async def attach(
+        self,
+        turn_id: str,
+        after: int = 0,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Frames of a turn after seq `after`, live until it finishes. Raises
+        TurnNotFound if it is unknown here (and in Redis) or has expired.
+        """
+        turn = self._turns.get(turn_id)
+        if turn is not None:
+            return turn.follow(after, is_disconnected)
+        if self.use_redis:
+            try:
+                if await get_redis().exists(REDIS_PREFIX + turn_id):
+                    return self._follow_redis(turn_id, after, is_disconnected)
+            except Exception as e:
+                logger.warning(f"Turn Redis lookup failed: {e}")
+        raise TurnNotFound(turn_id)
+
+    def cancel(self, turn_id: str, reason: str = "stopped") -> bool:
+        """
+        Cancels a turn running on this worker. Raises TurnNotFound if it is
+        not known here.
+        """
+        turn = self._turns.get(turn_id)
+        if turn is None:
+            raise TurnNotFound(turn_id)
+        return turn.cancel(reason)
+
+    async def close(self):
+        for task in [t.task for t in self._turns.values()] + list(self._mirrors.values()):
+            if task is not None and not task.done():
+                task.cancel()
+        for task in [t.task for t in self._turns.values()] + list(self._mirrors.values()):
+            if task is not None:
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._turns.clear()
+        self._mirrors.clear()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.retention
+        for turn_id in [t.id for t in self._turns.values() if t.finished and t.finished_at < cutoff]:
+            del self._turns[turn_id]
+
+    async def _run(self, turn: Turn, events: AsyncIterator[sse.Event]):
+        writer = sse.SSEWriter(turn.publish)
+        try:
+            await writer.run(events)
+        except asyncio.CancelledError:
+            if turn.cancel_reason is None:
+                raise
+            # Cancelled through cancel(): the generator has stored what it had
+            logger.info(f"Turn {turn.id} cancelled ({turn.cancel_reason})")
+        except Exception as e:
+            logger.exception(f"Turn {turn.id} failed: {e}")
+            turn.publish({"error": str(e)})
+        finally:
+            turn.finish()
+
+    async def _mirror(self, turn: Turn):
+        key = REDIS_PREFIX + turn.id
+        mirrored = 0
+        try:
+            redis = get_redis()
+            while True:
+                changed = turn._changed
+                finished = turn.finished
+                new = turn.frames_after(mirrored)
+                if new or finished:
+                    pipe = redis.pipeline(transaction=False)
+                    for seq, frame in new:
+                        pipe.xadd(key, {"frame": frame}, id=f"0-{seq}", maxlen=self.buffer_size, approximate=True)
+                    if finished:
+                        pipe.xadd(key, {"end": 1}, id=f"0-{turn.last_seq + 1}")
+                    pipe.expire(key, self.retention if finished else REDIS_RUNNING_TTL)
+                    await pipe.execute()
+                    if new:
+                        mirrored = new[-1][0]
+                if finished:
+                    return
+                await changed.wait()
+        except Exception as e:
+            # Resuming on this worker still works from the local ring
+            logger.warning(f"Turn {turn.id} Redis mirror failed: {e}")
+        finally:
+            self._mirrors.pop(turn.id, None)
+
+    async def _followed_remotely(self, turn_id: str) -> bool:
+        try:
+            return bool(await get_redis().exists(REDIS_PREFIX + turn_id + REDIS_FOLLOWED_SUFFIX))
+        except Exception as e:
+            logger.warning(f"Turn Redis follower check failed: {e}")
+            return False
+
+    async def _follow_redis(
+        self,
+        turn_id: str,
+        after: int,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[bytes]:
+        redis = get_redis()
+        key = REDIS_PREFIX + turn_id
+        while True:
+            # Tells the worker running the turn that someone still follows it
+            await redis.set(key + REDIS_FOLLOWED_SUFFIX, 1, px=REDIS_BLOCK_MS * 2)
+            response = await redis.xread({key: f"0-{after}"}, count=self.buffer_size, block=REDIS_BLOCK_MS)
+            if not response:
+                if not await redis.exists(key):
+                    return
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                continue
+            chunk = []
+            for entry_id, fields in response[0][1]:
+                if b"end" in fields:
+                    if chunk:
+                        yield b"".join(chunk)
+                    return
+                seq = int(entry_id.split(b"-")[1])
+                if seq > after + 1:
+                    chunk.append(sse.encode({"resume_gap": seq - after - 1}))
+                chunk.append(fields[b"frame"])
+                after = seq
+            yield b"".join(chunk)
+
+# Global instance
+turn_registry = TurnRegistry()
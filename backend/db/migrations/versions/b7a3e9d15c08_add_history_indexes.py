@@ -0,0 +1,35 @@
+"""Add history and listing indexes
+
+Revision ID: b7a3e9d15c08
+Revises: 8d4f0b7c2e61
+Create Date: 2026-10-19 11:26:40.913215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7a3e9d15c08'
+down_revision: Union[str, None] = '8d4f0b7c2e61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY so existing deployments keep serving writes while the indexes build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_session_created', 'messages', ['session_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_messages_tool_calls_created', 'messages', ['created_at'], unique=False, postgresql_where=sa.text('tool_calls IS NOT NULL'), postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_messages_feedback_scored', 'messages', ['created_at'], unique=False, postgresql_where=sa.text("feedback ? 'score'"), postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_sessions_live_updated', 'sessions', [sa.text('updated_at DESC'), sa.text('id DESC')], unique=False, postgresql_where=sa.text('deleted_at IS NULL'), postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_sessions_live_updated', table_name='sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_feedback_scored', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_tool_calls_created', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_session_created', table_name='messages', postgresql_concurrently=True, if_exists=True)
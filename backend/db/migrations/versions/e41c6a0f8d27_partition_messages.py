@@ -0,0 +1,104 @@
+"""Optionally range-partition messages by month
+
+Revision ID: e41c6a0f8d27
+Revises: b7a3e9d15c08
+Create Date: 2026-10-19 11:58:02.377460
+
+Opt-in for large tenants, a no-op otherwise:
+
+    alembic -x partition_messages=true upgrade head
+
+Rewrites messages as a table partitioned by RANGE (created_at) with one
+partition per month (plus a DEFAULT partition) and copies the existing
+rows over. This takes an exclusive lock for the duration of the copy, so
+run it in a maintenance window. New monthly partitions are created ahead
+of time at application startup (see app/services/partitions.py).
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41c6a0f8d27'
+down_revision: Union[str, None] = 'b7a3e9d15c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 12
+
+INDEXES = [
+    "CREATE INDEX ix_messages_session_created ON messages (session_id, created_at, id)",
+    "CREATE INDEX ix_messages_tool_calls_created ON messages (created_at) WHERE tool_calls IS NOT NULL",
+    "CREATE INDEX ix_messages_feedback_scored ON messages (created_at) WHERE feedback ? 'score'",
+]
+
+
+def _enabled() -> bool:
+    return context.get_x_argument(as_dictionary=True).get("partition_messages", "false").lower() in ("1", "true", "yes")
+
+
+def _is_partitioned() -> bool:
+    return op.get_bind().execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'messages'::regclass)"
+    )).scalar()
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rebuild(source: str, partitioned: bool) -> None:
+    """
+    Recreates messages from `source` (the renamed old table) in the requested layout.
+    """
+    op.execute(f"ALTER TABLE messages RENAME TO {source}")
+    op.execute(f"ALTER TABLE {source} RENAME CONSTRAINT messages_pkey TO {source}_pkey")
+    for name in ("ix_messages_session_created", "ix_messages_tool_calls_created", "ix_messages_feedback_scored"):
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+    if partitioned:
+        op.execute(f"CREATE TABLE messages (LIKE {source} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+        # The partition key has to be part of every unique constraint
+        op.execute("ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id, created_at)")
+
+        oldest = op.get_bind().execute(sa.text(f"SELECT min(created_at) FROM {source}")).scalar()
+        today = datetime.now(timezone.utc).date()
+        month = (oldest.date() if oldest else today).replace(day=1)
+        last = _add_months(today.replace(day=1), MONTHS_AHEAD)
+        while month <= last:
+            upper = _add_months(month, 1)
+            op.execute(
+                f"CREATE TABLE messages_p{month:%Y%m} PARTITION OF messages "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            month = upper
+        op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    else:
+        op.execute(f"CREATE TABLE messages (LIKE {source} INCLUDING DEFAULTS)")
+        op.execute("ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id)")
+
+    op.execute(f"INSERT INTO messages SELECT * FROM {source}")
+    op.execute(f"DROP TABLE {source}")
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_session_id_fkey "
+        "FOREIGN KEY (session_id) REFERENCES sessions (id) ON DELETE CASCADE"
+    )
+    for statement in INDEXES:
+        op.execute(statement)
+    op.execute("ANALYZE messages")
+
+
+def upgrade() -> None:
+    if not _enabled() or _is_partitioned():
+        return
+    _rebuild("messages_unpartitioned", partitioned=True)
+
+
+def downgrade() -> None:
+    if not _is_partitioned():
+        return
+    _rebuild("messages_partitioned", partitioned=False)
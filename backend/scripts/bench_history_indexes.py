@@ -0,0 +1,256 @@
+"""
+Seeds a scratch schema in a local Postgres with sessions and messages and
+compares plans and latencies of the hot history/listing/analytics queries
+with primary keys only, with the indexes from migration b7a3e9d15c08, and
+(optionally) with messages range-partitioned by month.
+
+    cd backend
+    DATABASE_URL=postgresql://postgres@localhost/coda \
+        python scripts/bench_history_indexes.py --sessions 20000 --messages 100 --partitioned
+
+Everything lives in the `bench_history` schema, which is dropped at the end
+unless --keep is given. Application tables are never touched.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+SCHEMA = "bench_history"
+
+TABLES = """
+CREATE TABLE sessions (
+    id uuid PRIMARY KEY,
+    title varchar,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    deleted_at timestamptz
+);
+CREATE TABLE messages (
+    id uuid NOT NULL,
+    session_id uuid NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    role varchar NOT NULL,
+    content text,
+    tool_calls jsonb,
+    feedback jsonb,
+    token_count integer,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id)
+);
+"""
+
+# Same definitions as the migration
+INDEXES = [
+    "CREATE INDEX ix_messages_session_created ON messages (session_id, created_at, id)",
+    "CREATE INDEX ix_messages_tool_calls_created ON messages (created_at) WHERE tool_calls IS NOT NULL",
+    "CREATE INDEX ix_messages_feedback_scored ON messages (created_at) WHERE feedback ? 'score'",
+    "CREATE INDEX ix_sessions_live_updated ON sessions (updated_at DESC, id DESC) WHERE deleted_at IS NULL",
+]
+
+QUERIES = {
+    "history load": """
+        SELECT * FROM messages WHERE session_id = :session_id ORDER BY created_at, id
+    """,
+    "latest message page": """
+        SELECT * FROM messages WHERE session_id = :session_id
+        ORDER BY created_at DESC, id DESC LIMIT 101
+    """,
+    "session listing": """
+        SELECT s.id, s.title, s.updated_at,
+               (SELECT count(*) FROM messages m WHERE m.session_id = s.id) AS message_count,
+               last.created_at, left(last.content, 120)
+        FROM sessions s
+        LEFT JOIN LATERAL (
+            SELECT content, created_at FROM messages m WHERE m.session_id = s.id
+            ORDER BY created_at DESC, id DESC LIMIT 1
+        ) last ON true
+        WHERE s.deleted_at IS NULL
+        ORDER BY s.updated_at DESC, s.id DESC LIMIT 50
+    """,
+    "listing next page": """
+        SELECT s.id, s.title, s.updated_at FROM sessions s
+        WHERE s.deleted_at IS NULL AND (s.updated_at, s.id) < (:updated_at, :session_id)
+        ORDER BY s.updated_at DESC, s.id DESC LIMIT 50
+    """,
+    "tool calls last 7d": """
+        SELECT count(*) FROM messages
+        WHERE tool_calls IS NOT NULL AND created_at > now() - interval '7 days'
+    """,
+    "rated messages": """
+        SELECT id, feedback FROM messages WHERE feedback ? 'score'
+        ORDER BY created_at DESC LIMIT 100
+    """,
+}
+
+
+def plan_summary(plan: dict) -> str:
+    """
+    Compact one-line rendering of the plan tree: node types, with the
+    relation or index each scan uses.
+    """
+    node = plan["Node Type"]
+    target = plan.get("Index Name") or plan.get("Relation Name")
+    label = f"{node}({target})" if target else node
+    children = plan.get("Plans", [])
+    if not children:
+        return label
+    return f"{label} > " + ", ".join(plan_summary(c) for c in children[:3])
+
+
+async def seed(conn, sessions: int, messages: int):
+    started = time.perf_counter()
+    await conn.execute(text(f"""
+        INSERT INTO sessions (id, title, created_at, updated_at)
+        SELECT gen_random_uuid(), 'Session ' || g,
+               now() - interval '365 days' + g * interval '1 second' * (31536000 / {sessions}),
+               now() - random() * interval '365 days'
+        FROM generate_series(1, {sessions}) g
+    """))
+    # Messages are spread over the session's lifetime; ~10% carry tool calls, ~2% a rating
+    await conn.execute(text(f"""
+        INSERT INTO messages (id, session_id, role, content, tool_calls, feedback, token_count, created_at)
+        SELECT gen_random_uuid(), s.id,
+               CASE WHEN n % 2 = 0 THEN 'user' ELSE 'assistant' END,
+               repeat('lorem ipsum ', 20),
+               CASE WHEN random() < 0.1 THEN '[{{"function": {{"name": "milp"}}}}]'::jsonb END,
+               CASE WHEN random() < 0.02 THEN '{{"score": 1}}'::jsonb END,
+               (random() * 500)::int,
+               s.created_at + n * interval '1 minute'
+        FROM sessions s, generate_series(1, {messages}) n
+    """))
+    await conn.execute(text("ANALYZE"))
+    print(f"Seeded {sessions} sessions x {messages} messages in {time.perf_counter() - started:.1f}s")
+
+
+async def partition(conn):
+    """
+    Rebuilds messages partitioned by month, the same layout the optional migration creates.
+    """
+    started = time.perf_counter()
+    await conn.execute(text("ALTER TABLE messages RENAME TO messages_flat"))
+    await conn.execute(text("ALTER TABLE messages_flat RENAME CONSTRAINT messages_pkey TO messages_flat_pkey"))
+    for name in ("ix_messages_session_created", "ix_messages_tool_calls_created", "ix_messages_feedback_scored"):
+        await conn.execute(text(f"DROP INDEX {name}"))
+    await conn.execute(text("CREATE TABLE messages (LIKE messages_flat INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"))
+    await conn.execute(text("ALTER TABLE messages ADD PRIMARY KEY (id, created_at)"))
+    months = (await conn.execute(text(
+        "SELECT generate_series(date_trunc('month', min(created_at)), date_trunc('month', max(created_at)), interval '1 month') FROM messages_flat"
+    ))).scalars().all()
+    for month in months:
+        await conn.execute(text(
+            f"CREATE TABLE messages_p{month:%Y%m} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month.isoformat()}'::timestamptz + interval '1 month')"
+        ))
+    await conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+    await conn.execute(text("INSERT INTO messages SELECT * FROM messages_flat"))
+    await conn.execute(text("DROP TABLE messages_flat"))
+    for statement in INDEXES[:3]:
+        await conn.execute(text(statement))
+    await conn.execute(text("ANALYZE messages"))
+    print(f"Partitioned messages into {len(months)} months in {time.perf_counter() - started:.1f}s")
+
+
+async def measure(conn, runs: int, timeout: int) -> dict:
+    # Sample a session with the typical message count and a listing cursor
+    session_id = (await conn.execute(text(
+        "SELECT session_id FROM messages TABLESAMPLE SYSTEM (1) LIMIT 1"
+    ))).scalar() or (await conn.execute(text("SELECT session_id FROM messages LIMIT 1"))).scalar()
+    cursor = (await conn.execute(text(
+        "SELECT updated_at, id FROM sessions WHERE deleted_at IS NULL ORDER BY updated_at DESC, id DESC OFFSET 49 LIMIT 1"
+    ))).one()
+    params = {"session_id": session_id, "updated_at": cursor[0]}
+
+    results = {}
+    for name, sql in QUERIES.items():
+        query_params = {**params, "session_id": cursor[1]} if name == "listing next page" else params
+        timings = []
+        plan = None
+        try:
+            await conn.execute(text(f"SET statement_timeout = '{timeout}s'"))
+            for _ in range(runs):
+                explained = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), query_params)).scalar()
+                explained = explained if isinstance(explained, list) else json.loads(explained)
+                timings.append(explained[0]["Execution Time"])
+                plan = explained[0]["Plan"]
+        except DBAPIError as e:
+            if "statement timeout" not in str(e):
+                raise
+            await conn.rollback()
+            results[name] = {"ms": None, "plan": f"timed out after {timeout}s"}
+            continue
+        results[name] = {"ms": statistics.median(timings), "plan": plan_summary(plan)}
+    await conn.rollback()
+    return results
+
+
+def report(label: str, results: dict, baseline: dict = None):
+    print(f"\n== {label}")
+    for name, result in results.items():
+        if result["ms"] is None:
+            print(f"{name:22} {'timeout':>10}")
+            print(f"{'':22} {result['plan']}")
+            continue
+        speedup = ""
+        if baseline and baseline[name]["ms"] is not None:
+            speedup = f"  ({baseline[name]['ms'] / max(result['ms'], 0.001):.1f}x)"
+        print(f"{name:22} {result['ms']:10.2f} ms{speedup}")
+        print(f"{'':22} {result['plan']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=100, help="Messages per session")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per query (median is reported)")
+    parser.add_argument("--timeout", type=int, default=30, help="Per-query statement timeout in seconds")
+    parser.add_argument("--partitioned", action="store_true", help="Also measure a partitioned messages table")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench_history schema afterwards")
+    args = parser.parse_args()
+
+    url = os.environ["DATABASE_URL"].replace("postgresql://", "postgresql+asyncpg://")
+    engine = create_async_engine(url, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        for statement in TABLES.split(";"):
+            if statement.strip():
+                await conn.execute(text(statement))
+        await conn.commit()
+
+        try:
+            await seed(conn, args.sessions, args.messages)
+            await conn.commit()
+
+            baseline = await measure(conn, args.runs, args.timeout)
+            report("primary keys only", baseline)
+
+            started = time.perf_counter()
+            for statement in INDEXES:
+                await conn.execute(text(statement))
+            await conn.execute(text("ANALYZE"))
+            await conn.commit()
+            print(f"\nBuilt indexes in {time.perf_counter() - started:.1f}s")
+            report("with indexes", await measure(conn, args.runs, args.timeout), baseline)
+
+            if args.partitioned:
+                await partition(conn)
+                await conn.commit()
+                report("partitioned by month", await measure(conn, args.runs, args.timeout), baseline)
+        finally:
+            if not args.keep:
+                await conn.rollback()
+                await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+                await conn.commit()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,257 @@
+"""
+Seeds a scratch schema in a local Postgres with sessions and messages of
+Zipf-distributed words and measures the /search query (ranked, with a
+keyset cursor and highlighted snippets) without and with the GIN indexes
+from migration 9b4e1f7a2c86 (plus ix_messages_created_at, which the
+candidate cap of broad queries relies on).
+
+    cd backend
+    DATABASE_URL=postgresql://postgres@localhost/coda \
+        python scripts/bench_search.py --sessions 50000 --messages 40
+
+Everything lives in the `bench_search` schema, which is dropped at the end
+unless --keep is given. Application tables are never touched.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+SCHEMA = "bench_search"
+VOCABULARY = 20000
+WORDS_PER_MESSAGE = 30
+
+TABLES = """
+CREATE TABLE sessions (
+    id uuid PRIMARY KEY,
+    title varchar,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    deleted_at timestamptz,
+    search_vector tsvector
+);
+CREATE TABLE messages (
+    id uuid PRIMARY KEY,
+    session_id uuid NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    role varchar NOT NULL,
+    content text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    search_vector tsvector
+);
+CREATE TABLE words (rank int PRIMARY KEY, word text NOT NULL)
+"""
+
+# Same trigger as the migration
+TRIGGERS = [
+    """
+CREATE FUNCTION messages_search_vector_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := CASE WHEN NEW.role IN ('user', 'assistant') AND NEW.content IS NOT NULL
+        THEN to_tsvector('english', left(NEW.content, 100000)) END;
+    RETURN NEW;
+END
+$$
+    """,
+    """
+CREATE TRIGGER messages_search_vector BEFORE INSERT OR UPDATE OF content, role ON messages
+FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()
+    """,
+]
+
+INDEXES = [
+    "CREATE INDEX ix_messages_created_at ON messages (created_at)",
+    "CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)",
+    "CREATE INDEX ix_sessions_search_vector ON sessions USING gin (search_vector)",
+]
+
+# Same shape as app/api/v1/search.py
+SEARCH = """
+    WITH hits AS (
+        SELECT * FROM (
+            SELECT 'message' AS kind, m.id, m.session_id, m.created_at,
+                   CAST(ts_rank_cd(m.search_vector, query, 32) AS float8) AS rank
+            FROM messages m JOIN sessions s ON s.id = m.session_id,
+                 websearch_to_tsquery('english', :q) query
+            WHERE m.search_vector @@ query AND s.deleted_at IS NULL
+            ORDER BY m.created_at DESC LIMIT :max_candidates
+        ) candidates
+        UNION ALL
+        SELECT 'session', s.id, s.id, s.created_at,
+               CAST(ts_rank_cd(s.search_vector, query, 32) * 2 AS float8)
+        FROM sessions s, websearch_to_tsquery('english', :q) query
+        WHERE s.search_vector @@ query AND s.deleted_at IS NULL
+    ),
+    page AS (
+        SELECT * FROM hits WHERE (rank, id) < (:rank, CAST(:id AS uuid))
+        ORDER BY rank DESC, id DESC LIMIT 21
+    )
+    SELECT page.*, s.title,
+           ts_headline('english', COALESCE(left(m.content, 20000), s.title), websearch_to_tsquery('english', :q),
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2')
+    FROM page JOIN sessions s ON s.id = page.session_id
+    LEFT JOIN messages m ON page.kind = 'message' AND m.id = page.id
+    ORDER BY page.rank DESC, page.id DESC
+"""
+
+FIRST_PAGE = {"rank": 1e9, "id": "ffffffff-ffff-ffff-ffff-ffffffffffff"}
+
+
+def plan_summary(plan: dict) -> str:
+    node = plan["Node Type"]
+    target = plan.get("Index Name") or plan.get("Relation Name")
+    label = f"{node}({target})" if target else node
+    children = plan.get("Plans", [])
+    if not children:
+        return label
+    return f"{label} > " + ", ".join(plan_summary(c) for c in children[:3])
+
+
+async def seed(conn, sessions: int, messages: int):
+    started = time.perf_counter()
+    # Pseudo-words from md5 digests mapped to letters
+    await conn.execute(text(f"""
+        INSERT INTO words
+        SELECT g, translate(substr(md5(g::text), 1, 4 + g % 6), '0123456789', 'ghijklmnop')
+        FROM generate_series(1, {VOCABULARY}) g
+        ON CONFLICT DO NOTHING
+    """))
+    await conn.execute(text(f"""
+        INSERT INTO sessions (id, title, created_at)
+        SELECT gen_random_uuid(), 'Session ' || w.word, now() - random() * interval '365 days'
+        FROM generate_series(1, {sessions}) g
+        JOIN words w ON w.rank = 1 + g % {VOCABULARY}
+    """))
+    await conn.execute(text("UPDATE sessions SET search_vector = to_tsvector('english', COALESCE(title, ''))"))
+    # Word ranks follow a Zipf-like distribution: floor(V^u) for uniform u
+    await conn.execute(text(f"""
+        WITH vocab AS (SELECT array_agg(word ORDER BY rank) AS words FROM words)
+        INSERT INTO messages (id, session_id, role, content, created_at)
+        SELECT gen_random_uuid(), s.id,
+               CASE WHEN n % 2 = 0 THEN 'user' ELSE 'assistant' END,
+               array_to_string(ARRAY(
+                   SELECT vocab.words[floor(power({VOCABULARY}, random()))::int]
+                   FROM generate_series(1, {WORDS_PER_MESSAGE}) k WHERE k > 0 * n
+               ), ' '),
+               s.created_at + n * interval '1 minute'
+        FROM vocab, sessions s, generate_series(1, {messages}) n
+    """))
+    await conn.execute(text("ANALYZE"))
+    print(f"Seeded {sessions} sessions x {messages} messages in {time.perf_counter() - started:.1f}s")
+
+
+async def pick_queries(conn) -> dict:
+    words = dict((await conn.execute(text(
+        "SELECT rank, word FROM words WHERE rank IN (1, 20, 500, 5000)"
+    ))).fetchall())
+    return {
+        "common word": words[1],
+        "mid-frequency word": words[20],
+        "rare word": words[5000],
+        "two words": f"{words[20]} {words[500]}",
+        "phrase": f'"{words[1]} {words[1]}"',
+    }
+
+
+async def measure(conn, queries: dict, runs: int, timeout: int, max_candidates: int) -> dict:
+    results = {}
+    for name, q in queries.items():
+        for page in ("page 1", "page 2"):
+            label = f"{name} ({page})"
+            params = {"q": q, "max_candidates": max_candidates, **FIRST_PAGE}
+            if page == "page 2":
+                rows = (await conn.execute(text(SEARCH), params)).fetchall()
+                if len(rows) < 21:
+                    continue
+                params.update(rank=rows[19].rank, id=rows[19].id)
+            timings = []
+            plan = None
+            try:
+                await conn.execute(text(f"SET statement_timeout = '{timeout}s'"))
+                for _ in range(runs):
+                    explained = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {SEARCH}"), params)).scalar()
+                    explained = explained if isinstance(explained, list) else json.loads(explained)
+                    timings.append(explained[0]["Execution Time"])
+                    plan = explained[0]["Plan"]
+            except DBAPIError as e:
+                if "statement timeout" not in str(e):
+                    raise
+                await conn.rollback()
+                results[label] = {"ms": None, "plan": f"timed out after {timeout}s", "q": q}
+                continue
+            matches = (await conn.execute(
+                text("SELECT count(*) FROM messages WHERE search_vector @@ websearch_to_tsquery('english', :q)"), {"q": q}
+            )).scalar()
+            results[label] = {"ms": statistics.median(timings), "plan": plan_summary(plan), "q": q, "matches": matches}
+    await conn.rollback()
+    return results
+
+
+def report(label: str, results: dict, baseline: dict = None):
+    print(f"\n== {label}")
+    for name, result in results.items():
+        if result["ms"] is None:
+            print(f"{name:32} {'timeout':>10}  q={result['q']!r}")
+            print(f"{'':32} {result['plan']}")
+            continue
+        speedup = ""
+        if baseline and name in baseline and baseline[name]["ms"] is not None:
+            speedup = f"  ({baseline[name]['ms'] / max(result['ms'], 0.001):.1f}x)"
+        print(f"{name:32} {result['ms']:10.2f} ms{speedup}  q={result['q']!r}, {result['matches']} matching messages")
+        print(f"{'':32} {result['plan']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--messages", type=int, default=40, help="Messages per session")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per query (median is reported)")
+    parser.add_argument("--timeout", type=int, default=60, help="Per-query statement timeout in seconds")
+    parser.add_argument("--max-candidates", type=int, default=10000, help="SEARCH_MAX_CANDIDATES")
+    parser.add_argument("--keep", action="store_true", help="Keep the bench_search schema afterwards")
+    args = parser.parse_args()
+
+    url = os.environ["DATABASE_URL"].replace("postgresql://", "postgresql+asyncpg://")
+    engine = create_async_engine(url, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        for statement in TABLES.split(";"):
+            if statement.strip():
+                await conn.execute(text(statement))
+        for statement in TRIGGERS:
+            await conn.execute(text(statement))
+        await conn.commit()
+
+        try:
+            await seed(conn, args.sessions, args.messages)
+            await conn.commit()
+            queries = await pick_queries(conn)
+
+            baseline = await measure(conn, queries, args.runs, args.timeout, args.max_candidates)
+            report("without GIN indexes", baseline)
+
+            started = time.perf_counter()
+            for statement in INDEXES:
+                await conn.execute(text(statement))
+            await conn.execute(text("ANALYZE"))
+            await conn.commit()
+            size = (await conn.execute(text("SELECT pg_size_pretty(pg_relation_size('ix_messages_search_vector'))"))).scalar()
+            print(f"\nBuilt GIN indexes in {time.perf_counter() - started:.1f}s ({size})")
+            report("with GIN indexes", await measure(conn, queries, args.runs, args.timeout, args.max_candidates), baseline)
+        finally:
+            if not args.keep:
+                await conn.rollback()
+                await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+                await conn.commit()
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
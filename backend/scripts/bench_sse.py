@@ -0,0 +1,143 @@
+"""
+Compares the chat stream's SSE framing before and after coalescing: one
+json.dumps frame per content delta versus app/services/sse.py (orjson,
+deltas merged per SSE_COALESCE_MS / SSE_COALESCE_CHARS window) feeding a
+turn buffer (app/services/turns.py) that the response follows.
+
+    cd backend
+    python scripts/bench_sse.py --streams 200 --tokens 1000 --interval-ms 2
+
+Each simulated stream yields the same events chat.py does (session_id, a
+thought, content deltas at --interval-ms, usage, execution_time,
+message_id, [DONE]); the consumer writes every chunk to a local socket
+the way the ASGI server does, so each chunk costs a send(). Reports
+sends/sec and CPU time per stream.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+# Not needed by the writer, but app.core.config requires them
+for name in ("DATABASE_URL", "REDIS_URL", "JWT_SECRET", "ENCRYPTION_KEY", "MCP_SERVER_URL"):
+    os.environ.setdefault(name, "unused")
+
+from app.services import sse  # noqa: E402
+from app.services.turns import Turn  # noqa: E402
+
+WORDS = ["the", " model", " returns", " a", " table", " of", " results", ",", " then", " é", "\n", " 42"]
+
+
+async def events(tokens: int, interval: float, seed: int):
+    rng = random.Random(seed)
+    yield {"session_id": "5f0c6a4e-2b1d-4c55-9a7e-0d1f6b3e8c21"}
+    yield {"thought": "Calling solver..."}
+    for i in range(tokens):
+        if interval:
+            # Providers deliver in bursts: a few deltas per network read
+            if i % 4 == 0:
+                await asyncio.sleep(interval * 4 * rng.uniform(0.5, 1.5))
+        else:
+            await asyncio.sleep(0)
+        yield {"content": rng.choice(WORDS)}
+    yield {"token_usage": tokens}
+    yield {"execution_time": 1.23, "decision_count": 1}
+    yield {"message_id": "0d7b1f5e-9c2a-4e1b-8f3d-6a5c4b3e2d10"}
+    yield sse.DONE
+
+
+async def per_delta(source):
+    # The framing chat.py used before: a json.dumps frame per event, str encoded by the response
+    async for event in source:
+        if event == sse.DONE:
+            yield "data: [DONE]\n\n"
+        else:
+            yield f"data: {json.dumps(event)}\n\n"
+
+
+async def coalesced(source, window_ms: int, max_chars: int):
+    # Same path as chat.py: generation in its own task, the response follows the turn
+    turn = Turn("bench", None)
+
+    async def run():
+        try:
+            await sse.SSEWriter(turn.publish, window_ms=window_ms, max_chars=max_chars).run(source)
+        finally:
+            turn.finish()
+
+    task = asyncio.create_task(run())
+    async for chunk in turn.follow():
+        yield chunk
+    await task
+
+
+async def drain(sock: socket.socket):
+    loop = asyncio.get_running_loop()
+    while await loop.sock_recv(sock, 1 << 16):
+        pass
+
+
+async def consume(frames, stats: dict):
+    loop = asyncio.get_running_loop()
+    server, client = socket.socketpair()
+    server.setblocking(False)
+    client.setblocking(False)
+    draining = asyncio.create_task(drain(client))
+    async for frame in frames:
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        stats["frames"] += 1
+        stats["bytes"] += len(frame)
+        await loop.sock_sendall(server, frame)
+    server.close()
+    await draining
+    client.close()
+
+
+async def run(label: str, make_frames, args) -> dict:
+    stats = {"frames": 0, "bytes": 0}
+    wall, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(
+        consume(make_frames(events(args.tokens, args.interval_ms / 1000, seed)), stats)
+        for seed in range(args.streams)
+    ))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(
+        f"{label:28} {stats['frames']:8d} sends {stats['bytes'] / 2**20:6.1f} MB "
+        f"{stats['frames'] / wall:9.0f} sends/s {cpu / args.streams * 1000:7.2f} ms CPU/stream "
+        f"{stats['frames'] / args.streams:7.1f} sends/stream  wall {wall:.2f}s"
+    )
+    return {"cpu": cpu, "frames": stats["frames"]}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=200, help="Concurrent streams")
+    parser.add_argument("--tokens", type=int, default=1000, help="Content deltas per stream")
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="Mean gap between deltas (0 = as fast as possible)")
+    parser.add_argument("--window-ms", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=512)
+    args = parser.parse_args()
+
+    print(f"{args.streams} streams x {args.tokens} deltas, {args.interval_ms} ms apart")
+    before = await run("json.dumps per delta", per_delta, args)
+    await run("orjson, no window", lambda source: coalesced(source, 0, args.max_chars), args)
+    after = await run(
+        f"orjson, {args.window_ms} ms/{args.max_chars} chars",
+        lambda source: coalesced(source, args.window_ms, args.max_chars),
+        args
+    )
+    print(
+        f"\ncoalescing: {before['frames'] / after['frames']:.1f}x fewer sends, "
+        f"{before['cpu'] / after['cpu']:.2f}x less CPU per stream"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
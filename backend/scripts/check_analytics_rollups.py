@@ -0,0 +1,96 @@
+"""
+Checks that the rollup-backed analytics endpoints return exactly what the
+original full-table aggregates return on the current database.
+
+    cd backend
+    python scripts/check_analytics_rollups.py [--advance]
+
+--advance runs the rollup job to completion first. Exits non-zero on any
+difference, so it can run after migrations or in a scheduled job.
+
+Archived sessions stay counted in the rollups while their rows are out of
+the tables, so nothing is compared while any session is archived.
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import func, select, text
+
+sys.path.insert(0, ".")
+
+from app.api.v1 import analytics  # noqa: E402
+from app.core.database import async_session_factory, engine  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.session import Session  # noqa: E402
+from app.services.rollups import rollup_job  # noqa: E402
+
+FULL_TOOL_QUERY = text("""
+    SELECT
+        tool_name,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE status <> 'success'),
+        COALESCE(SUM(request_bytes), 0),
+        COALESCE(SUM(response_bytes), 0),
+        COUNT(*) FILTER (WHERE cache_hit),
+        COALESCE(SUM(retry_count), 0)
+    FROM tool_invocations
+    GROUP BY 1
+""")
+
+
+async def full_usage(db) -> dict:
+    avg_exec = await db.scalar(select(func.avg(Message.execution_time)).where(Message.execution_time != None))
+    return {
+        "total_sessions": await db.scalar(select(func.count(Session.id))) or 0,
+        "total_messages": await db.scalar(select(func.count(Message.id))) or 0,
+        "total_tokens": await db.scalar(select(func.sum(Message.token_count))) or 0,
+        "avg_execution_time": round(float(avg_exec or 0.0), 2),
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--advance", action="store_true", help="Run the rollup job before comparing")
+    args = parser.parse_args()
+
+    if args.advance:
+        await rollup_job.run_once()
+
+    failures = 0
+    async with async_session_factory() as db:
+        # One snapshot for both sides of the comparison
+        await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+
+        archived = await db.scalar(select(func.count(Session.id)).where(Session.archived_at.is_not(None)))
+        if archived:
+            print(f"Skipped: {archived} sessions are archived, full aggregates would miss their rows")
+            await engine.dispose()
+            return 0
+
+        expected = await full_usage(db)
+        actual = (await analytics.get_usage_analytics(db)).model_dump()
+        if expected != actual:
+            print(f"usage mismatch:\n  full:   {expected}\n  rollup: {actual}")
+            failures += 1
+
+        expected_tools = {row[0]: tuple(row[1:]) for row in (await db.execute(FULL_TOOL_QUERY)).fetchall()}
+        actual_tools = {
+            u.tool_name: (u.count, u.errors, u.request_bytes, u.response_bytes, u.cache_hits, u.retries)
+            for u in (await analytics.get_tool_analytics(db)).usage
+        }
+        if expected_tools != actual_tools:
+            print(f"tools mismatch:\n  full:   {expected_tools}\n  rollup: {actual_tools}")
+            failures += 1
+
+        watermark = await db.scalar(text("SELECT watermark FROM rollup_state WHERE name = 'analytics'"))
+
+    await engine.dispose()
+    if failures:
+        return 1
+    print(f"Rollups match the full aggregates (watermark {watermark}): {actual}, {len(actual_tools)} tools")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,200 @@
+"""
+The analytics endpoints answer from the hourly rollups plus a live tail
+past the watermark. These tests check them against full-table aggregates
+(the queries the endpoints used before the rollups) through every path
+that changes the rollups: advancing the watermark, materializing a fork
+(apply_* with +1), purging (-1) and importing old rows (+1).
+
+Each test uses its own model and tool names, so per-model and per-tool
+answers can be compared exactly even on a database other tests share.
+Session and message totals are compared as changes from the start.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import func, select, text, update
+
+from app.api.v1 import analytics
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.models.tool_invocation import ToolInvocation
+from app.services import history, rollups, transfer
+from app.services.purger import session_purger
+
+
+async def snapshot(model: str, tool: str) -> Dict[str, Any]:
+    """Rollup-backed answers and full-table aggregates, read from one snapshot."""
+    async with async_session_factory() as db:
+        await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+
+        usage = await analytics.get_usage_analytics(db)
+        models = {u.model: u for u in (await analytics.get_model_analytics(db)).usage}
+        tools = {u.tool_name: u for u in (await analytics.get_tool_analytics(db)).usage}
+        rolled_model: Optional[Tuple] = None
+        if model in models:
+            u = models[model]
+            rolled_model = (u.messages, u.tokens, u.avg_execution_time)
+        rolled_tool: Optional[Tuple] = None
+        if tool in tools:
+            u = tools[tool]
+            rolled_tool = (u.count, u.errors, u.avg_duration, u.request_bytes, u.response_bytes, u.cache_hits, u.retries)
+
+        messages, tokens, avg_exec = (await db.execute(
+            select(func.count(), func.coalesce(func.sum(Message.token_count), 0), func.avg(Message.execution_time))
+            .where(Message.model == model)
+        )).one()
+        calls, errors, avg_duration, request_bytes, response_bytes, cache_hits, retries = (await db.execute(
+            select(
+                func.count(),
+                func.count().filter(ToolInvocation.status != "success"),
+                func.avg(ToolInvocation.duration),
+                func.coalesce(func.sum(ToolInvocation.request_bytes), 0),
+                func.coalesce(func.sum(ToolInvocation.response_bytes), 0),
+                func.count().filter(ToolInvocation.cache_hit),
+                func.coalesce(func.sum(ToolInvocation.retry_count), 0)
+            )
+            .where(ToolInvocation.tool_name == tool)
+        )).one()
+
+        return {
+            "rolled": {
+                "sessions": usage.total_sessions, "messages": usage.total_messages, "tokens": usage.total_tokens,
+                "model": rolled_model, "tool": rolled_tool,
+            },
+            "full": {
+                "sessions": await db.scalar(select(func.count(Session.id))),
+                "messages": await db.scalar(select(func.count(Message.id))),
+                "tokens": await db.scalar(select(func.coalesce(func.sum(Message.token_count), 0))),
+                "model": (messages, tokens, round(float(avg_exec), 2)) if messages else None,
+                "tool": (
+                    calls, errors, round(float(avg_duration), 3) if avg_duration is not None else None,
+                    request_bytes, response_bytes, cache_hits, retries
+                ) if calls else None,
+            },
+        }
+
+
+class RollupCheck:
+    def __init__(self, model: str, tool: str, start: Dict[str, Any]):
+        self.model = model
+        self.tool = tool
+        self.start = start
+
+    async def __call__(self) -> Dict[str, Any]:
+        """Asserts the rollups agree with the full aggregates; returns the full side."""
+        now = await snapshot(self.model, self.tool)
+        for key in ("model", "tool"):
+            assert now["rolled"][key] == now["full"][key], key
+        for key in ("sessions", "messages", "tokens"):
+            rolled = now["rolled"][key] - self.start["rolled"][key]
+            full = now["full"][key] - self.start["full"][key]
+            assert rolled == full, key
+        return now["full"]
+
+
+async def start_check() -> RollupCheck:
+    model, tool = f"rollup-test-{uuid4().hex[:8]}", f"rollup_tool_{uuid4().hex[:8]}"
+    return RollupCheck(model, tool, await snapshot(model, tool))
+
+
+async def advance_to_now():
+    # lag=0 folds everything committed so far
+    while True:
+        async with async_session_factory() as db:
+            if not await rollups.advance(db, lag=0):
+                return
+
+
+async def make_session(model: str, tool: str) -> UUID:
+    async with async_session_factory() as db:
+        session = Session(title="Rollup test")
+        db.add(session)
+        await db.flush()
+        db.add(Message(session_id=session.id, role="user", content="Route my vans"))
+        for i in range(3):
+            db.add(Message(
+                session_id=session.id, role="assistant", content=f"step {i}", model=model,
+                token_count=100 + i, execution_time=1.5 * (i + 1) if i < 2 else None
+            ))
+        for status, cache_hit, retries in (("success", False, 0), ("error", False, 2), ("success", True, 0)):
+            db.add(ToolInvocation(
+                session_id=session.id, tool_name=tool, started_at=datetime.now(timezone.utc) - timedelta(minutes=5),
+                status=status, duration=0.25 if not cache_hit else 0.0, request_bytes=1000, response_bytes=300,
+                cache_hit=cache_hit, retry_count=retries
+            ))
+        await db.commit()
+        return session.id
+
+
+async def purge(*session_ids: UUID):
+    async with async_session_factory() as db:
+        await db.execute(update(Session).where(Session.id.in_(session_ids)).values(deleted_at=func.now()))
+        await db.commit()
+    for session_id in session_ids:
+        assert await session_purger.purge_session(session_id)
+
+
+async def export(*session_ids: UUID) -> List[bytes]:
+    async with async_session_factory() as db:
+        return [chunk.encode() async for chunk in transfer.export_ndjson(db, list(session_ids))]
+
+
+async def chunks(lines: List[bytes]):
+    for line in lines:
+        yield line
+
+
+async def test_live_rows_and_advance():
+    check = await start_check()
+    session_id = await make_session(check.model, check.tool)
+
+    full = await check()
+    assert full["model"][0] == 3 and full["tool"][0] == 3
+
+    await advance_to_now()
+    assert await check() == full
+
+    await purge(session_id)
+    full = await check()
+    assert full["model"] is None and full["tool"] is None
+
+
+async def test_materialize_purge_and_import_below_the_watermark():
+    check = await start_check()
+    session_id = await make_session(check.model, check.tool)
+    await advance_to_now()
+
+    # Materializing a fork copies its inherited messages with their old timestamps (apply +1)
+    async with async_session_factory() as db:
+        fork = await history.fork(db, await db.get(Session, session_id))
+        await db.commit()
+        fork_id = fork.id
+    await advance_to_now()
+    async with async_session_factory() as db:
+        assert await history.materialize(db, fork_id) == 4
+        await db.commit()
+    full = await check()
+    assert full["model"][0] == 6
+
+    exported = await export(session_id, fork_id)
+
+    # Purging takes rolled-up rows out again (apply -1)
+    await purge(fork_id, session_id)
+    full = await check()
+    assert full["model"] is None and full["tool"] is None
+
+    # Importing brings old rows back below the watermark (apply +1)
+    async with async_session_factory() as db:
+        counts = await transfer.import_ndjson(db, chunks(exported))
+    assert counts["messages"] == 8 and counts["tool_invocations"] == 3
+    full = await check()
+    assert full["model"][0] == 6 and full["tool"][0] == 3
+
+    await advance_to_now()
+    assert await check() == full
+
+    await purge(fork_id, session_id)
+    full = await check()
+    assert full["model"] is None and full["tool"] is None
@@ -0,0 +1,116 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from uuid import UUID
+
+from openai.types.chat import ChatCompletionChunk
+from sqlalchemy import select
+
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.services.llm import openai as openai_provider
+from app.services.tools_bridge import tools_bridge
+from app.services.turns import turn_registry
+
+
+def chunk(delta: Dict[str, Any], usage: Dict[str, int] = None) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate({
+        "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        "usage": usage
+    })
+
+
+class FakeStream:
+    deployment = SimpleNamespace(name="fake", kind="openai")
+
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        for c in self._chunks:
+            yield c
+
+    async def close(self):
+        pass
+
+
+class FakeRouter:
+    """Calls a tool on the first completion, answers in text afterwards; keeps every prompt."""
+    def __init__(self):
+        self.prompts: List[List[Dict[str, Any]]] = []
+
+    async def open_stream(self, params: Dict[str, Any], api_key: str = None) -> FakeStream:
+        self.prompts.append([dict(m) for m in params["messages"]])
+        if len(self.prompts) == 1:
+            return FakeStream([chunk({"tool_calls": [{
+                "index": 0, "id": "call_1", "type": "function",
+                "function": {"name": "generic_vrp", "arguments": "{}"}
+            }]})])
+        return FakeStream([
+            chunk({"content": "Done."}),
+            chunk({}, usage={"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12})
+        ])
+
+
+def sse_events(body: str) -> List[Dict[str, Any]]:
+    return [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: {")]
+
+
+def assert_valid_prompt(messages: List[Dict[str, Any]]):
+    """Every tool call answered right after it, no tool reply without its call, no empty assistant message."""
+    unanswered = []
+    for m in messages:
+        if m["role"] == "tool":
+            assert m["tool_call_id"] in unanswered
+            unanswered.remove(m["tool_call_id"])
+            continue
+        assert not unanswered
+        if m["role"] == "assistant":
+            assert m.get("content") or m.get("tool_calls")
+            unanswered = [tc["id"] for tc in m.get("tool_calls") or []]
+    assert not unanswered
+
+
+async def test_cancel_during_tool_call_keeps_session_usable(client, monkeypatch):
+    router = FakeRouter()
+    monkeypatch.setattr(openai_provider, "deployment_router", router)
+    tool_running = asyncio.Event()
+
+    async def invoke(tool_name, arguments):
+        tool_running.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(tools_bridge, "invoke", invoke)
+
+    first = asyncio.create_task(client.post(
+        "/api/v1/chat/stream",
+        json={"messages": [{"role": "user", "content": "Plan routes for my vans"}], "model": "gpt-4o"}
+    ))
+    await asyncio.wait_for(tool_running.wait(), 10)
+    turn_id = next(turn.id for turn in turn_registry._turns.values() if not turn.finished)
+    response = await client.post(f"/api/v1/chat/stream/{turn_id}/cancel")
+    assert response.json()["cancelled"] is True
+
+    events = sse_events((await asyncio.wait_for(first, 10)).text)
+    session_id = events[0]["session_id"]
+    assert events[-1]["status"] == "cancelled"
+
+    async with async_session_factory() as db:
+        result = await db.execute(select(Message).where(Message.session_id == UUID(session_id)))
+        stored = result.scalars().all()
+    replies = [m for m in stored if m.role == "tool"]
+    assert [(m.tool_call_id, m.status) for m in replies] == [("call_1", "cancelled")]
+    # Nothing was generated or spent, so no empty assistant message is kept
+    assert not [m for m in stored if m.role == "assistant" and not m.content and not m.tool_calls]
+
+    response = await asyncio.wait_for(client.post(
+        "/api/v1/chat/stream",
+        json={"session_id": session_id, "messages": [{"role": "user", "content": "Try again"}], "model": "gpt-4o"}
+    ), 10)
+    events = sse_events(response.text)
+    assert "".join(e.get("content", "") for e in events) == "Done."
+    assert any("message_id" in e for e in events)
+    assert_valid_prompt(router.prompts[-1])
+    assert [m["role"] for m in router.prompts[-1][1:]] == ["user", "assistant", "tool", "user"]
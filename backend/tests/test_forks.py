@@ -0,0 +1,78 @@
+import asyncio
+from typing import List
+from uuid import UUID
+
+from sqlalchemy import func, select
+
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.services import history
+
+
+async def make_session(cleanup: List[UUID], messages: int = 3) -> List[UUID]:
+    """A session and its message ids, one transaction per message so each gets its own timestamp."""
+    async with async_session_factory() as db:
+        session = Session(title="Fork test")
+        db.add(session)
+        await db.commit()
+        cleanup.append(session.id)
+        ids = []
+        for i in range(messages):
+            message = Message(session_id=session.id, role="user" if i % 2 == 0 else "assistant", content=f"message {i}")
+            db.add(message)
+            await db.commit()
+            ids.append(message.id)
+    return [session.id, *ids]
+
+
+async def fork(client, cleanup: List[UUID], session_id: UUID) -> UUID:
+    response = await client.post(f"/api/v1/sessions/{session_id}/fork", json={})
+    assert response.status_code == 200
+    fork_id = UUID(response.json()["id"])
+    cleanup.append(fork_id)
+    return fork_id
+
+
+async def feedback_of(session_id: UUID) -> List:
+    async with async_session_factory() as db:
+        return [m.feedback for m in await history.load_history(db, session_id)]
+
+
+async def test_feedback_on_inherited_message_is_copy_on_write(client, cleanup):
+    parent_id, first, *_ = await make_session(cleanup)
+    fork_id = await fork(client, cleanup, parent_id)
+    sibling_id = await fork(client, cleanup, parent_id)
+
+    response = await client.post(
+        f"/api/v1/messages/{first}/feedback", json={"score": 1, "session_id": str(fork_id)}
+    )
+    assert response.status_code == 200
+    copy = response.json()["message_id"]
+    assert copy == str(history.copy_id(fork_id, first))
+
+    assert await feedback_of(fork_id) == [{"score": 1, "comment": None}, None, None]
+    assert await feedback_of(parent_id) == [None, None, None]
+    assert await feedback_of(sibling_id) == [None, None, None]
+
+    # A client still holding the id from before the copy reaches the fork's own row
+    response = await client.post(
+        f"/api/v1/messages/{first}/feedback", json={"score": -1, "session_id": str(fork_id)}
+    )
+    assert response.json()["message_id"] == copy
+    assert await feedback_of(fork_id) == [{"score": -1, "comment": None}, None, None]
+    assert await feedback_of(parent_id) == [None, None, None]
+
+
+async def test_concurrent_materialize_copies_once(client, cleanup):
+    parent_id, *_ = await make_session(cleanup)
+    fork_id = await fork(client, cleanup, parent_id)
+
+    await asyncio.gather(*(history.materialize_in_background(fork_id) for _ in range(4)))
+
+    async with async_session_factory() as db:
+        own = await db.scalar(select(func.count()).select_from(Message).where(Message.session_id == fork_id))
+        session = await db.get(Session, fork_id)
+    assert own == 3
+    assert session.parent_id is None
+    assert len(await feedback_of(fork_id)) == 3
@@ -0,0 +1,26 @@
+from sqlalchemy import func, select
+
+from app.core.database import async_session_factory
+from app.models.message import Message
+from app.models.session import Session
+from app.services.purger import ADVISORY_LOCK_KEY, SessionPurger
+
+
+async def test_only_one_worker_purges_at_a_time():
+    async with async_session_factory() as db:
+        session = Session(title="Purge test", deleted_at=func.now())
+        db.add(session)
+        await db.flush()
+        db.add(Message(session_id=session.id, role="user", content="gone soon"))
+        await db.commit()
+
+    purger = SessionPurger(grace=0)
+    async with async_session_factory() as other_worker:
+        assert await other_worker.scalar(select(func.pg_try_advisory_xact_lock(ADVISORY_LOCK_KEY)))
+        assert await purger.purge_once() == 0
+        async with async_session_factory() as db:
+            assert await db.get(Session, session.id) is not None
+
+    assert await purger.purge_once() >= 1
+    async with async_session_factory() as db:
+        assert await db.get(Session, session.id) is None
@@ -0,0 +1,43 @@
+import ipaddress
+import secrets
+
+from starlette.requests import Request
+
+from app.api.v1 import chat
+from app.services import rate_limit
+from app.services.rate_limit import Bucket, RateLimiter
+
+
+def request_from(peer: str, forwarded_for: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "client": (peer, 4000), "headers": headers})
+
+
+async def test_other_providers_keys_do_not_buy_a_fresh_bucket(client, monkeypatch):
+    limiter = RateLimiter(
+        buckets={"chat": Bucket(per_minute=1, unit="requests"), "tokens": Bucket(per_minute=0, unit="tokens")},
+        enabled=True,
+        use_redis=False
+    )
+    monkeypatch.setattr(chat, "rate_limiter", limiter)
+    # The test client's address spent its only request
+    assert (await limiter.hit("chat", "ip:127.0.0.1")).allowed
+
+    for header in ("X-Google-API-Key", "X-Anthropic-API-Key"):
+        response = await client.post(
+            "/api/v1/chat/stream",
+            json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]},
+            headers={header: secrets.token_hex(16)}
+        )
+        assert response.status_code == 429
+
+
+def test_forwarded_for_is_only_believed_from_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+    assert rate_limit.client_address(request_from("203.0.113.7", "198.51.100.1")) == "203.0.113.7"
+    assert rate_limit.client_address(request_from("10.0.0.2", "198.51.100.1")) == "198.51.100.1"
+    # A client cannot pick its address by sending the header itself
+    assert rate_limit.client_address(request_from("10.0.0.2", "192.0.2.9, 198.51.100.1, 10.0.0.3")) == "198.51.100.1"
+    assert rate_limit.client_address(request_from("10.0.0.2")) == "10.0.0.2"
+    assert rate_limit.client_identity(request_from("10.0.0.2", "198.51.100.1")) == "ip:198.51.100.1"
@@ -0,0 +1,22 @@
+from app.core.config import settings
+from app.services.llm import router
+from app.services.llm.router import Deployment, DeploymentRouter
+
+
+def test_failed_deployment_gets_traffic_again(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(router.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(settings, "ROUTER_EXPLORE_RATE", 0)
+    fast = Deployment("a", "openai", api_key="k", ttft=0.3)
+    slow = Deployment("b", "openai", api_key="k", ttft=5.0)
+    deployments = DeploymentRouter([fast, slow])
+
+    for _ in range(7):
+        fast.observe_failure()
+    assert fast.error_rate > settings.ROUTER_MAX_ERROR_RATE
+    assert [d.name for d in deployments.candidates("gpt-4o")] == ["b", "a"]
+
+    # Nothing is sent to it meanwhile, yet its errors fade
+    clock[0] += 120
+    assert [d.name for d in deployments.candidates("gpt-4o")] == ["a", "b"]
+    assert fast.error_rate < settings.ROUTER_MAX_ERROR_RATE
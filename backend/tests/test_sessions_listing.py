@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from typing import List
+from uuid import UUID
+
+import pytest
+from sqlalchemy import event
+
+from app.core.database import async_session_factory, engine
+from app.models.message import Message
+from app.models.session import Session
+
+
+@contextmanager
+def count_statements():
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+async def make_sessions(cleanup):
+    async def make(count: int, messages: int) -> List[UUID]:
+        async with async_session_factory() as db:
+            sessions = [Session(title=f"Listing test {i}") for i in range(count)]
+            db.add_all(sessions)
+            await db.flush()
+            for session in sessions:
+                db.add_all(
+                    Message(session_id=session.id, role="user" if j % 2 == 0 else "assistant", content=f"message {j}")
+                    for j in range(messages)
+                )
+            await db.commit()
+        ids = [session.id for session in sessions]
+        cleanup.extend(ids)
+        return ids
+
+    return make
+
+
+async def test_listing_statements_do_not_grow_with_sessions(client, make_sessions):
+    await make_sessions(2, 3)
+    with count_statements() as few:
+        response = await client.get("/api/v1/sessions/", params={"limit": 50})
+    assert response.status_code == 200
+
+    await make_sessions(60, 20)
+    with count_statements() as many:
+        response = await client.get("/api/v1/sessions/", params={"limit": 50})
+    assert response.status_code == 200
+    assert len(response.json()) == 50
+    assert response.json()[0]["message_count"] == 20
+
+    # Following the cursor is a page like any other
+    with count_statements() as next_page:
+        response = await client.get(
+            "/api/v1/sessions/", params={"limit": 50, "cursor": response.headers["X-Next-Cursor"]}
+        )
+    assert response.status_code == 200
+
+    assert len(few) == len(many) == len(next_page) == 1
+
+
+@pytest.mark.parametrize("fields", ["full", "compact"])
+async def test_message_pages_statements_do_not_grow_with_messages(client, make_sessions, fields):
+    (small,) = await make_sessions(1, 4)
+    (large,) = await make_sessions(1, 400)
+
+    counts = []
+    for session_id in (small, large):
+        with count_statements() as statements:
+            response = await client.get(f"/api/v1/sessions/{session_id}/messages", params={"limit": 100, "fields": fields})
+        assert response.status_code == 200
+        counts.append(len(statements))
+
+    with count_statements() as statements:
+        response = await client.get(
+            f"/api/v1/sessions/{large}/messages",
+            params={"limit": 100, "fields": fields, "before": response.headers["X-Before-Cursor"]}
+        )
+    assert len(response.json()) == 100
+    counts.append(len(statements))
+
+    # The session lookup and the page itself
+    assert counts == [2, 2, 2]
@@ -277,11 +277,12 @@ function App() {
         try {
             console.log("Submitting feedback for:", msgId);
             console.log("API URL:", import.meta.env.VITE_API_URL);
-            await submitFeedback(msgId, score);
+            const result = await submitFeedback(msgId, score, undefined, currentSessionId ?? undefined);
             setMessages(prev => {
                 const newMessages = [...prev];
                 if (newMessages[index]) {
-                    newMessages[index] = { ...newMessages[index], feedback: { score } };
+                    // The id changes when the message was inherited from a forked session and got copied
+                    newMessages[index] = { ...newMessages[index], id: result.message_id ?? msgId, feedback: { score } };
                 }
                 return newMessages;
             });
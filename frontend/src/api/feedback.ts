@@ -1,12 +1,14 @@
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
-export const submitFeedback = async (messageId: string, score: number, comment?: string) => {
+// sessionId: the session the message is shown in, so feedback on a message a fork
+// inherited is stored on the fork's own copy
+export const submitFeedback = async (messageId: string, score: number, comment?: string, sessionId?: string) => {
     const response = await fetch(`${API_URL}/api/v1/messages/${messageId}/feedback`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ score, comment }),
+        body: JSON.stringify({ score, comment, session_id: sessionId }),
     });
 
     if (!response.ok) {
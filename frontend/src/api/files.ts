@@ -5,6 +5,24 @@ export interface FileUploadResponse {
     content_type: string;
     content: string;
     size: number;
+    cached?: boolean;
+    profile?: {
+        rows: number;
+        columns: {
+            name: string;
+            dtype: string;
+            count: number;
+            nulls: number;
+            min: unknown;
+            max: unknown;
+            mean: number | null;
+            distinct: number;
+            distinct_exact: boolean;
+        }[];
+    };
+    file_id?: string;
+    columns?: string[];
+    rows?: number;
 }
 
 export const uploadFile = async (file: File): Promise<FileUploadResponse> => {